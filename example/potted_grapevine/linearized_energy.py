@@ -0,0 +1,51 @@
+"""This example compares, on the potted grapevine, the leaf temperatures simulated with the linearised (closed-form)
+energy budget to those simulated with the full energy budget.
+"""
+
+from copy import deepcopy
+from os import getcwd
+
+import numpy as np
+from openalea.mtg import traversal
+from hydroshoot import architecture, model
+
+# =============================================================================
+# Construct the plant mock-up
+# =============================================================================
+
+g = architecture.vine_mtg('grapevine_pot.csv')
+
+for v in traversal.iter_mtg2(g, g.root):
+    n = g.node(g.Trunk(v, Scale=1)[0])
+    theta = 180 if int(n.index()) < 200 else -90 if int(n.index()) < 300 else 0
+    architecture.vine_orientation(g, v, theta, local_rotation=True)
+
+for v in traversal.iter_mtg2(g, g.root):
+    architecture.vine_orientation(g, v, 90., local_rotation=False)
+
+for v in traversal.iter_mtg2(g, g.root):
+    architecture.vine_phyto_modular(g, v)
+    architecture.vine_mtg_properties(g, v)
+    architecture.vine_mtg_geometry(g, v)
+    architecture.vine_transform(g, v)
+
+# =============================================================================
+# Run HydroShoot with the full and with the linearised energy budgets
+# =============================================================================
+
+records = {}
+for linearized in (False, True):
+    _, records[linearized] = model.run(deepcopy(g), str(getcwd()) + '/', psi_soil=-0.5, gdd_since_budbreak=1000.,
+                                       write_result=False, return_records=True, recorded_variables=('Tlc',),
+                                       linearized_energy=linearized, verbosity=0)
+
+# =============================================================================
+# Deviation of the linearised leaf temperature
+# =============================================================================
+
+deviation = (records[True]['Tlc'] - records[False]['Tlc']).dropna(axis=1, how='all')
+
+print 'Leaf temperature deviation of the linearised energy budget [degreeC]'
+print deviation.abs().max(axis=1).to_frame('max abs').join(deviation.mean(axis=1).to_frame('mean'))
+print 'overall: max abs = %.2f, mean = %.2f, rmse = %.2f' % (
+    np.nanmax(deviation.abs().values), np.nanmean(deviation.values), np.sqrt(np.nanmean(deviation.values ** 2)))
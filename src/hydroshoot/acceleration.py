@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+"""Acceleration of the fixed-point iterations of HydroShoot.
+
+The coupled leaf temperature and xylem water potential fields are solved by fixed-point iterations x = G(x), where G
+is for instance one evaluation of gas-exchange, hydraulic structure and energy budget. By default, HydroShoot damps
+these iterations with a fixed relaxation factor. This module provides alternative update rules that use the previous
+iterates to extrapolate the next one.
+"""
+
+import numpy as np
+
+methods = ('relaxation', 'anderson', 'aitken')
+
+
+class Anderson(object):
+    """Anderson mixing of a fixed-point iteration.
+
+    Args:
+        depth (int): number of previous iterates used to build the next one
+        mixing (float): [-] relaxation factor applied to the fixed-point residual (between 0 and 1)
+
+    References:
+        Walker H., Ni P., 2011.
+            Anderson acceleration for fixed-point iterations.
+            SIAM Journal on Numerical Analysis 49, 1715 - 1735.
+
+    """
+
+    def __init__(self, depth=5, mixing=0.5):
+        self.depth = depth
+        self.mixing = mixing
+        self.residuals = []
+        self._x = []
+        self._f = []
+
+    def update(self, x, gx):
+        """Computes the next iterate.
+
+        Args:
+            x (numpy.ndarray): current iterate
+            gx (numpy.ndarray): value of the fixed-point function at **x**
+
+        Returns:
+            (numpy.ndarray): next iterate
+
+        """
+        f = gx - x
+        self.residuals.append(float(np.max(np.abs(f))))
+
+        self._x.append(x)
+        self._f.append(f)
+        if len(self._f) > self.depth + 1:
+            self._x.pop(0)
+            self._f.pop(0)
+
+        x_next = x + self.mixing * f
+        if len(self._f) > 1:
+            d_x = np.column_stack([self._x[i + 1] - self._x[i] for i in range(len(self._x) - 1)])
+            d_f = np.column_stack([self._f[i + 1] - self._f[i] for i in range(len(self._f) - 1)])
+            gamma = np.linalg.lstsq(d_f, f, rcond=None)[0]
+            x_next -= (d_x + self.mixing * d_f).dot(gamma)
+
+        return x_next
+
+
+class Aitken(object):
+    """Aitken's delta-squared acceleration of a fixed-point iteration, with a relaxation factor that is updated at each
+    iteration.
+
+    Args:
+        mixing (float): [-] initial relaxation factor (between 0 and 1)
+
+    References:
+        Irons B., Tuck R., 1969.
+            A version of the Aitken accelerator for computer iteration.
+            International Journal for Numerical Methods in Engineering 1, 275 - 277.
+
+    """
+
+    def __init__(self, mixing=0.5):
+        self.mixing = mixing
+        self.residuals = []
+        self._f = None
+
+    def update(self, x, gx):
+        """Computes the next iterate.
+
+        Args:
+            x (numpy.ndarray): current iterate
+            gx (numpy.ndarray): value of the fixed-point function at **x**
+
+        Returns:
+            (numpy.ndarray): next iterate
+
+        """
+        f = gx - x
+        self.residuals.append(float(np.max(np.abs(f))))
+
+        if self._f is not None:
+            d_f = f - self._f
+            d_f_norm = np.dot(d_f, d_f)
+            if d_f_norm > 0.:
+                self.mixing = -self.mixing * np.dot(self._f, d_f) / d_f_norm
+        self._f = f
+
+        return x + self.mixing * f
+
+
+def accelerator(method='relaxation', mixing=0.5, depth=5):
+    """Returns a fresh accelerator of fixed-point iterations.
+
+    Args:
+        method (str): one of 'relaxation' (damped fixed-point iterations, handled by the caller), 'anderson' (see
+            :class:`Anderson`) or 'aitken' (see :class:`Aitken`)
+        mixing (float): [-] (initial) relaxation factor
+        depth (int): number of previous iterates used by Anderson mixing
+
+    Returns:
+        an object having an `update(x, gx)` method returning the next iterate, or None for 'relaxation'
+
+    """
+    if method == 'relaxation':
+        return None
+    elif method == 'anderson':
+        return Anderson(depth, mixing)
+    elif method == 'aitken':
+        return Aitken(mixing)
+    else:
+        raise ValueError("The 'method' argument must be one of the following %s." % str(methods))
+
+
+def accelerate(acc, prev, new, lower=None, upper=None):
+    """Applies an accelerator to two {vid: value} dictionaries.
+
+    Args:
+        acc: an accelerator, see :func:`accelerator`
+        prev (dict): current iterate
+        new (dict): value of the fixed-point function at **prev**
+        lower (float): lower bound of the next iterate (no bound if None)
+        upper (float): upper bound of the next iterate (no bound if None)
+
+    Returns:
+        (dict): next iterate
+
+    """
+    keys = sorted(new)
+    x_next = acc.update(np.array([prev[k] for k in keys]), np.array([new[k] for k in keys]))
+    if lower is not None or upper is not None:
+        x_next = np.clip(x_next, lower, upper)
+    return dict(zip(keys, x_next.tolist()))
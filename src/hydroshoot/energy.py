@@ -10,7 +10,9 @@ given plant shoot.
 
 import time
 from math import pi
-from scipy import optimize, mean
+import numpy as np
+from scipy import optimize, sparse, mean
+from scipy.sparse.linalg import gmres
 from sympy.solvers import nsolve
 from sympy import Symbol
 
@@ -20,6 +22,7 @@ import alinea.astk.icosphere as ico
 import openalea.plantgl.all as pgl
 
 from hydroshoot import utilities as utils
+from hydroshoot.stats import SolverStats
 
 
 a_PAR = 0.87
@@ -61,7 +64,7 @@ def get_leaves_length(g, leaf_lbl_prefix='L', length_lbl='Length', unit_scene_le
 
 
 def form_factors_simplified(g, pattern=None, infinite=False, leaf_lbl_prefix='L', turtle_sectors='46',
-                            icosphere_level=3, unit_scene_length='cm'):
+                            icosphere_level=3, unit_scene_length='cm', stats=None):
     """Computes sky and soil contribution factors (resp. k_sky and k_soil) to the energy budget equation.
     Both factors are calculated and attributed to each element of the scene.
 
@@ -80,6 +83,8 @@ def form_factors_simplified(g, pattern=None, infinite=False, leaf_lbl_prefix='L'
             (see :func:`alinea.astk.icosphere.turtle_dome` for details)
         unit_scene_length (str): the unit of length used for scene coordinate and for pattern
             (should be one of `CaribuScene.units` default)
+        stats (SolverStats): if given, Caribu runs are counted in this :class:`hydroshoot.stats.SolverStats` object,
+            whose verbosity also controls the console output
 
     Returns:
 
@@ -92,6 +97,9 @@ def form_factors_simplified(g, pattern=None, infinite=False, leaf_lbl_prefix='L'
         When **icosphere_level** is defined, **turtle_sectors** is ignored.
 
     """
+    if stats is None:
+        stats = SolverStats()
+
     geom = g.property('geometry')
     label = g.property('label')
     opts = {'SW': {vid: ((0.001, 0) if label[vid].startswith(leaf_lbl_prefix) else (0.001,)) for vid in geom}}
@@ -107,7 +115,7 @@ def form_factors_simplified(g, pattern=None, infinite=False, leaf_lbl_prefix='L'
     k_soil, k_sky, k_leaves = {}, {}, {}
 
     for s in ('pirouette', 'cacahuete'):
-        print '... %s' % s
+        stats.log(1, '... %s' % s)
         if s == 'pirouette':
             scene = pgl_scene(g, flip=True)
         else:
@@ -119,6 +127,7 @@ def form_factors_simplified(g, pattern=None, infinite=False, leaf_lbl_prefix='L'
 
         # Run caribu
         raw, aggregated = caribu_scene.run(direct=True, infinite=infinite, split_face=False, simplify=True)
+        stats.caribu_calls += 1
 
         if s == 'pirouette':
             k_soil_dict = aggregated['Ei']
@@ -211,8 +220,228 @@ def heat_boundary_layer_conductance(leaves_length, wind_speed=0):
 
 
 # TODO: split leaf_temperature() into two functions following whether solo is used or not
+def leaves_form_factors_sparse(g, leaves, k_leaves):
+    """Gathers the leaf-to-leaf form factors into a sparse matrix.
+
+    Args:
+        g: a multiscale tree graph object
+        leaves (list): ids of the leaves, giving the order of the matrix rows and columns
+        k_leaves (dict): [-] form factors of each leaf with the surrounding leaves, given as {vid: {ivid: ff}}
+
+    Returns:
+        (scipy.sparse.csr_matrix): [-] the matrix of the form factors, whose (i, j) term is the form factor of the
+            i-th leaf with the j-th one
+
+    Notes:
+        Elements labelled 'soil' are ignored.
+
+    """
+    index = {vid: ivid for ivid, vid in enumerate(leaves)}
+    rows, cols, values = [], [], []
+    for vid in leaves:
+        for ivid, ff in k_leaves[vid].iteritems():
+            if not g.node(ivid).label.startswith('soil'):
+                rows.append(index[vid])
+                cols.append(index[ivid])
+                values.append(ff)
+    return sparse.csr_matrix((values, (rows, cols)), shape=(len(leaves), len(leaves)))
+
+
+def _leaf_energy_gain(shortwave_inc, ff_sky, ff_soil, ev, longwave_gain_from_leaves, temp_sky, temp_soil):
+    """Computes the part of the leaf energy balance that does not depend on leaf temperature: the absorbed shortwave
+    irradiance and longwave irradiance received from the sky, the soil and the surrounding leaves, minus the latent heat
+    loss.
+
+    Args:
+        shortwave_inc (float or numpy.ndarray): [W m-2] incident shortwave irradiance
+        ff_sky (float or numpy.ndarray): [-] form factor of the leaves with the sky
+        ff_soil (float or numpy.ndarray): [-] form factor of the leaves with the soil
+        ev (float or numpy.ndarray): [mol m-2 s-1] evaporation flux
+        longwave_gain_from_leaves (float or numpy.ndarray): [W m-2] longwave irradiance received from the surrounding
+            leaves
+        temp_sky (float): [K] effective sky temperature
+        temp_soil (float): [K] soil surface temperature
+
+    Returns:
+        (float or numpy.ndarray): [W m-2] energy gain of the leaves
+
+    Notes:
+        All the leaf energy balances of this module are built on this gain, from which the longwave emission of the
+            leaf (2 e_leaf sigma T**4) and its sensible heat loss are subtracted.
+
+    """
+    return (a_glob * shortwave_inc +
+            e_leaf * (ff_sky * e_sky * sigma * temp_sky ** 4 +
+                      e_leaf * longwave_gain_from_leaves +
+                      ff_soil * e_soil * sigma * temp_soil ** 4) -
+            lambda_ * ev)
+
+
+def coupled_leaf_temperature_newton(temp_leaf, shortwave_inc, ff_sky, ff_soil, gbh, ev, k_leaves, temp_sky, temp_air,
+                                    f_tol=6.e-6, max_iter=50, t_tol=0., stats=None):
+    """Solves simultaneously the energy balance of all leaves, coupled by the longwave radiation they exchange, by
+    Newton iterations with a sparse Jacobian (the linear systems being solved by :func:`scipy.sparse.linalg.gmres`).
+    Each Newton step is halved as long as it does not decrease the norm of the energy balance. If none of 10 successive
+    halvings decreases it, the iterations stop at the current temperature, which is returned as not converged.
+
+    Args:
+        temp_leaf (numpy.ndarray): [K] leaf temperature used for initialisation
+        shortwave_inc (numpy.ndarray): [W m-2] incident shortwave irradiance
+        ff_sky (numpy.ndarray): [-] form factor of the leaves with the sky
+        ff_soil (numpy.ndarray): [-] form factor of the leaves with the soil
+        gbh (numpy.ndarray): [W m-2 K-1] boundary layer conductance for heat
+        ev (numpy.ndarray): [mol m-2 s-1] evaporation flux
+        k_leaves (scipy.sparse.csr_matrix): [-] leaf-to-leaf form factors (cf. :func:`leaves_form_factors_sparse`)
+        temp_sky (float): [K] effective sky temperature
+        temp_air (float): [K] air temperature
+        f_tol (float): [W m-2] maximum allowed absolute value of the energy balance
+        max_iter (int): maximum allowed iteration
+        t_tol (float): [K] the iterations also stop once the Newton step of all leaves is below this value
+        stats (SolverStats): if given, failures of the solution are reported through the console output of this
+            :class:`hydroshoot.stats.SolverStats` object
+
+    Returns:
+        (numpy.ndarray): [K] leaf temperature
+        (int): [-] the number of Newton iterations
+        (bool): True if the iterations converged (according to :arg:`f_tol` or :arg:`t_tol`)
+
+    Notes:
+        The equations are those solved with `sympy.solvers.nsolve` by :func:`leaf_temperature` when :arg:`solo` is
+            False, where the soil is taken at the effective sky temperature and the sensible heat loss is
+            gbh Cp (T - Tair).
+
+    """
+    if stats is None:
+        stats = SolverStats()
+
+    # as in the equations solved by `sympy.solvers.nsolve`, the soil is taken at the effective sky temperature
+    energy_gain = _leaf_energy_gain(shortwave_inc, ff_sky, ff_soil, ev, 0., temp_sky, temp_sky) + gbh * Cp * temp_air
+
+    def _energy_balance(temp):
+        temp_4 = temp ** 4
+        return energy_gain - e_leaf * sigma * (e_leaf * k_leaves.dot(temp_4) + 2 * temp_4) - gbh * Cp * temp
+
+    energy_balance = _energy_balance(temp_leaf)
+    converged = np.max(np.abs(energy_balance)) < f_tol
+    it = 0
+    while not converged and it < max_iter:
+        it += 1
+        jacobian_diagonal = -8 * e_leaf * sigma * temp_leaf ** 3 - gbh * Cp
+        jacobian = (-4 * e_leaf ** 2 * sigma * k_leaves.dot(sparse.diags(temp_leaf ** 3)) +
+                    sparse.diags(jacobian_diagonal))
+        # the Jacobian is diagonally dominant: Krylov iterations with a diagonal preconditioner converge quickly
+        step, info = gmres(jacobian, energy_balance, M=sparse.diags(1. / jacobian_diagonal), tol=1.e-10,
+                           atol=0.1 * f_tol)
+        if info != 0:
+            stats.log(1, "The linear solution of the Newton step of the energy balance failed (gmres info = %d)."
+                      % info)
+
+        # Backtracking: the step is halved as long as it does not decrease the norm of the energy balance
+        balance_norm = np.linalg.norm(energy_balance)
+        descent = False
+        for _ in range(10):
+            temp_trial = temp_leaf - step
+            balance_trial = _energy_balance(temp_trial)
+            if np.linalg.norm(balance_trial) < balance_norm:
+                descent = True
+                break
+            step = 0.5 * step
+
+        if not descent:
+            # no halved step decreases the energy balance: the current temperature is kept
+            stats.log(1, "No Newton step decreases the energy balance.")
+            break
+
+        temp_leaf, energy_balance = temp_trial, balance_trial
+        converged = np.max(np.abs(energy_balance)) < f_tol or np.max(np.abs(step)) < t_tol
+
+    if not converged:
+        stats.log(1, "The sparse Newton solution of the energy balance did not converge (max residual = %.3g W m-2)."
+                  % np.max(np.abs(energy_balance)))
+
+    return temp_leaf, it, converged
+
+
+def solo_leaf_temperature_newton(temp_leaf, shortwave_inc, ff_sky, ff_soil, gbh, ev, longwave_gain_from_leaves,
+                                 temp_sky, temp_air, temp_soil, f_tol=6.e-6, max_iter=50):
+    """Solves the energy balance of several leaves at once by Newton-Raphson iterations, the longwave radiation
+    received from the surrounding leaves being fixed.
+
+    Args:
+        temp_leaf (numpy.ndarray): [K] leaf temperature used for initialisation
+        shortwave_inc (numpy.ndarray): [W m-2] incident shortwave irradiance
+        ff_sky (numpy.ndarray): [-] form factor of the leaves with the sky
+        ff_soil (numpy.ndarray): [-] form factor of the leaves with the soil
+        gbh (numpy.ndarray): [W m-2 K-1] boundary layer conductance for heat
+        ev (numpy.ndarray): [mol m-2 s-1] evaporation flux
+        longwave_gain_from_leaves (numpy.ndarray): [W m-2] longwave irradiance received from the surrounding leaves
+        temp_sky (float): [K] effective sky temperature
+        temp_air (float): [K] air temperature
+        temp_soil (float): [K] soil surface temperature
+        f_tol (float): [W m-2] maximum allowed absolute value of the energy balance
+        max_iter (int): maximum allowed iteration
+
+    Returns:
+        (numpy.ndarray): [K] leaf temperature
+        (int): [-] the number of Newton-Raphson iterations
+
+    Notes:
+        This is the energy balance solved leaf by leaf by :func:`leaf_temperature` when :arg:`solo` is True. Its
+            derivative with respect to leaf temperature is analytic (-8 e_leaf sigma T**3 - gbh), so that all leaves
+            are solved simultaneously.
+
+    """
+    energy_gain = _leaf_energy_gain(shortwave_inc, ff_sky, ff_soil, ev, longwave_gain_from_leaves, temp_sky,
+                                    temp_soil) + gbh * temp_air
+
+    it = 0
+    for it in range(1, max_iter + 1):
+        energy_balance = energy_gain - 2 * e_leaf * sigma * temp_leaf ** 4 - gbh * temp_leaf
+        if np.max(np.abs(energy_balance)) < f_tol:
+            break
+        temp_leaf = temp_leaf + energy_balance / (8 * e_leaf * sigma * temp_leaf ** 3 + gbh)
+
+    return temp_leaf, it
+
+
+def linearized_leaf_temperature(shortwave_inc, ff_sky, ff_soil, ff_self, gbh, ev, longwave_gain_from_leaves, temp_sky,
+                                temp_air, temp_soil):
+    """Computes leaf temperature in closed form, the longwave emission of the leaves being linearised around air
+    temperature.
+
+    Args:
+        shortwave_inc (numpy.ndarray): [W m-2] incident shortwave irradiance
+        ff_sky (numpy.ndarray): [-] form factor of the leaves with the sky
+        ff_soil (numpy.ndarray): [-] form factor of the leaves with the soil
+        ff_self (numpy.ndarray): [-] form factor weighting the longwave irradiance that the leaves receive from the
+            surrounding leaves, taken at their own temperature (`k_leaves` for simplified form factors, 0 otherwise)
+        gbh (numpy.ndarray): [W m-2 K-1] boundary layer conductance for heat
+        ev (numpy.ndarray): [mol m-2 s-1] evaporation flux
+        longwave_gain_from_leaves (numpy.ndarray): [W m-2] longwave irradiance received from the surrounding leaves,
+            apart from that given by :arg:`ff_self`
+        temp_sky (float): [K] effective sky temperature
+        temp_air (float): [K] air temperature
+        temp_soil (float): [K] soil surface temperature
+
+    Returns:
+        (numpy.ndarray): [K] leaf temperature
+
+    Notes:
+        The energy balance is that of :func:`solo_leaf_temperature_newton`, where T**4 is replaced by its first order
+            expansion Ta**4 + 4 Ta**3 (T - Ta), Ta being air temperature, as in the Penman-Monteith derivation.
+
+    """
+    energy_gain = _leaf_energy_gain(shortwave_inc, ff_sky, ff_soil, ev, longwave_gain_from_leaves, temp_sky,
+                                    temp_soil)
+    emission_coefficient = (2 - e_leaf * ff_self) * e_leaf * sigma
+
+    return temp_air + (energy_gain - emission_coefficient * temp_air ** 4) / (
+            gbh + 4 * emission_coefficient * temp_air ** 3)
+
+
 def leaf_temperature(g, meteo, t_soil, t_sky_eff, t_init=None, form_factors=None, gbh=None, ev=None, ei=None, solo=True,
-                     ff_type=True, leaf_lbl_prefix='L', max_iter=100, t_error_crit=0.01, t_step=0.5):
+                     ff_type=True, leaf_lbl_prefix='L', max_iter=100, t_error_crit=0.01, t_step=0.5, active_set=False,
+                     stats=None, vectorized=False, linearized=False):
     """Computes the temperature of each individual leaf and soil elements.
 
     Args:
@@ -232,19 +461,38 @@ def leaf_temperature(g, meteo, t_soil, t_sky_eff, t_init=None, form_factors=None
         solo (bool):
             if True (default), calculates energy budget for each element assuming the temperatures of surrounding
                 leaves as constant (from previous calculation step)
-            if False, computes simultaneously all temperatures using `sympy.solvers.nsolve` (**very costly!!!**)
+            if False, computes simultaneously all temperatures using `sympy.solvers.nsolve` (**very costly!!!**), or
+                :func:`coupled_leaf_temperature_newton` if :arg:`vectorized` is True
         ff_type (bool): form factor type flag. If true fform factor for a given leaf is expected to be a single value, or a dict of ff otherwxie
         leaf_lbl_prefix (str): the prefix of the leaf label
-        max_iter (int): maximum allowed iteration (used only when :arg:`solo` is True)
-        t_error_crit (float): [°C] maximum allowed error in leaf temperature (used only when :arg:`solo` is True)
+        max_iter (int): maximum allowed iteration (used only when :arg:`solo` or :arg:`vectorized` is True)
+        t_error_crit (float): [°C] maximum allowed error in leaf temperature (used only when :arg:`solo` or
+            :arg:`vectorized` is True)
         t_step (float): [°C] maximum temperature step between two consecutive iterations
+        active_set (bool): if True, leaves whose temperature changes by less than :arg:`t_error_crit` between two
+            iterations are no longer computed, until a final iteration over all leaves verifies the convergence
+            (used only when :arg:`solo` is True)
+        stats (SolverStats): if given, calls to :func:`scipy.optimize.newton_krylov` are counted in this
+            :class:`hydroshoot.stats.SolverStats` object, whose verbosity also controls the console output
+        vectorized (bool): if True, the energy balance of all leaves is solved at once on arrays, at each iteration by
+            :func:`solo_leaf_temperature_newton` instead of calling :func:`scipy.optimize.newton_krylov` leaf by leaf
+            when :arg:`solo` is True, or by :func:`coupled_leaf_temperature_newton` (sparse Newton) instead of
+            `sympy.solvers.nsolve` when :arg:`solo` is False
+        linearized (bool): if True, leaf temperature is computed without iteration by
+            :func:`linearized_leaf_temperature`, the temperature of the surrounding leaves being taken equal to air
+            temperature (:arg:`solo`, :arg:`vectorized` and :arg:`active_set` are then ignored), see
+            :func:`linearization_deviation` for the resulting error
 
     Returns:
         (dict): [°C] the tempearture of individual leaves given as the dictionary keys
-        (int): [-] the number of iterations (not None only when :arg:`solo` is True)
+        (int): [-] the number of iterations (number of Newton iterations when :arg:`solo` is False and
+            :arg:`vectorized` is True, 1 when :arg:`solo` is False or :arg:`linearized` is True)
 
     """
 
+    if stats is None:
+        stats = SolverStats()
+
     leaves = get_leaves(g, leaf_lbl_prefix)
     it = 0
 
@@ -276,45 +524,87 @@ def leaf_temperature(g, meteo, t_soil, t_sky_eff, t_init=None, form_factors=None
     # initialisation
     t_prev = properties['t_init']
 
+    # closed-form calculation of leaves temperature ('linearized' case)
+    if linearized:
+        it = 1
+        shortwave_inc, ff_sky, ff_soil, gb_h, evap = [np.array([properties[what][vid] for vid in leaves])
+                                                      for what in ('ei', 'k_sky', 'k_soil', 'gbh', 'ev')]
+        if not ff_type:
+            ff_self = np.zeros(len(leaves))
+            longwave_gain_from_leaves = -sigma * temp_air ** 4 * np.asarray(
+                leaves_form_factors_sparse(g, leaves, properties['k_leaves']).sum(axis=1)).ravel()
+        else:
+            ff_self = np.array([properties['k_leaves'][vid] for vid in leaves])
+            longwave_gain_from_leaves = np.zeros(len(leaves))
+
+        temp_leaves = linearized_leaf_temperature(shortwave_inc / (0.48 * 4.6), ff_sky, ff_soil, ff_self, gb_h, evap,
+                                                  longwave_gain_from_leaves, temp_sky, temp_air, temp_soil)
+        t_new = dict(zip(leaves, utils.kelvin_to_celsius(temp_leaves).tolist()))
+
     # iterative calculation of leaves temperature
-    if solo:
+    elif solo:
         t_error_trace = []
         it_step = t_step
-        for it in range(max_iter):
-            t_dict = {}
-
-            for vid in leaves:
-                shortwave_inc = properties['ei'][vid] / (0.48 * 4.6)  # Ei not Eabs
+        active = leaves
+        verify = False
+
+        if vectorized:
+            index = {vid: ivid for ivid, vid in enumerate(leaves)}
+            shortwave_inc_array = np.array([properties['ei'][vid] for vid in leaves]) / (0.48 * 4.6)  # Ei not Eabs
+            k_sky_array, k_soil_array, gbh_array, ev_array = [np.array([properties[what][vid] for vid in leaves])
+                                                              for what in ('k_sky', 'k_soil', 'gbh', 'ev')]
+            if not ff_type:
+                k_leaves_array = leaves_form_factors_sparse(g, leaves, properties['k_leaves'])
+            else:
+                k_leaves_array = np.array([properties['k_leaves'][vid] for vid in leaves])
 
-                ff_sky = properties['k_sky'][vid]
-                ff_leaves = properties['k_leaves'][vid]
-                ff_soil = properties['k_soil'][vid]
+        for it in range(max_iter):
+            t_dict = dict(t_prev) if active_set else {}
 
-                gb_h = properties['gbh'][vid]
-                evap = properties['ev'][vid]
-                t_leaf = t_prev[vid]
+            sweep = leaves if verify else active
 
+            if vectorized:
+                temp_prev = utils.celsius_to_kelvin(np.array([t_prev[vid] for vid in leaves]))
                 if not ff_type:
-                    longwave_grain_from_leaves = -sigma * sum(
-                        [ff_leaves[ivid] * (utils.celsius_to_kelvin(t_prev[ivid])) ** 4 for ivid in ff_leaves])
+                    longwave_gain_from_leaves = -sigma * k_leaves_array.dot(temp_prev ** 4)
                 else:
-                    longwave_grain_from_leaves = ff_leaves * sigma * (utils.celsius_to_kelvin(t_leaf)) ** 4
+                    longwave_gain_from_leaves = k_leaves_array * sigma * temp_prev ** 4
+
+                isweep = np.array([index[vid] for vid in sweep], dtype=int)
+                temp_sweep, _ = solo_leaf_temperature_newton(
+                    temp_prev[isweep], shortwave_inc_array[isweep], k_sky_array[isweep], k_soil_array[isweep],
+                    gbh_array[isweep], ev_array[isweep], longwave_gain_from_leaves[isweep], temp_sky, temp_air,
+                    temp_soil)
+                t_dict.update(zip(sweep, utils.kelvin_to_celsius(temp_sweep).tolist()))
+            else:
+                for vid in sweep:
+                    shortwave_inc = properties['ei'][vid] / (0.48 * 4.6)  # Ei not Eabs
+
+                    ff_sky = properties['k_sky'][vid]
+                    ff_leaves = properties['k_leaves'][vid]
+                    ff_soil = properties['k_soil'][vid]
+
+                    gb_h = properties['gbh'][vid]
+                    evap = properties['ev'][vid]
+                    t_leaf = t_prev[vid]
+
+                    if not ff_type:
+                        longwave_grain_from_leaves = -sigma * sum(
+                            [ff_leaves[ivid] * (utils.celsius_to_kelvin(t_prev[ivid])) ** 4 for ivid in ff_leaves])
+                    else:
+                        longwave_grain_from_leaves = ff_leaves * sigma * (utils.celsius_to_kelvin(t_leaf)) ** 4
+
+                    energy_gain = _leaf_energy_gain(shortwave_inc, ff_sky, ff_soil, evap, longwave_grain_from_leaves,
+                                                    temp_sky, temp_soil)
 
-                def _VineEnergyX(t_leaf):
-                    shortwave_abs = a_glob * shortwave_inc
-                    longwave_net = e_leaf * (ff_sky * e_sky * sigma * temp_sky ** 4 +
-                                             e_leaf * longwave_grain_from_leaves +
-                                             ff_soil * e_soil * sigma * temp_soil ** 4) \
-                                   - 2 * e_leaf * sigma * t_leaf ** 4
-                    latent_heat_loss = -lambda_ * evap
-                    sensible_heat_net = -gb_h * (t_leaf - temp_air)
-                    energy_balance = shortwave_abs + longwave_net + latent_heat_loss + sensible_heat_net
-                    return energy_balance
+                    def _VineEnergyX(t_leaf):
+                        return energy_gain - 2 * e_leaf * sigma * t_leaf ** 4 - gb_h * (t_leaf - temp_air)
 
-                t_leaf0 = utils.kelvin_to_celsius(
-                    optimize.newton_krylov(_VineEnergyX, utils.celsius_to_kelvin(t_leaf)))
+                    t_leaf0 = utils.kelvin_to_celsius(
+                        optimize.newton_krylov(_VineEnergyX, utils.celsius_to_kelvin(t_leaf)))
+                    stats.newton_krylov_calls += 1
 
-                t_dict[vid] = t_leaf0
+                    t_dict[vid] = t_leaf0
 
             t_new = t_dict
 
@@ -324,6 +614,18 @@ def leaf_temperature(g, meteo, t_soil, t_sky_eff, t_init=None, form_factors=None
             t_error = max(error_dict.values())
             t_error_trace.append(t_error)
 
+            if active_set:
+                if verify and t_error >= t_error_crit:
+                    verify = False
+                    active = [vtx for vtx in leaves if error_dict[vtx] >= t_error_crit]
+                elif not verify:
+                    active = [vtx for vtx in active if error_dict[vtx] >= t_error_crit]
+                    if len(active) == 0:
+                        # final iteration over all leaves to verify the convergence of the frozen ones
+                        verify = True
+                        t_prev = t_new
+                        continue
+
             if t_error < t_error_crit:
                 break
             else:
@@ -340,6 +642,20 @@ def leaf_temperature(g, meteo, t_soil, t_sky_eff, t_init=None, form_factors=None
 
                 t_prev = t_next
 
+    # sparse Newton calculation of leaves temperature ('not solo' case)
+    elif vectorized:
+        tt = time.time()
+        k_leaves_matrix = leaves_form_factors_sparse(g, leaves, properties['k_leaves'])
+        shortwave_inc, ff_sky, ff_soil, gb_h, evap = [np.array([properties[what][vid] for vid in leaves])
+                                                      for what in ('ei', 'k_sky', 'k_soil', 'gbh', 'ev')]
+        temp_leaves, it, _ = coupled_leaf_temperature_newton(
+            utils.celsius_to_kelvin(np.array([t_prev[vid] for vid in leaves])), shortwave_inc / (0.48 * 4.6),
+            ff_sky, ff_soil, gb_h, evap, k_leaves_matrix, temp_sky, temp_air, max_iter=max_iter, t_tol=t_error_crit,
+            stats=stats)
+        stats.log(2, "---%s seconds (%d Newton iterations) ---" % (time.time() - tt, it))
+
+        t_new = dict(zip(leaves, utils.kelvin_to_celsius(temp_leaves).tolist()))
+
     # matrix iterative calculation of leaves temperature ('not solo' case)
     else:
         it = 1
@@ -366,17 +682,15 @@ def leaf_temperature(g, meteo, t_soil, t_sky_eff, t_init=None, form_factors=None
                 if not g.node(ivid).label.startswith('soil'):
                     eq_aux += -ff_leaves[ivid] * ((t_dict[ivid]) ** 4)
 
-            eq = (a_glob * shortwave_inc +
-                  e_leaf * sigma * (ff_sky * e_sky * (temp_sky ** 4) +
-                                    e_leaf * eq_aux + ff_soil * e_soil * (temp_sky ** 4) -
-                                    2 * (t_dict[vid]) ** 4) -
-                  lambda_ * evap - gb_h * Cp * (t_dict[vid] - temp_air))
+            # the soil is taken at the effective sky temperature (cf. :func:`coupled_leaf_temperature_newton`)
+            eq = (_leaf_energy_gain(shortwave_inc, ff_sky, ff_soil, evap, sigma * eq_aux, temp_sky, temp_sky) -
+                  2 * e_leaf * sigma * (t_dict[vid]) ** 4 - gb_h * Cp * (t_dict[vid] - temp_air))
 
             eq_lst.append(eq)
 
         tt = time.time()
         t_leaf0_lst = nsolve(eq_lst, t_lst, t_leaf_lst, verify=False) - 273.15
-        print ("---%s seconds ---" % (time.time() - tt))
+        stats.log(2, "---%s seconds ---" % (time.time() - tt))
 
         t_new = {}
         for ivid, vid in enumerate(leaves):
@@ -386,6 +700,86 @@ def leaf_temperature(g, meteo, t_soil, t_sky_eff, t_init=None, form_factors=None
     return t_new, it
 
 
+def linearization_deviation(g, meteo, t_soil, t_sky_eff, form_factors=None, gbh=None, ev=None, ei=None, ff_type=True,
+                            leaf_lbl_prefix='L', t_error_crit=0.01):
+    """Computes the deviation of the linearised leaf temperature from the solution of the full (quartic) energy
+    balance.
+
+    Args:
+        g: a multiscale tree graph object
+        meteo (DataFrame): forcing meteorological variables
+        t_soil (float): [°C] soil surface temperature
+        t_sky_eff (float): [°C] effective sky temperature
+        form_factors, gbh, ev, ei, ff_type, leaf_lbl_prefix: see :func:`leaf_temperature`
+        t_error_crit (float): [°C] maximum allowed error in the temperature of the full energy balance
+
+    Returns:
+        (dict): [°C] the difference between the linearised and the full leaf temperatures of individual leaves given
+            as the dictionary keys
+
+    Notes:
+        The full energy balance is solved with :arg:`solo` (and :arg:`vectorized`) set to True in
+            :func:`leaf_temperature`.
+
+    """
+    kwargs = dict(form_factors=form_factors, gbh=gbh, ev=ev, ei=ei, ff_type=ff_type, leaf_lbl_prefix=leaf_lbl_prefix,
+                  stats=SolverStats(0))
+    t_full, _ = leaf_temperature(g, meteo, t_soil, t_sky_eff, t_error_crit=t_error_crit, vectorized=True, **kwargs)
+    t_linearized, _ = leaf_temperature(g, meteo, t_soil, t_sky_eff, linearized=True, **kwargs)
+
+    return {vid: t_linearized[vid] - t_full[vid] for vid in t_full}
+
+
+def leaf_energy_balance(g, meteo, t_soil, t_sky_eff, t_leaves, form_factors, gbh, ev, ei, ff_type=True,
+                        leaf_lbl_prefix='L'):
+    """Computes the net energy balance of each individual leaf at given leaf temperatures.
+
+    Args:
+        g: a multiscale tree graph object
+        meteo (DataFrame): forcing meteorological variables
+        t_soil (float): [°C] soil surface temperature
+        t_sky_eff (float): [°C] effective sky temperature
+        t_leaves (dict): [°C] temperature of individual leaves given as the dictionary keys
+        form_factors(3-tuple of dict): form factors for soil, sky and leaves
+        gbh (dict): [W m-2 K-1] boundary layer conductance for heat
+        ev (dict): [mol m-2 s-1] evaporation flux
+        ei (dict): [umol m-2 s-1] photosynthetically active radition (PAR) incident on leaves
+        ff_type (bool): form factor type flag. If true fform factor for a given leaf is expected to be a single value, or a dict of ff otherwxie
+        leaf_lbl_prefix (str): the prefix of the leaf label
+
+    Returns:
+        (dict): [W m-2] net energy balance of individual leaves given as the dictionary keys
+
+    Notes:
+        The energy balance is that solved by :func:`leaf_temperature` when :arg:`solo` is True, so that the leaf
+            temperatures returned by :func:`leaf_temperature` cancel the returned values (within the convergence
+            tolerance).
+
+    """
+    k_soil, k_sky, k_leaves = form_factors
+
+    temp_sky = utils.celsius_to_kelvin(t_sky_eff)
+    temp_air = utils.celsius_to_kelvin(meteo.Tac[0])
+    temp_soil = utils.celsius_to_kelvin(t_soil)
+
+    balance = {}
+    for vid in get_leaves(g, leaf_lbl_prefix):
+        t_leaf = utils.celsius_to_kelvin(t_leaves[vid])
+        shortwave_inc = ei[vid] / (0.48 * 4.6)  # Ei not Eabs
+
+        if not ff_type:
+            longwave_grain_from_leaves = -sigma * sum(
+                [k_leaves[vid][ivid] * (utils.celsius_to_kelvin(t_leaves[ivid])) ** 4 for ivid in k_leaves[vid]])
+        else:
+            longwave_grain_from_leaves = k_leaves[vid] * sigma * t_leaf ** 4
+
+        balance[vid] = (_leaf_energy_gain(shortwave_inc, k_sky[vid], k_soil[vid], ev[vid], longwave_grain_from_leaves,
+                                          temp_sky, temp_soil) -
+                        2 * e_leaf * sigma * t_leaf ** 4 - gbh[vid] * (t_leaf - temp_air))
+
+    return balance
+
+
 def soil_temperature(g, meteo, temp_sky_eff, soil_label_prefix='other'):
     """Computes soil temperature
 
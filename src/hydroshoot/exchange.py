@@ -8,6 +8,7 @@ This module computes net photosynthesis and stomatal conductance rates.
 
 """
 from copy import deepcopy
+import numpy as np
 from scipy import exp, arccos, sqrt, cos, log
 
 from hydroshoot import utilities as utils
@@ -135,6 +136,36 @@ def leaf_Na(age_gdd, ppfd_10, a_n=-0.0008, b_n=3.3, a_m=6.471, b_m=56.635):
     return max(0., nitrogen_content_per_leaf_area)
 
 
+def leaf_photo_capacities(g, photo_n_params, leaf_lbl_prefix='L'):
+    """Computes the photosynthetic capacities at 25 °C of all mtg leaves from their nitrogen content.
+
+    Args:
+        g: a multiscale tree graph object
+        photo_n_params (dict): the (slope, intercept) values of the linear relationship between photosynthetic capacity
+            parameters (Vcmax, Jmax, TPU, Rd) and surface-based leaf Nitrogen content
+        leaf_lbl_prefix (str): prefix of the label of the leaves
+
+    Returns:
+        (dict): the position of each leaf in the capacity arrays ('index' key, a {vid: position} dictionary) and
+            the arrays of the values of 'Vcm25', 'Jm25', 'TPU25' and 'Rd' of the leaves
+
+    Notes:
+        The capacities only depend on the nitrogen content of the leaves (`Na` property), which does not change once
+            the nitrogen profile is computed. They can thus be computed once per simulation and passed to
+            :func:`gas_exchange_rates`, :func:`gas_exchange_rates_array` and :func:`dark_gas_exchange_rates`.
+
+    """
+    leaves = [vid for vid in g if vid > 0 and g.node(vid).label.startswith(leaf_lbl_prefix)]
+    leaf_n = np.array([g.node(vid).Na for vid in leaves])
+
+    capacities = {'index': {vid: i for i, vid in enumerate(leaves)}}
+    for key in ('Vcm25', 'Jm25', 'TPU25', 'Rd'):
+        slope, intercept = photo_n_params[key + '_N']
+        capacities[key] = slope * leaf_n + intercept
+
+    return capacities
+
+
 # ==============================================================================
 # compute An
 # ==============================================================================
@@ -214,8 +245,8 @@ def dHd_sensibility(psi, temp, dhd_max=200.,
     """Calculates the combined effect of irradiance and heat stress on the enthalpy of deactivation parameter.
 
     Args:
-        psi (float): [MPa] leaf water potential
-        temp (float): [°C] leaf temperature
+        psi (float or numpy.ndarray): [MPa] leaf water potential
+        temp (float or numpy.ndarray): [°C] leaf temperature
         dhd_max (float): [KJ mol-1] maximum value of enthalpy of deactivation
         dhd_inhib_beg (float): [KJ mol-1] value of enthalpy of deactivation at the begining of photoinhibition
         dHd_inhib_max (float): [KJ mol-1] value of enthalpy of deactivation under maximum photoinhibition
@@ -225,15 +256,14 @@ def dHd_sensibility(psi, temp, dhd_max=200.,
         temp_inhib_max (float): [°C] leaf temperature at which photoinhibition is maximum
 
     Returns:
-        (float): [KJ mol-1] value of enthalpy of deactivation after considering photoinhibition
+        (float or numpy.ndarray): [KJ mol-1] value of enthalpy of deactivation after considering photoinhibition
 
     """
 
-    dhd_temp_effect = dhd_inhib_beg - (dhd_inhib_beg - dHd_inhib_max) * min(1.,
-                                                                            max(0., (temp - temp_inhib_beg)) / float(
-                                                                                temp_inhib_max - temp_inhib_beg))
-    dhd_psi_effect = dhd_max - max(0., (dhd_max - dhd_temp_effect) * min(1., (psi - psi_inhib_beg) / float(
-        psi_inhib_max - psi_inhib_beg)))
+    dhd_temp_effect = dhd_inhib_beg - (dhd_inhib_beg - dHd_inhib_max) * np.clip(
+        (temp - temp_inhib_beg) / float(temp_inhib_max - temp_inhib_beg), 0., 1.)
+    dhd_psi_effect = dhd_max - np.maximum(0., (dhd_max - dhd_temp_effect) * np.minimum(
+        1., (psi - psi_inhib_beg) / float(psi_inhib_max - psi_inhib_beg)))
 
     return dhd_psi_effect
 
@@ -589,8 +619,76 @@ def transpiration_rate(leaf_temperature, ea, gs, gb, atm_pressure=101.3):
     return transpiration
 
 
+def leaf_photo_params(photo_params, photo_n_params, leaf_n, psi, leaf_temperature):
+    """Computes the parameters of Farquhar's model of an individual leaf, given its nitrogen content, water potential
+    and temperature.
+
+    Args:
+        photo_params (dict): values at 25 °C of Farquhar's model (cf. :func:`par_photo_default`)
+        photo_n_params (dict): the (slope, intercept) values of the linear relationship between photosynthetic capacity
+            parameters (Vcmax, Jmax, TPU, Rd) and surface-based leaf Nitrogen content
+        leaf_n (float): [gN m-2] nitrogen content per unit leaf area
+        psi (float): [MPa] leaf water potential
+        leaf_temperature (float): [°C] leaf temperature
+
+    Returns:
+        (dict): values at 25 °C of Farquhar's model for the given leaf, the enthalpy of deactivation being corrected for
+            photoinhibition (cf. :func:`dHd_sensibility`)
+
+    """
+    leaf_par_photo = deepcopy(photo_params)
+    leaf_par_photo['Vcm25'] = photo_n_params['Vcm25_N'][0] * leaf_n + photo_n_params['Vcm25_N'][1]
+    leaf_par_photo['Jm25'] = photo_n_params['Jm25_N'][0] * leaf_n + photo_n_params['Jm25_N'][1]
+    leaf_par_photo['TPU25'] = photo_n_params['TPU25_N'][0] * leaf_n + photo_n_params['TPU25_N'][1]
+    leaf_par_photo['Rd'] = photo_n_params['Rd_N'][0] * leaf_n + photo_n_params['Rd_N'][1]
+    leaf_par_photo['dHd'] = _leaf_dhd(photo_params['dHd'], psi, leaf_temperature)
+
+    return leaf_par_photo
+
+
+def _leaf_dhd(dhd_max, psi, leaf_temperature):
+    """Returns the enthalpy of deactivation of a leaf, or of an array of leaves, corrected for photoinhibition (cf.
+    :func:`dHd_sensibility`)."""
+    return dHd_sensibility(psi, leaf_temperature, dhd_max=dhd_max, dhd_inhib_beg=195., dHd_inhib_max=180.,
+                           psi_inhib_beg=-.75, psi_inhib_max=-2., temp_inhib_beg=32, temp_inhib_max=33)
+
+
+def _cached_leaf_photo_params(leaf_par_photo, photo_params, photo_capacities, vid, psi, leaf_temperature):
+    """Updates in place the parameters of Farquhar's model :arg:`leaf_par_photo` with the cached capacities of the
+    leaf :arg:`vid` (cf. :func:`leaf_photo_capacities`) and its enthalpy of deactivation, and returns it."""
+    i = photo_capacities['index'][vid]
+    for key in ('Vcm25', 'Jm25', 'TPU25', 'Rd'):
+        leaf_par_photo[key] = photo_capacities[key][i]
+    leaf_par_photo['dHd'] = _leaf_dhd(photo_params['dHd'], psi, leaf_temperature)
+
+    return leaf_par_photo
+
+
+def leaves_boundary_layer_conductance(g, meteo, leaf_lbl_prefix='L'):
+    """Computes the boundary layer conductance to water vapor of all mtg leaves.
+
+    Args:
+        g: a multiscale tree graph object
+        meteo (pandas.DataFrame): meteorological data
+        leaf_lbl_prefix (str): prefix of the label of the leaves
+
+    Returns:
+        (dict): [mol m-2 s-1] boundary layer conductance to water vapor of individual leaves given as the dictionary
+            keys
+
+    Notes:
+        The boundary layer conductance only depends on leaf length and on the meteorological data, hence it can be
+            computed once per time step and passed to :func:`gas_exchange_rates`.
+
+    """
+    meteo_leaf = meteo.iloc[0]
+    u, atm_press, t_air = meteo_leaf.u, meteo_leaf.Pa, meteo_leaf.Tac
+    return {vid: boundary_layer_conductance(g.node(vid).Length, u, atm_press, t_air, R)
+            for vid in g if vid > 0 and g.node(vid).label.startswith(leaf_lbl_prefix)}
+
+
 def gas_exchange_rates(g, photo_params, photo_n_params, gs_params, meteo, E_type2,
-                       leaf_lbl_prefix='L', rbt=2. / 3.):
+                       leaf_lbl_prefix='L', rbt=2. / 3., vertices=None, gb=None, photo_capacities=None):
     """Computes gas exchange fluxes at the leaf scale analytically.
 
     Args:
@@ -603,6 +701,12 @@ def gas_exchange_rates(g, photo_params, photo_n_params, gs_params, meteo, E_type
         E_type2 (str): one of 'Ei' (intercepted irradiance) or 'Eabs' (absorbed irradiance)
         leaf_lbl_prefix (str): prefix of the label of the leaves
         rbt (float): [m2 s ubar umol-1] the combined turbulance and boundary layer resistance to CO2 transport
+        vertices (iterable): if given, ids of the only leaves whose gas exchange rates are computed, the properties of
+            the other leaves are left unchanged
+        gb (dict): [mol m-2 s-1] if given, boundary layer conductance to water vapor of the leaves (see
+            :func:`leaves_boundary_layer_conductance`), which then need not be recomputed at each call
+        photo_capacities (dict): if given, photosynthetic capacities at 25 °C of the leaves (see
+            :func:`leaf_photo_capacities`), which then need not be recomputed from their nitrogen content at each call
 
     References:
         Evers et al. 2010.
@@ -616,6 +720,8 @@ def gas_exchange_rates(g, photo_params, photo_n_params, gs_params, meteo, E_type
             gs (float): [mol m-2 s-1] stomatal conductance to water vapor
             gb (float): [mol m-2 s-1] boundary layer conductance to water vapor
             E (float): [mol m-2leaf s-1] transpiration per unit leaf surface area
+        The parameters of Farquhar's model of each leaf are also attached to the leaf (`par_photo` property), unless
+            :arg:`photo_capacities` is given.
 
     """
 
@@ -624,16 +730,22 @@ def gas_exchange_rates(g, photo_params, photo_n_params, gs_params, meteo, E_type
     meteo_leaf = deepcopy(meteo)
     meteo_leaf = meteo_leaf.iloc[0]
 
-    for vid in g:
+    t_air = meteo_leaf.Tac
+    hs = meteo_leaf.hs
+    u = meteo_leaf.u
+    c_a = meteo_leaf.Ca
+    atm_press = meteo_leaf.Pa
+
+    es_a = utils.saturated_air_vapor_pressure(t_air)
+    ea = es_a * hs / 100.
+
+    if photo_capacities is not None:
+        leaf_par_photo = dict(photo_params)
+
+    for vid in (g if vertices is None else vertices):
         if vid > 0:
             node = g.node(vid)
             if node.label.startswith(leaf_lbl_prefix):
-                t_air = meteo_leaf.Tac
-                hs = meteo_leaf.hs
-                u = meteo_leaf.u
-                c_a = meteo_leaf.Ca
-                atm_press = meteo_leaf.Pa
-
                 node.u = u  # TODO replace the meso-wind speed (u) by a micro-wind speed at the level of each leaf
 
                 psi = node.properties()['psi_head']
@@ -643,34 +755,327 @@ def gas_exchange_rates(g, photo_params, photo_n_params, gs_params, meteo, E_type
                 meteo_leaf['PPFD'] = ppfd_leaf
                 meteo_leaf['Rg'] = ppfd_leaf / (0.48 * 4.6)
 
-                leaf_par_photo = deepcopy(photo_params)
-                leaf_par_photo['Vcm25'] = photo_n_params['Vcm25_N'][0] * node.Na + photo_n_params['Vcm25_N'][1]
-                leaf_par_photo['Jm25'] = photo_n_params['Jm25_N'][0] * node.Na + photo_n_params['Jm25_N'][1]
-                leaf_par_photo['TPU25'] = photo_n_params['TPU25_N'][0] * node.Na + photo_n_params['TPU25_N'][1]
-                leaf_par_photo['Rd'] = photo_n_params['Rd_N'][0] * node.Na + photo_n_params['Rd_N'][1]
-                dhd_max = leaf_par_photo['dHd']
-                dhd = dHd_sensibility(psi, t_leaf, dhd_max=dhd_max, dhd_inhib_beg=195., dHd_inhib_max=180.,
-                                      psi_inhib_beg=-.75, psi_inhib_max=-2., temp_inhib_beg=32, temp_inhib_max=33)
-
-                leaf_par_photo['dHd'] = dhd
-                node.par_photo = leaf_par_photo
+                if photo_capacities is None:
+                    leaf_par_photo = leaf_photo_params(photo_params, photo_n_params, node.Na, psi, t_leaf)
+                    node.par_photo = leaf_par_photo
+                else:
+                    _cached_leaf_photo_params(leaf_par_photo, photo_params, photo_capacities, vid, psi, t_leaf)
 
                 g0 = g0max  # *g0_sensibility(psi, psi_crit=-1, n=4)
 
-                a_n, c_c, c_i, gs = an_gs_ci(node.par_photo, meteo_leaf, psi, t_leaf,
+                a_n, c_c, c_i, gs = an_gs_ci(leaf_par_photo, meteo_leaf, psi, t_leaf,
                                              model, g0, rbt, c_a, m0, psi0, D0, n)
 
-                gb = boundary_layer_conductance(node.Length, u, atm_press, t_air, R)
+                leaf_gb = boundary_layer_conductance(node.Length, u, atm_press, t_air, R) if gb is None else gb[vid]
 
                 # Transpiration
-                es_a = utils.saturated_air_vapor_pressure(t_air)
-                ea = es_a * hs / 100.
-                e = transpiration_rate(t_leaf, ea, gs, gb, atm_press)
+                e = transpiration_rate(t_leaf, ea, gs, leaf_gb, atm_press)
 
                 node.An = a_n
                 node.Ci = c_i
                 node.gs = gs
-                node.gb = gb
+                node.gb = leaf_gb
+                node.E = max(0., e)
+
+    return
+
+
+def dark_gas_exchange_rates(g, photo_params, photo_n_params, gs_params, meteo, leaf_lbl_prefix='L', rbt=2. / 3.,
+                            photo_capacities=None, gb=None):
+    """Computes gas exchange fluxes at the leaf scale in the absence of irradiance (e.g. at night).
+
+    Args:
+        g: a multiscale tree graph object
+        photo_params (dict): values at 25 °C of Farquhar's model (cf. :func:`par_photo_default`)
+        photo_n_params (dict): the (slope, intercept) values of the linear relationship between photosynthetic capacity
+            parameters (Vcmax, Jmax, TPU, Rd) and surface-based leaf Nitrogen content
+        gs_params (dict): parameters of the stomatal conductance model (model, g0, m0, psi0, D0, n)
+        meteo (pandas.DataFrame): meteorological data
+        leaf_lbl_prefix (str): prefix of the label of the leaves
+        rbt (float): [m2 s ubar umol-1] the combined turbulance and boundary layer resistance to CO2 transport
+        photo_capacities (dict): if given, photosynthetic capacities at 25 °C of the leaves (see
+            :func:`leaf_photo_capacities`)
+        gb (dict): [mol m-2 s-1] if given, boundary layer conductance to water vapor of the leaves (see
+            :func:`leaves_boundary_layer_conductance`), which then need not be recomputed at each call
+
+    Notes:
+        In darkness, the analytical solution of :func:`an_gs_ci` reduces to a net CO2 assimilation equal to the
+            opposite of mitochondrial respiration, and to a stomatal conductance equal to its residual value (`g0`),
+            whatever the leaf water potential. This function sets these values directly, without solving the
+            An-gs-Ci system, and adds the same leaf properties as :func:`gas_exchange_rates`.
+
+    """
+
+    g0 = gs_params['g0']
+
+    meteo_leaf = meteo.iloc[0]
+    t_air = meteo_leaf.Tac
+    hs = meteo_leaf.hs
+    u = meteo_leaf.u
+    c_a = meteo_leaf.Ca
+    atm_press = meteo_leaf.Pa
+
+    es_a = utils.saturated_air_vapor_pressure(t_air)
+    ea = es_a * hs / 100.
+
+    if photo_capacities is not None:
+        leaf_par_photo = dict(photo_params)
+
+    for vid in g:
+        if vid > 0:
+            node = g.node(vid)
+            if node.label.startswith(leaf_lbl_prefix):
+                node.u = u
+
+                psi = node.properties()['psi_head']
+                t_leaf = node.properties()['Tlc']
+
+                if photo_capacities is None:
+                    leaf_par_photo = leaf_photo_params(photo_params, photo_n_params, node.Na, psi, t_leaf)
+                    node.par_photo = leaf_par_photo
+                else:
+                    _cached_leaf_photo_params(leaf_par_photo, photo_params, photo_capacities, vid, psi, t_leaf)
+                r_d = arrhenius_2('Rdmax', t_leaf, leaf_par_photo)
+
+                # intercellular CO2 partial pressure [ubar] under a respiration-driven efflux through the stomatal
+                # conductance to CO2 (g0 / 1.6)
+                c_i = utils.cmol2cpa(t_leaf, c_a) + r_d * (rbt + 1.6 / g0)
+
+                leaf_gb = boundary_layer_conductance(node.Length, u, atm_press, t_air, R) if gb is None else gb[vid]
+                e = transpiration_rate(t_leaf, ea, g0, leaf_gb, atm_press)
+
+                node.An = -r_d
+                node.Ci = utils.cpa2cmol(t_leaf, c_i)
+                node.gs = g0
+                node.gb = leaf_gb
                 node.E = max(0., e)
 
     return
+
+
+# ==============================================================================
+# Vectorized computation over all leaves
+# ==============================================================================
+
+def leaf_photo_params_array(photo_params, photo_n_params, leaf_n, psi, leaf_temperature, capacities=None):
+    """Computes the parameters of Farquhar's model of several leaves at once (array counterpart of
+    :func:`leaf_photo_params`).
+
+    Args:
+        photo_params (dict): values at 25 °C of Farquhar's model (cf. :func:`par_photo_default`)
+        photo_n_params (dict): the (slope, intercept) values of the linear relationship between photosynthetic capacity
+            parameters (Vcmax, Jmax, TPU, Rd) and surface-based leaf Nitrogen content
+        leaf_n (numpy.ndarray): [gN m-2] nitrogen content per unit leaf area
+        psi (numpy.ndarray): [MPa] leaf water potential
+        leaf_temperature (numpy.ndarray): [°C] leaf temperature
+        capacities (dict): if given, arrays of the values of 'Vcm25', 'Jm25', 'TPU25' and 'Rd' of the leaves (cf.
+            :func:`leaf_photo_capacities`), :arg:`leaf_n` being then ignored
+
+    Returns:
+        (dict): values at 25 °C of Farquhar's model, where the leaf-specific parameters ('Vcm25', 'Jm25', 'TPU25', 'Rd'
+            and 'dHd') are given as arrays
+
+    """
+    leaves_par_photo = dict(photo_params)
+    if capacities is None:
+        for key in ('Vcm25', 'Jm25', 'TPU25'):
+            slope, intercept = photo_n_params[key + '_N']
+            leaves_par_photo[key] = slope * leaf_n + intercept
+        leaves_par_photo['Rd'] = photo_n_params['Rd_N'][0] * leaf_n + photo_n_params['Rd_N'][1]
+    else:
+        for key in ('Vcm25', 'Jm25', 'TPU25', 'Rd'):
+            leaves_par_photo[key] = capacities[key]
+
+    leaves_par_photo['dHd'] = _leaf_dhd(photo_params['dHd'], psi, leaf_temperature)
+
+    return leaves_par_photo
+
+
+def fvpd_3_array(model, vpd, psi, psi_crit=-0.37, m0=5.278, steepness_tuzet=1.85, d0_leuning=30.):
+    """Calculates the effect of water deficit on stomatal conductance of several leaves at once (array counterpart
+    of :func:`fvpd_3`).
+
+    Args:
+        model (str): stomatal conductance reduction model, one of 'misson','tuzet', 'linear' or 'vpd'
+        vpd (numpy.ndarray): [kPa] vapor pressure deficit
+        psi (numpy.ndarray): [MPa] leaf water potential
+        psi_crit (float): [MPa] critical leaf water potential
+        m0 (float): [mmol(H2O) umol-1(CO2)] slope between the stomatal conductance and assimilated CO2 rates
+        steepness_tuzet (float): [MPa-1] steepness of the sigmoidal reduction function of tuzet's model
+        d0_leuning (float): [kPa-1] shape factor shaping VPD's effect on the reduction function of leuning's model
+
+    Returns:
+        (numpy.ndarray): [mmol(H2O) umol-1(CO2)] the slope between the stomatal conductance and assimilated CO2 rates
+            after accounting for the effect of water deficit
+
+    """
+    if model == 'misson':
+        reduction_factor = 1. / (1. + (psi / psi_crit) ** steepness_tuzet)
+    elif model == 'tuzet':
+        reduction_factor = (1. + np.exp(steepness_tuzet * psi_crit)) / (
+                1. + np.exp(steepness_tuzet * (psi_crit - psi)))
+    elif model == 'linear':
+        reduction_factor = 1. - np.minimum(1., psi / float(psi_crit))
+    elif model == 'vpd':
+        reduction_factor = 1. / (1. + vpd / float(d0_leuning))
+    else:
+        raise ValueError("The 'model' argument must be one of the following ('misson','tuzet', 'linear' or 'vpd').")
+    return m0 * reduction_factor
+
+
+def compute_amono_analytic_array(x1, x2, gm, ca, f_vpd, gammax, rd, g0=0.019, rbt=2. / 3.):
+    """Computes the gross CO2 assimilation rate of several leaves at once (array counterpart of
+    :func:`compute_amono_analytic`).
+
+    Args:
+        x1 (numpy.ndarray): Vcmax or J/4.
+        x2 (numpy.ndarray): KmC(1+O/KmO) or 2 gamma_asterisk
+        gm (numpy.ndarray): [mol m-2 s-1] mesophyll conductance to CO2 (cf. :func:`mesophyll_conductance`)
+        ca (numpy.ndarray): [ubar] CO2 partial pressure of the air
+        f_vpd (numpy.ndarray): [umol mmol-1] slope An/gs after accounting for water deficit (cf. :func:`fvpd_3_array`)
+        gammax (numpy.ndarray): [ubar] CO2 compensation point
+        rd (numpy.ndarray): [umol m-2 s-1] mitochondrial respiration rate in the light
+        g0 (float): [umol m-2 s-1] residual stomatal conductance to CO2
+        rbt (float): [m2 s ubar umol-1] combined turbulance and boundary layer resistance to CO2
+
+    Returns:
+        (numpy.ndarray): [umolCO2 m-2 s-1] gross CO2 assimilation rate
+
+    Notes:
+        The temperature-dependent terms (`gm`, `ca`, `f_vpd`) are computed once by the caller for the three
+            limitations.
+
+    """
+    rgm = 1. / gm
+    x1_rd = x1 - rd
+    g_vpd = g0 * rgm + f_vpd
+
+    cube_a = g0 * (x2 + gammax) + g_vpd * x1_rd
+    cube_b = ca * x1_rd - gammax * x1 - rd * x2
+    cube_c = ca + x2 + (rgm + rbt) * x1_rd
+    cube_d = x2 + gammax + x1_rd * rgm
+    cube_e = rgm + g_vpd * (rgm + rbt)
+    cube_p = -(cube_d + x1_rd * rgm + cube_a * (rgm + rbt) + g_vpd * cube_c) / cube_e
+    cube_q = (cube_d * x1_rd + cube_a * cube_c + g_vpd * cube_b) / cube_e
+    cube_r = -(cube_a * cube_b / cube_e)
+    cube_Q = (cube_p ** 2. - 3. * cube_q) / 9.
+    cube_R = (2. * cube_p ** 3. - 9. * cube_p * cube_q + 27. * cube_r) / 54.
+    cube_xi = np.arccos(np.clip(cube_R / np.sqrt(cube_Q ** 3.), -1., 1.))
+
+    return -2. * np.sqrt(cube_Q) * np.cos(cube_xi / 3.) - cube_p / 3.
+
+
+def an_gs_ci_array(photo_params, ppfd, air_temperature, hs, psi, leaf_temperature, model='misson', g0=0.019,
+                   rbt=2. / 3., ca=400., m0=5.278, psi0=-0.1, d0_leuning=30., steepness_tuzet=1.85):
+    """Computes simultaneously the net CO2 assimilation rate (An), stomatal conductance to water vapor (gs), and
+    inter-cellular CO2 concentration (Ci) of several leaves at once (array counterpart of :func:`an_gs_ci`).
+
+    Args:
+        photo_params (dict): values at 25 °C of Farquhar's model, leaf-specific values being given as arrays (cf.
+            :func:`leaf_photo_params_array`)
+        ppfd (numpy.ndarray): [umol m-2 s-1] absorbed photosynthetic photon flux density
+        air_temperature (float): [°C] air temperature
+        hs (float): [%] air relative humidity
+        psi (numpy.ndarray): [MPa] bulk water potential of the leaves
+        leaf_temperature (numpy.ndarray): [°C] leaf temperature
+        model (str): stomatal conductance reduction model, one of 'misson','tuzet', 'linear' or 'vpd'
+        g0 (float): [umol m-2 s-1] residual stomatal conductance to CO2
+        rbt (float): [m2 s ubar umol-1] combined turbulance and boundary layer resistance to CO2
+        ca (float): [ppm] CO2 concentration of the air
+        m0 (float): [umol mmol-1] maximum slope An/gs (absence of water deficit), see :func:`fvpd_3`
+        psi0 (float): [MPa] critical thershold for water potential, see :func:`fvpd_3`
+        d0_leuning (float): [kPa-1] shape parameter, see :func:`fvpd_3`
+        steepness_tuzet (float): [MPa-1] shape parameter, see :func:`fvpd_3`
+
+    Returns:
+        (numpy.ndarray): [umolCO2 m-2 s-1] net CO2 assimilation rate
+        (numpy.ndarray): [umol mol-1] CO2 chloroplast concentration
+        (numpy.ndarray): [umol mol-1] intercullar CO2 concentration
+        (numpy.ndarray): [mol m-2 s-1] stomatal conductance to water vapor
+
+    """
+    ppfd = np.maximum(1.e-6, ppfd)  # To avoid numerical instability
+
+    vpd = utils.vapor_pressure_deficit(air_temperature, leaf_temperature, hs)
+
+    x1c, x2c, x1j, x2j, x1t, x2t, rd = compute_an_2par(photo_params, ppfd, leaf_temperature)
+
+    f_vpd = fvpd_3_array(model, vpd, psi, psi_crit=psi0, m0=m0, steepness_tuzet=steepness_tuzet,
+                         d0_leuning=d0_leuning)
+    gm = mesophyll_conductance(leaf_temperature)
+    ca_pa = utils.cmol2cpa(leaf_temperature, ca)
+    gammax = x2j / 2.
+
+    a_c, a_j, a_t = [compute_amono_analytic_array(x1, x2, gm, ca_pa, f_vpd, gammax, rd, g0, rbt)
+                     for x1, x2 in ((x1c, x2c), (x1j, x2j), (x1t, x2t))]
+
+    a_n = np.minimum(np.minimum(a_c, a_j), a_t)
+
+    # chlorophyll partial pressure [ubar] of the limiting process
+    with np.errstate(divide='ignore', invalid='ignore'):
+        c_c = np.where(a_n == a_c, (gammax * x1c + (a_c + rd) * x2c) / (x1c - a_c - rd),
+                       np.where(a_n == a_j, (gammax * x1j + (a_j + rd) * x2j) / (x1j - a_j - rd),
+                                (gammax * x1t + (a_t + rd) * x2t) / (x1t - a_t - rd)))
+
+    # inter-cellular partial pressure [ubar]
+    c_i = c_c + a_n / gm
+
+    # stomatal conductance to water vapor [mol m-2 s-1]
+    gsw = 1.6 * (g0 / 1.6 + (a_n + rd) * f_vpd / (c_i - (gammax - rd / gm)))
+
+    return a_n, utils.cpa2cmol(leaf_temperature, c_c), utils.cpa2cmol(leaf_temperature, c_i), gsw
+
+
+def gas_exchange_rates_array(g, photo_params, photo_n_params, gs_params, meteo, E_type2,
+                             leaf_lbl_prefix='L', rbt=2. / 3., vertices=None, gb=None, photo_capacities=None):
+    """Computes gas exchange fluxes at the leaf scale analytically, for all leaves at once.
+
+    This function is a drop-in replacement of :func:`gas_exchange_rates` (same arguments, same leaf properties),
+    where the An-gs-Ci system is solved on arrays gathering all the leaves instead of leaf by leaf.
+
+    Args:
+        see :func:`gas_exchange_rates`
+
+    Notes:
+        The leaf-specific parameters of Farquhar's model are not attached to the leaves (`par_photo` property).
+
+    """
+
+    model, g0, m0, psi0, D0, n = [gs_params[ikey] for ikey in ('model', 'g0', 'm0', 'psi0', 'D0', 'n')]
+
+    meteo_leaf = meteo.iloc[0]
+    t_air, hs, u, c_a, atm_press = [meteo_leaf[ikey] for ikey in ('Tac', 'hs', 'u', 'Ca', 'Pa')]
+
+    label = g.property('label')
+    leaves = [vid for vid in (g if vertices is None else vertices)
+              if vid > 0 and label[vid].startswith(leaf_lbl_prefix)]
+    if len(leaves) == 0:
+        return
+
+    psi = np.array([g.node(vid).psi_head for vid in leaves])
+    t_leaf = np.array([g.node(vid).Tlc for vid in leaves])
+    ppfd = np.array([g.node(vid).properties()[E_type2] for vid in leaves])
+    if photo_capacities is None:
+        leaf_n, capacities = np.array([g.node(vid).Na for vid in leaves]), None
+    else:
+        index = [photo_capacities['index'][vid] for vid in leaves]
+        leaf_n, capacities = None, {key: photo_capacities[key][index] for key in ('Vcm25', 'Jm25', 'TPU25', 'Rd')}
+    if gb is None:
+        leaf_gb = boundary_layer_conductance(np.array([g.node(vid).Length for vid in leaves]), u, atm_press, t_air, R)
+    else:
+        leaf_gb = np.array([gb[vid] for vid in leaves])
+
+    leaves_par_photo = leaf_photo_params_array(photo_params, photo_n_params, leaf_n, psi, t_leaf, capacities)
+
+    a_n, c_c, c_i, gs = an_gs_ci_array(leaves_par_photo, ppfd, t_air, hs, psi, t_leaf,
+                                       model, g0, rbt, c_a, m0, psi0, D0, n)
+
+    # Transpiration
+    ea = utils.saturated_air_vapor_pressure(t_air) * hs / 100.
+    e = np.maximum(0., transpiration_rate(t_leaf, ea, gs, leaf_gb, atm_press))
+
+    for name, values in (('An', a_n), ('Ci', c_i), ('gs', gs), ('gb', leaf_gb), ('E', e)):
+        g.properties().setdefault(name, {}).update(zip(leaves, values.tolist()))
+    g.properties().setdefault('u', {}).update((vid, u) for vid in leaves)
+
+    return
@@ -7,9 +7,12 @@ Hydraulic structure module of HydroShoot.
 This module computes xylem water potential value at each node of the shoot.
 """
 
-from scipy import exp, absolute, pi, log, array, optimize
+import time
+import numpy as np
+from scipy import exp, absolute, pi, log
 from copy import deepcopy
 
+from hydroshoot.acceleration import accelerate
 from openalea.plantgl.all import surface as surf
 import openalea.mtg.traversal as traversal
 
@@ -46,7 +49,7 @@ def cavitation_factor(psi, model='tuzet', fifty_cent=-0.51, sig_slope=3):
     conductivity).
 
     Args:
-        psi (float): [MPa] water potential of the hydraulic segment
+        psi (float or numpy.ndarray): [MPa] water potential of the hydraulic segment(s)
         model (str): one of 'misson' (logistic function with polynomial formula), 'tuzet' (logistic function with
             exponential formula), or 'linear' for linear reduction
         fifty_cent (float): [MPa] water potential at which the conductivity of the hydraulic segment drops to 50%
@@ -55,22 +58,53 @@ def cavitation_factor(psi, model='tuzet', fifty_cent=-0.51, sig_slope=3):
             'tuzet' [MPa-1] models)
 
     Returns:
-        (float): [-] the ratio of actual to maximum stem conductance (between 0 and 1)
+        (float or numpy.ndarray): [-] the ratio of actual to maximum stem conductance (between 0 and 1)
 
     """
 
     if model == 'misson':
         k_reduction = 1. / (1. + (psi / fifty_cent) ** sig_slope)
     elif model == 'tuzet':
-        k_reduction = (1. + exp(sig_slope * fifty_cent)) / (1. + exp(float(sig_slope * (fifty_cent - psi))))
+        k_reduction = (1. + exp(sig_slope * fifty_cent)) / (1. + exp(sig_slope * (fifty_cent - psi)))
     elif model == 'linear':
-        k_reduction = 1 - min(0.95, float(psi / fifty_cent))
+        k_reduction = 1 - np.minimum(0.95, psi / fifty_cent)
     else:
         raise ValueError("The 'model' argument must be one of the following ('misson','tuzet', 'linear').")
 
     return k_reduction
 
 
+def cavitation_factor_derivative(psi, model='tuzet', fifty_cent=-0.51, sig_slope=3):
+    """Computes the derivative of the cavitation factor (see :func:`cavitation_factor`) with respect to the water
+    potential of the hydraulic segment.
+
+    Args:
+        psi (float or numpy.ndarray): [MPa] water potential of the hydraulic segment(s)
+        model (str): one of 'misson', 'tuzet' or 'linear', see :func:`cavitation_factor` for details
+        fifty_cent (float): [MPa] water potential at which the conductivity of the hydraulic segment drops to 50%
+            of its maximum value
+        sig_slope (float): a shape parameter controlling the slope of the S-curve (used only for 'misson' [-] or
+            'tuzet' [MPa-1] models)
+
+    Returns:
+        (float or numpy.ndarray): [MPa-1] the derivative of the ratio of actual to maximum stem conductance
+
+    """
+
+    if model == 'misson':
+        ratio = (psi / fifty_cent) ** sig_slope
+        dk_reduction = - sig_slope / fifty_cent * (psi / fifty_cent) ** (sig_slope - 1) / (1. + ratio) ** 2
+    elif model == 'tuzet':
+        exp_psi = exp(sig_slope * (fifty_cent - psi))
+        dk_reduction = (1. + exp(sig_slope * fifty_cent)) * sig_slope * exp_psi / (1. + exp_psi) ** 2
+    elif model == 'linear':
+        dk_reduction = np.where(psi / fifty_cent < 0.95, -1. / fifty_cent, 0.)
+    else:
+        raise ValueError("The 'model' argument must be one of the following ('misson','tuzet', 'linear').")
+
+    return dk_reduction
+
+
 def def_param_soil(costum=None):
     """
     Returns a dictionary of classes of default soil hydrodynamic parameters for the model of van Genuchten-Muallem.
@@ -103,13 +137,18 @@ def def_param_soil(costum=None):
     return def_dict
 
 
+# Registry of the soil classes, built once for :func:`k_soil_soil` and :func:`soil_water_potential`. Other soil classes
+# can be registered as `soil_classes[name] = (theta_r, theta_s, alpha, n, k_sat)`, see :func:`def_param_soil`.
+soil_classes = def_param_soil()
+
+
 def k_soil_soil(psi, soil_class):
     """Gives the actual soil hydraulic conductivity following van Genuchten (1980)
 
     Args:
         psi (float): [MPa] bulk soil water potential
         soil_class (str): one of the soil classes proposed by Carsel and Parrish (1988), see :func:`def_param_soil` for
-            details
+            details, or a soil class added to :data:`soil_classes`
 
     Returns:
         (float): [cm d-1] actual soil water conductivity
@@ -124,7 +163,7 @@ def k_soil_soil(psi, soil_class):
     """
 
     psi *= 1.e6 / (rho * g_p) * 100.  # MPa -> cm_H20
-    param = def_param_soil()[soil_class]
+    param = soil_classes[soil_class]
     theta_r, theta_s, alpha, n, k_sat = [param[i] for i in range(5)]
     m = 1. - 1. / n
     effective_saturation = 1. / (1. + abs(alpha * psi) ** n) ** m
@@ -161,7 +200,7 @@ def soil_water_potential(psi_soil_init, water_withdrawal, soil_class, soil_total
         water_withdrawal (float): [Kg T-1] water volume that is withdrawn from the soil (by transpiration for instance)
             during a time lapse T
         soil_class (str): one of the soil classes proposed by Carsel and Parrish (1988), see :func:`def_param_soil` for
-            details
+            details, or a soil class added to :data:`soil_classes`
         soil_total_volume (float): [m3] total apparent volume of the soil (including solid, liquid and gaseous
             fractions)
         psi_min (float): [MPa] minimum allowable water potential
@@ -171,6 +210,8 @@ def soil_water_potential(psi_soil_init, water_withdrawal, soil_class, soil_total
 
     Notes:
         Strictly speaking, :arg:`psi_min` expresses rather the minimum water potential at the base of the plant shoot.
+        The soil water potential is obtained by the analytical inversion of the water retention curve of van Genuchten
+            (1980), the effective saturation being bounded to 1.
 
     References:
         van Genuchten M., 1980.
@@ -178,7 +219,7 @@ def soil_water_potential(psi_soil_init, water_withdrawal, soil_class, soil_total
             Soil Science Society of America Journal 44, 892897.
     """
 
-    param = def_param_soil()[soil_class]
+    param = soil_classes[soil_class]
     theta_r, theta_s, alpha, n, k_sat = [param[i] for i in range(5)]
     m = 1. - 1. / n
 
@@ -196,15 +237,51 @@ def soil_water_potential(psi_soil_init, water_withdrawal, soil_class, soil_total
     if theta == theta_r:
         psi_soil = psi_min
     else:
-        def _water_retention(x):
-            return 1. / (1. + absolute(alpha * x) ** n) ** m - (theta - theta_r) / (theta_s - theta_r)
-
-        psi_soil = optimize.fsolve(_water_retention, array([psi]))[0] / (1.e6 / (rho * g_p) * 100)
+        # Inversion of the water retention curve
+        effective_saturation = min(1., (theta - theta_r) / (theta_s - theta_r))
+        psi_soil = - (effective_saturation ** (-1. / m) - 1.) ** (1. / n) / alpha / (1.e6 / (rho * g_p) * 100)
 
     return float(psi_soil)
 
 
-def hydraulic_prop(g, mass_conv=18.01528, length_conv=1.e-2, a=2.6, b=2.0, min_kmax=0.):
+def static_hydraulic_properties(g, length_conv=1.e-2, a=2.6, b=2.0, min_kmax=0.):
+    """Computes the properties of the hydraulic segments that only depend on the plant geometry, that is the maximum
+    hydraulic conductivity `Kmax` of stem segments and the surface area `leaf_area` of leaves. Both properties are then
+    attached to the corresponding mtg nodes.
+
+    Args:
+        g (openalea.mtg.MTG): a multiscale tree graph object
+        length_conv (float): conversion coefficient from the length unit of the mtg to that of [1 m]
+        a (float): [kg s-1 MPa-1] slope of the Kh(D) relationship, see :func:`conductivity_max` for details
+        b (float): [-] exponent of the Kh(D) relationship, see :func:`conductivity_max` for details
+        min_kmax (float): [kg s-1 m MPa-1] minimum value for the maximum conductivity, see :func:`conductivity_max`
+            for details
+
+    Notes:
+        Once these properties are computed, :func:`hydraulic_prop` can be called with `compute_kmax=False` at each
+            iteration of the solver.
+
+    """
+
+    vid_base = g.node(g.root).vid_base
+
+    for vtx_id in traversal.post_order2(g, vid_base):
+        n = g.node(vtx_id)
+        if n.label.startswith('LI'):
+            try:
+                n.leaf_area * 1.
+            except (AttributeError, TypeError):
+                n.leaf_area = surf(n.geometry) * length_conv ** 2  # [m2]
+
+        elif n.label.startswith(('in', 'cx', 'Pet')):
+            diam = 0.5 * (n.TopDiameter + n.BotDiameter) * length_conv
+            n.Kmax = conductivity_max(diam, a, b, min_kmax)
+
+        elif n.label.startswith('rhyzo'):
+            n.Kmax = None
+
+
+def hydraulic_prop(g, mass_conv=18.01528, length_conv=1.e-2, a=2.6, b=2.0, min_kmax=0., compute_kmax=True):
     """Computes water flux `Flux` and maximum hydraulic conductivity `Kmax` of each hydraulic segment. Both properties
         are then attached to the corresponding mtg nodes.
 
@@ -216,6 +293,8 @@ def hydraulic_prop(g, mass_conv=18.01528, length_conv=1.e-2, a=2.6, b=2.0, min_k
         b (float): [-] exponent of the Kh(D) relationship, see :func:`conductivity_max` for details
         min_kmax (float): [kg s-1 m MPa-1] minimum value for the maximum conductivity, see :func:`conductivity_max`
             for details
+        compute_kmax (bool): if False, `Kmax` is not recomputed but read from the mtg nodes (see
+            :func:`static_hydraulic_properties`)
 
     Returns:
         (openalea.mtg.MTG): the multiscale tree graph object
@@ -251,8 +330,9 @@ def hydraulic_prop(g, mass_conv=18.01528, length_conv=1.e-2, a=2.6, b=2.0, min_k
 
         elif n.label.startswith(('in', 'cx', 'Pet')):
             n.Flux = sum([vtx.Flux for vtx in n.children()])
-            diam = 0.5 * (n.TopDiameter + n.BotDiameter) * length_conv
-            n.Kmax = conductivity_max(diam, a, b, min_kmax)
+            if compute_kmax:
+                diam = 0.5 * (n.TopDiameter + n.BotDiameter) * length_conv
+                n.Kmax = conductivity_max(diam, a, b, min_kmax)
 
             n.FluxC = sum([vtx.FluxC for vtx in n.children()])
 
@@ -260,7 +340,8 @@ def hydraulic_prop(g, mass_conv=18.01528, length_conv=1.e-2, a=2.6, b=2.0, min_k
             n.Flux = sum([vtx.Flux for vtx in n.children()])
             n.FluxC = sum([vtx.FluxC for vtx in n.children()])
 
-            n.Kmax = None
+            if compute_kmax:
+                n.Kmax = None
 
     return g
 
@@ -357,7 +438,8 @@ def transient_xylem_water_potential(g, model='tuzet', length_conv=1.e-2, psi_soi
 
 def xylem_water_potential(g, psi_soil=-0.8, model='tuzet', psi_min=-3.0, psi_error_crit=0.001, max_iter=100,
                           length_conv=1.E-2, fifty_cent=-0.51, sig_slope=0.1, dist_roots=0.013, rad_roots=.0001,
-                          negligible_shoot_resistance=False, start_vid=None, stop_vid=None, psi_step=0.5):
+                          negligible_shoot_resistance=False, start_vid=None, stop_vid=None, psi_step=0.5,
+                          accelerator=None, deadline=None):
     """Computes the hydraulic structure of plant's shoot.
 
     Args:
@@ -382,6 +464,10 @@ def xylem_water_potential(g, psi_soil=-0.8, model='tuzet', psi_min=-3.0, psi_err
             up until the leaves)
         psi_step (float): [m] reduction factor to the xylem water potential step between two consecutive iterations
             (between 0 and 1)
+        accelerator: if given, an accelerator of the fixed-point iterations (see
+            :func:`hydroshoot.acceleration.accelerator`) used instead of the relaxation by :arg:`psi_step`
+        deadline (float): [s] if given, wall-clock time (as returned by `time.time()`) after which the iterations stop,
+            even if not converged
 
     Returns:
         (int): the number of iterations
@@ -404,6 +490,14 @@ def xylem_water_potential(g, psi_soil=-0.8, model='tuzet', psi_min=-3.0, psi_err
 
         psi_new = deepcopy(g.property('psi_head'))
 
+        if accelerator is not None:
+            psi_error = sum([abs(psi_prev[vtx_id] - psi_new[vtx_id]) for vtx_id in psi_new])
+            g.properties()['psi_head'] = accelerate(accelerator, psi_prev, psi_new, lower=psi_min)
+            counter += 1
+            if counter > max_iter or (deadline is not None and time.time() > deadline):
+                break
+            continue
+
         psi_error_trace.append(psi_error)
 
         if counter > max_iter:
@@ -425,4 +519,666 @@ def xylem_water_potential(g, psi_soil=-0.8, model='tuzet', psi_min=-3.0, psi_err
 
         counter += 1
 
+        if deadline is not None and time.time() > deadline:
+            break
+
     return counter
+
+
+# ======================================================================================================================
+# Array-based hydraulic network
+# ======================================================================================================================
+
+_LEAF, _STEM, _RHYZO0, _RHYZO = range(4)
+
+
+class HydraulicNetwork(object):
+    """Hydraulic structure of the plant compiled once into flat arrays.
+
+    The hydraulic segments below :arg:`vid_base` are stored in pre-order, each one referring to the index of its parent,
+    so that the sap flux is accumulated from the leaves downwards and the xylem water potential is propagated from the
+    base upwards by whole levels of the tree instead of traversing the mtg node by node. The mtg is only read when the
+    network is built or when a computation starts, and written to once the computation ends.
+
+    The methods :meth:`hydraulic_prop`, :meth:`transient_xylem_water_potential` and :meth:`xylem_water_potential` have
+    the same signatures and results as the functions of this module, so that a network object can be used in place of
+    the module.
+
+    Args:
+        g (openalea.mtg.MTG): a multiscale tree graph object, whose static hydraulic properties are already computed
+            (see :func:`static_hydraulic_properties`)
+        length_conv (float): conversion coefficient from the length unit of the mtg to that of [1 m]
+        vid_base (int): id of the basal node of the network (if `None` it is taken to the basal element of the mtg)
+        newton (bool): if True, :meth:`xylem_water_potential` solves the hydraulic structure by Newton iterations
+            (see :meth:`newton_xylem_water_potential`) instead of relaxed sweeps
+        coarsen (bool): if True, each unbranched chain of stem segments is lumped into a single equivalent segment
+            whose resistance and height difference are the sums of those of the chain segments, see
+            :meth:`reconstruct_water_potential`
+        keep (iterable): ids of the stem segments that must not be lumped into a chain (the basal and collar nodes are
+            always kept), e.g. the vertices from or at which the computation of the water potential starts or stops
+        incremental (bool): if True, the sap flux is only updated along the paths from the leaves whose fluxes
+            changed to the base, and the water potential is only recomputed for the segments whose inputs (flux,
+            water potential at both ends) changed since their last computation, the mtg being only updated where values
+            changed
+        psi_tol (float): [MPa] change of the water potential at either end of a segment below which its water
+            potential is not recomputed (only used if :arg:`incremental` is True)
+
+    Attributes:
+        n_touched_flux (int): number of segments whose flux was updated by the last call to :meth:`hydraulic_prop`
+        n_touched_psi (int): number of computations of the water potential of a segment (leaves excluded) by the last
+            computation of the hydraulic structure
+
+    Notes:
+        The geometry of the segments (`Length`, `TopPosition`, `BotPosition`, `TopDiameter`, `BotDiameter`, `depth`),
+            as well as `Kmax`, `leaf_area` and `soil_class`, are read once when the network is built, the network must
+            therefore be rebuilt whenever the plant geometry changes.
+        In a coarsened network, the cavitation of a chain is computed at the mean water potential of its ends, and
+            the water potential of the lumped segments is only updated by :meth:`reconstruct_water_potential`.
+
+    """
+
+    def __init__(self, g, length_conv=1.e-2, vid_base=None, newton=False, coarsen=False, keep=(), incremental=False,
+                 psi_tol=1.e-4):
+        if vid_base is None:
+            vid_base = g.node(g.root).vid_base
+
+        self.vid_base = vid_base
+        self.length_conv = length_conv
+        self.newton = newton
+
+        props = g.properties()
+        labels = props['label']
+        vids = list(traversal.pre_order2(g, vid_base))
+
+        def _is_stem(vid):
+            return not labels[vid].startswith(('LI', 'rhyzo'))
+
+        # Stem segments carrying a single stem segment are lumped into the latter
+        lumped = set()
+        if coarsen:
+            kept = set(keep) | {vid_base, props.get('vid_collar', {}).get(g.root)}
+            for vid in vids:
+                children = g.children(vid)
+                if vid not in kept and _is_stem(vid) and len(children) == 1 and _is_stem(children[0]):
+                    lumped.add(vid)
+
+        self.vids = [vid for vid in vids if vid not in lumped]
+        self.index = {vid: i for i, vid in enumerate(self.vids)}
+        n = len(self.vids)
+
+        self.parent = np.zeros(n, dtype=int)
+        self.level = np.zeros(n, dtype=int)
+        self.size = np.ones(n, dtype=int)
+        self.node_type = np.zeros(n, dtype=int)
+        chains = {}
+        for i, vid in enumerate(self.vids[1:], 1):
+            chain = [vid]
+            while g.parent(chain[0]) in lumped:
+                chain.insert(0, g.parent(chain[0]))
+            if len(chain) > 1:
+                chains[i] = chain
+            self.parent[i] = self.index[g.parent(chain[0])]
+            self.level[i] = self.level[self.parent[i]] + 1
+        for i in range(n - 1, 0, -1):
+            self.size[self.parent[i]] += self.size[i]
+
+        for i, vid in enumerate(self.vids):
+            label = labels[vid]
+            if label.startswith('LI'):
+                self.node_type[i] = _LEAF
+            elif label.startswith('rhyzo0'):
+                self.node_type[i] = _RHYZO0
+            elif label.startswith('rhyzo'):
+                self.node_type[i] = _RHYZO
+            else:
+                self.node_type[i] = _STEM
+
+        self.leaves = np.flatnonzero(self.node_type == _LEAF)
+        self.stems = np.flatnonzero(self.node_type == _STEM)
+        self.rhyzo = np.flatnonzero((self.node_type == _RHYZO0) | (self.node_type == _RHYZO))
+        self.leaf_vids = [self.vids[i] for i in self.leaves]
+
+        def _segment_property(name, vids, default=0.):
+            values = props.get(name, {})
+            return np.array([values.get(vid, default) for vid in vids], dtype=float)
+
+        def _segment_dz(vids):
+            top, bot = props.get('TopPosition', {}), props.get('BotPosition', {})
+            return np.array([(top[vid][2] - bot[vid][2]) * length_conv for vid in vids], dtype=float)
+
+        def _segment_diameter(vids):
+            return 0.5 * (_segment_property('TopDiameter', vids) + _segment_property('BotDiameter', vids)) * length_conv
+
+        segments = np.flatnonzero(self.node_type != _LEAF)
+        segment_vids = [self.vids[i] for i in segments]
+        stem_vids = [self.vids[i] for i in self.stems]
+        self.length = np.zeros(n)
+        self.length[segments] = _segment_property('Length', segment_vids) * length_conv
+        self.dz = np.zeros(n)
+        self.dz[segments] = _segment_dz(segment_vids)
+        self.diameter = np.zeros(n)
+        self.diameter[self.stems] = _segment_diameter(stem_vids)
+        self.k_max = np.zeros(n)
+        self.k_max[self.stems] = _segment_property('Kmax', stem_vids, np.nan)
+        self.leaf_area = _segment_property('leaf_area', self.leaf_vids)
+
+        # Each chain is an equivalent segment of unit length, summing the resistances and height differences of the
+        # chain segments (the cumulated values along the chain are kept to reconstruct the lumped segments)
+        self.chain_heads = np.array(sorted(chains), dtype=int)
+        self.lumped_vids = [vid for i in self.chain_heads for vid in chains[i][:-1]]
+        self.lumped_head = np.array([i for i in self.chain_heads for _ in chains[i][:-1]], dtype=int)
+        self._chain_length = {i: _segment_property('Length', chains[i]) * length_conv for i in self.chain_heads}
+        self._chain_diameter = {i: _segment_diameter(chains[i]) for i in self.chain_heads}
+        self._chain_dz = {i: _segment_dz(chains[i]) for i in self.chain_heads}
+        self._chain_vids = [vid for i in self.chain_heads for vid in chains[i]]
+        self._chain_lumped = np.array([vid != chains[i][-1] for i in self.chain_heads for vid in chains[i]], dtype=bool)
+        self._lumped_dz = np.array([dz for i in self.chain_heads for dz in np.cumsum(self._chain_dz[i])[:-1]])
+        self._lump_chains(_segment_property('Kmax', self._chain_vids, np.nan))
+
+        self.rhyzo_flux_conv = {}
+        self.soil_class = {}
+        for i in self.rhyzo:
+            vid = self.vids[i]
+            self.rhyzo_flux_conv[i] = 8640. / (pi * props['TopDiameter'][vid] * length_conv *
+                                               props['depth'][vid] * length_conv)
+            self.soil_class[i] = props['soil_class'][vid]
+
+        self.incremental = incremental
+        self.psi_tol = psi_tol
+        self._flux_levels = [np.flatnonzero(self.level == level) for level in range(self.level.max(), 0, -1)]
+        self._levels = {}
+        self.reset()
+
+    def reset(self):
+        """Forgets the fluxes and water potentials of the previous computations (sap flux, memoised inputs and results
+        of the incremental network), so that the network can be reused from one time step to the next, the mtg state
+        being then entirely read and written by the next computations."""
+        n = len(self.vids)
+        self.n_touched_flux = 0
+        self.n_touched_psi = 0
+        self._leaf_flux = None
+        self._leaf_flux_c = None
+        self._memo_base, self._memo_head, self._memo_flux = np.full(n, np.inf), np.full(n, np.inf), np.full(n, np.inf)
+        self._psi_out, self._k_out = np.full(n, np.nan), np.full(n, np.nan)
+
+        self.flux = np.zeros(n)
+        self.flux_c = np.zeros(n)
+        self._cavitation = None
+
+    def _lump_chains(self, k_max):
+        """Sets the maximum conductivity of the equivalent segments of the chains and the cumulated resistance of their
+        lumped segments from the maximum conductivity :arg:`k_max` of all the chain segments (chain by chain)."""
+        lumped_resistance = []
+        start = 0
+        for i in self.chain_heads:
+            resistance = np.cumsum(self._chain_length[i] / k_max[start:start + len(self._chain_length[i])])
+            start += len(self._chain_length[i])
+            self.length[i], self.k_max[i], self.dz[i] = 1., 1. / resistance[-1], self._chain_dz[i].sum()
+            lumped_resistance.extend(resistance[:-1])
+        self._lumped_resistance = np.array(lumped_resistance)
+        self._lumped_k_max = k_max[self._chain_lumped]
+
+    def _range(self, start_vid=None, stop_vid=None):
+        """Returns the (first, last + 1) indices of the segments traversed from :arg:`start_vid` to :arg:`stop_vid`,
+        following :func:`transient_xylem_water_potential`."""
+        first = 0 if start_vid is None else self.index[start_vid]
+        last = first + self.size[first]
+        if stop_vid is not None and first <= self.index.get(stop_vid, -1) < last:
+            last = self.index[stop_vid]
+        return first, last
+
+    def _sweep_levels(self, first, last):
+        """Returns, for each level of the segments between the indices :arg:`first` and :arg:`last`, the indices of its
+        stem segments, leaves and rhyzosphere segments."""
+        key = (first, last)
+        if key not in self._levels:
+            levels = []
+            indices = np.arange(first, last)
+            for level in np.unique(self.level[first:last]):
+                at_level = indices[self.level[first:last] == level]
+                node_type = self.node_type[at_level]
+                levels.append((at_level[node_type == _STEM], at_level[node_type == _LEAF],
+                               at_level[(node_type == _RHYZO0) | (node_type == _RHYZO)]))
+            self._levels[key] = levels
+        return self._levels[key]
+
+    def _read_psi(self, g):
+        """Returns the xylem water potential of the network segments from the mtg (`nan` where undefined)."""
+        psi_head = g.property('psi_head')
+        return np.array([psi_head.get(vid) for vid in self.vids], dtype=float)
+
+    def _write_psi(self, g, psi, k_act, first, last, psi_read=None):
+        """Attaches the water potential and actual conductivity of the segments between the indices :arg:`first` and
+        :arg:`last` to the mtg nodes, or only of those whose water potential differs from :arg:`psi_read` if given."""
+        indices = np.arange(first, last)
+        if psi_read is not None:
+            indices = indices[~(psi[first:last] == psi_read[first:last])]
+        vids = [self.vids[i] for i in indices]
+        g.properties().setdefault('psi_head', {}).update(zip(vids, psi[indices].tolist()))
+        g.properties().setdefault('KL', {}).update(
+            (vid, None if np.isnan(k) else k) for vid, k, node_type in
+            zip(vids, k_act[indices].tolist(), self.node_type[indices]) if node_type != _LEAF)
+
+    def _ancestors(self, indices):
+        """Returns the indices of the segments on the paths from the segments :arg:`indices` to the base, in decreasing
+        order (that is children before their parents)."""
+        marked = set()
+        for i in indices:
+            while i not in marked:
+                marked.add(i)
+                if i == 0:
+                    break
+                i = self.parent[i]
+        return np.array(sorted(marked, reverse=True), dtype=int)
+
+    def hydraulic_prop(self, g, mass_conv=18.01528, length_conv=1.e-2, a=2.6, b=2.0, min_kmax=0., compute_kmax=True):
+        """Computes water flux `Flux` and maximum hydraulic conductivity `Kmax` of each hydraulic segment, see
+        :func:`hydroshoot.hydraulic.hydraulic_prop` for details.
+
+        Notes:
+            :arg:`length_conv` is only given for compatibility, that of the network is used instead.
+
+        """
+        props = g.properties()
+        if compute_kmax:
+            self.k_max[self.stems] = [conductivity_max(diam, a, b, min_kmax) for diam in self.diameter[self.stems]]
+            props.setdefault('Kmax', {}).update((self.vids[i], self.k_max[i]) for i in self.stems)
+            props['Kmax'].update((self.vids[i], None) for i in self.rhyzo)
+            if len(self.chain_heads) > 0:
+                chain_k_max = np.array([conductivity_max(diam, a, b, min_kmax) for i in self.chain_heads
+                                        for diam in self._chain_diameter[i]])
+                props['Kmax'].update(zip(self._chain_vids, chain_k_max.tolist()))
+                self._lump_chains(chain_k_max)
+            self._memo_flux[:] = np.inf
+
+        transpiration, assimilation = props['E'], props['An']
+        leaf_flux = np.array([transpiration[vid] for vid in self.leaf_vids]) * mass_conv * 1.e-3 * self.leaf_area
+        leaf_flux_c = np.array([assimilation[vid] for vid in self.leaf_vids]) * self.leaf_area
+
+        if self.incremental and self._leaf_flux is not None:
+            changed = np.flatnonzero((leaf_flux != self._leaf_flux) | (leaf_flux_c != self._leaf_flux_c))
+            touched = self._ancestors(self.leaves[changed])
+            delta, delta_c = np.zeros(len(self.vids)), np.zeros(len(self.vids))
+            delta[self.leaves[changed]] = leaf_flux[changed] - self._leaf_flux[changed]
+            delta_c[self.leaves[changed]] = leaf_flux_c[changed] - self._leaf_flux_c[changed]
+            for i in touched[:-1]:
+                delta[self.parent[i]] += delta[i]
+                delta_c[self.parent[i]] += delta_c[i]
+            self.flux[touched] += delta[touched]
+            self.flux_c[touched] += delta_c[touched]
+            self.flux[self.leaves[changed]] = leaf_flux[changed]
+            self.flux_c[self.leaves[changed]] = leaf_flux_c[changed]
+        else:
+            self.flux[:] = 0.
+            self.flux_c[:] = 0.
+            self.flux[self.leaves] = leaf_flux
+            self.flux_c[self.leaves] = leaf_flux_c
+            for at_level in self._flux_levels:
+                np.add.at(self.flux, self.parent[at_level], self.flux[at_level])
+                np.add.at(self.flux_c, self.parent[at_level], self.flux_c[at_level])
+            touched = np.arange(len(self.vids))
+        self._leaf_flux, self._leaf_flux_c = leaf_flux, leaf_flux_c
+        self.n_touched_flux = len(touched)
+
+        vids = [self.vids[i] for i in touched]
+        props.setdefault('Flux', {}).update(zip(vids, self.flux[touched].tolist()))
+        props.setdefault('FluxC', {}).update(zip(vids, self.flux_c[touched].tolist()))
+        lumped = np.flatnonzero(np.in1d(self.lumped_head, touched))
+        props['Flux'].update((self.lumped_vids[i], self.flux[self.lumped_head[i]]) for i in lumped)
+        props['FluxC'].update((self.lumped_vids[i], self.flux_c[self.lumped_head[i]]) for i in lumped)
+
+        return g
+
+    def _stem_head(self, stems, psi_head, psi_base, model, fifty_cent, sig_slope, negligible_shoot_resistance):
+        """Returns the water potential at the head of the stem segments :arg:`stems` (before its bounding by the
+        minimum water potential) and their actual conductivity (`nan` where undefined), see
+        :func:`transient_xylem_water_potential`."""
+        gravity = rho * g_p * 1.e-6 * self.dz[stems]
+        if negligible_shoot_resistance:
+            return psi_base - gravity, np.full(len(stems), np.nan)
+        k_act = self.k_max[stems] * cavitation_factor(0.5 * (psi_head + psi_base), model, fifty_cent, sig_slope)
+        return psi_base - self.length[stems] * self.flux[stems] / k_act - gravity, k_act
+
+    def _rhyzo_head(self, i, psi_head, psi_base, dist_roots, rad_roots):
+        """Returns the water potential at the head of the rhyzosphere segment :arg:`i` (before its bounding by the
+        minimum water potential) and its actual conductivity (`nan` where undefined), see
+        :func:`transient_xylem_water_potential`."""
+        psi = 0.5 * (psi_head + psi_base)
+        flux = self.flux[i] * self.rhyzo_flux_conv[i]
+        if self.node_type[i] == _RHYZO0:
+            g_act = k_soil_root(k_soil_soil(psi, self.soil_class[i]), dist_roots, rad_roots)
+            return psi_base - (flux / g_act) * rho * g_p * 1.e-6, np.nan
+        k_act = k_soil_soil(psi, self.soil_class[i])
+        return psi_base - (self.length[i] * flux / k_act) * rho * g_p * 1.e-6, k_act
+
+    def _sweep(self, psi, psi_soil, first, last, model, psi_min, fifty_cent, sig_slope, dist_roots, rad_roots,
+               negligible_shoot_resistance, use_memo=True):
+        """Performs one sweep of :func:`transient_xylem_water_potential` on the arrays, updating :arg:`psi` in place.
+
+        With the incremental network, the segments whose inputs did not change keep the result of their last
+        computation, unless :arg:`use_memo` is False (all the segments are then recomputed, and memoised).
+
+        Returns:
+            (numpy.ndarray): actual conductivity of the segments (`nan` where undefined)
+
+        """
+        k_act = np.full(len(self.vids), np.nan)
+
+        for stems, leaves, rhyzo in self._sweep_levels(first, last):
+            if len(stems) > 0:
+                psi_base = psi[self.parent[stems]]
+                psi_base[stems == 0] = psi_soil
+                psi_head = np.where(np.isnan(psi[stems]), psi_base, psi[stems])
+                computed = stems
+                if self.incremental:
+                    if use_memo:
+                        # Segments whose inputs did not change keep the result of their last computation
+                        dirty = ~((np.abs(psi_base - self._memo_base[stems]) <= self.psi_tol) &
+                                  (np.abs(psi_head - self._memo_head[stems]) <= self.psi_tol) &
+                                  (self.flux[stems] == self._memo_flux[stems]))
+                        computed, psi_base, psi_head = stems[dirty], psi_base[dirty], psi_head[dirty]
+                    self._memo_base[computed] = psi_base
+                    self._memo_head[computed] = psi_head
+                    self._memo_flux[computed] = self.flux[computed]
+                psi_head, self._k_out[computed] = self._stem_head(computed, psi_head, psi_base, model, fifty_cent,
+                                                                  sig_slope, negligible_shoot_resistance)
+                self._psi_out[computed] = np.maximum(psi_min, psi_head)
+                psi[stems] = self._psi_out[stems]
+                k_act[stems] = self._k_out[stems]
+                self.n_touched_psi += len(computed)
+
+            for i in rhyzo:
+                psi_base = psi_soil if i == 0 else psi[self.parent[i]]
+                psi_head, k_act[i] = self._rhyzo_head(i, psi_base if np.isnan(psi[i]) else psi[i], psi_base,
+                                                      dist_roots, rad_roots)
+                psi[i] = max(psi_min, psi_head)
+            self.n_touched_psi += len(rhyzo)
+
+            if len(leaves) > 0:
+                psi[leaves] = psi[self.parent[leaves]]
+
+        return k_act
+
+    def transient_xylem_water_potential(self, g, model='tuzet', length_conv=1.e-2, psi_soil=-0.6, psi_min=-3.,
+                                        fifty_cent=-0.51, sig_slope=1., dist_roots=0.013, rad_roots=.0001,
+                                        negligible_shoot_resistance=False, start_vid=None, stop_vid=None,
+                                        use_memo=True):
+        """Computes a transient hydraulic structure of a plant shoot, see
+        :func:`hydroshoot.hydraulic.transient_xylem_water_potential` for details.
+
+        Args:
+            use_memo (bool): if False, all the segments of the incremental network are recomputed, whatever the change
+                of their inputs (e.g. when the sweep is differentiated by finite differences, whose perturbations are
+                below the tolerance :attr:`psi_tol`)
+
+        Notes:
+            :arg:`length_conv` is only given for compatibility, that of the network is used instead.
+
+        """
+        self._cavitation = (model, fifty_cent, sig_slope, psi_min, negligible_shoot_resistance)
+        first, last = self._range(start_vid, stop_vid)
+        psi = self._read_psi(g)
+        psi_read = psi.copy() if self.incremental else None
+        self.n_touched_psi = 0
+        k_act = self._sweep(psi, psi_soil, first, last, model, psi_min, fifty_cent, sig_slope, dist_roots, rad_roots,
+                            negligible_shoot_resistance, use_memo)
+        self._write_psi(g, psi, k_act, first, last, psi_read)
+
+    def xylem_water_potential(self, g, psi_soil=-0.8, model='tuzet', psi_min=-3.0, psi_error_crit=0.001, max_iter=100,
+                              length_conv=1.E-2, fifty_cent=-0.51, sig_slope=0.1, dist_roots=0.013, rad_roots=.0001,
+                              negligible_shoot_resistance=False, start_vid=None, stop_vid=None, psi_step=0.5,
+                              accelerator=None, deadline=None):
+        """Computes the hydraulic structure of plant's shoot, see :func:`hydroshoot.hydraulic.xylem_water_potential`
+        for details.
+
+        Returns:
+            (int): the number of iterations
+
+        Notes:
+            :arg:`length_conv` is only given for compatibility, that of the network is used instead.
+            If the network was built with `newton=True`, the computation is delegated to
+                :meth:`newton_xylem_water_potential` (:arg:`psi_step` and :arg:`accelerator` are then unused).
+
+        """
+        if self.newton:
+            return self.newton_xylem_water_potential(g, psi_soil, model, psi_min, psi_error_crit, max_iter,
+                                                     fifty_cent=fifty_cent, sig_slope=sig_slope, dist_roots=dist_roots,
+                                                     rad_roots=rad_roots,
+                                                     negligible_shoot_resistance=negligible_shoot_resistance,
+                                                     start_vid=start_vid, stop_vid=stop_vid, deadline=deadline)
+
+        self._cavitation = (model, fifty_cent, sig_slope, psi_min, negligible_shoot_resistance)
+        first, last = self._range(start_vid, stop_vid)
+        psi = self._read_psi(g)
+        psi_read = psi.copy() if self.incremental else None
+        self.n_touched_psi = 0
+        k_act = np.full(len(self.vids), np.nan)
+
+        counter = 0
+        psi_error = psi_error_crit
+
+        while psi_error >= psi_error_crit:
+            psi_prev = psi.copy()
+            k_act = self._sweep(psi, psi_soil, first, last, model, psi_min, fifty_cent, sig_slope, dist_roots,
+                                rad_roots, negligible_shoot_resistance)
+            psi_error = np.abs(psi_prev[first:last] - psi[first:last]).sum()
+
+            if accelerator is not None:
+                psi[first:last] = np.clip(accelerator.update(psi_prev[first:last], psi[first:last]), psi_min, None)
+                counter += 1
+                if counter > max_iter or (deadline is not None and time.time() > deadline):
+                    break
+                continue
+
+            if counter > max_iter:
+                # The numerical solution of the hydraulic structure did not converge, the last sweep is kept
+                psi_error = 0.
+            else:
+                psi[first:last] = psi_prev[first:last] + psi_step * (psi[first:last] - psi_prev[first:last])
+
+            counter += 1
+
+            if deadline is not None and time.time() > deadline:
+                break
+
+        self._write_psi(g, psi, k_act, first, last, psi_read)
+
+        return counter
+
+    def _newton_system(self, psi, psi_soil, first, last, model, psi_min, fifty_cent, sig_slope, dist_roots, rad_roots,
+                       negligible_shoot_resistance):
+        """Returns the residual of the hydraulic structure and its Jacobian for the segments between the indices
+        :arg:`first` and :arg:`last`.
+
+        Since the water potential at the head of a segment only depends on its own and its parent's water potentials,
+        the Jacobian is lower triangular (in pre-order) with a single off-diagonal entry per row.
+
+        Returns:
+            (tuple): residual, diagonal of the Jacobian, entry of the Jacobian on the parent column, and actual
+                conductivity of the segments (`nan` where undefined)
+
+        """
+        n = len(self.vids)
+        residual, jac_diag, jac_parent = np.zeros(n), np.ones(n), np.zeros(n)
+        k_act = np.full(n, np.nan)
+        indices = np.arange(first, last)
+        node_type = self.node_type[first:last]
+
+        stems = indices[node_type == _STEM]
+        self.n_touched_psi += np.count_nonzero(node_type != _LEAF)
+        psi_base = psi[self.parent[stems]]
+        psi_base[stems == 0] = psi_soil
+        psi_head, k_act[stems] = self._stem_head(stems, psi[stems], psi_base, model, fifty_cent, sig_slope,
+                                                 negligible_shoot_resistance)
+        residual[stems] = psi[stems] - np.maximum(psi_min, psi_head)
+        free = psi_head > psi_min
+        if negligible_shoot_resistance:
+            d_head = np.zeros(len(stems))
+        else:
+            d_head = 0.5 * self.length[stems] * self.flux[stems] * self.k_max[stems] * cavitation_factor_derivative(
+                0.5 * (psi[stems] + psi_base), model, fifty_cent, sig_slope) / k_act[stems] ** 2
+        jac_diag[stems] = np.where(free, 1. - d_head, 1.)
+        jac_parent[stems] = np.where(free & (stems != 0), -(1. + d_head), 0.)
+
+        leaves = indices[node_type == _LEAF]
+        residual[leaves] = psi[leaves] - psi[self.parent[leaves]]
+        jac_parent[leaves] = -1.
+
+        # The few rhyzosphere segments are derived by finite differences
+        delta_psi = 1.e-6
+        for i in indices[(node_type == _RHYZO0) | (node_type == _RHYZO)]:
+            psi_base = psi_soil if i == 0 else psi[self.parent[i]]
+            psi_head, k_act[i] = self._rhyzo_head(i, psi[i], psi_base, dist_roots, rad_roots)
+            residual[i] = psi[i] - max(psi_min, psi_head)
+            if psi_head > psi_min:
+                jac_diag[i] = 1. - (self._rhyzo_head(i, psi[i] + delta_psi, psi_base, dist_roots, rad_roots)[0] -
+                                    psi_head) / delta_psi
+                if i != 0:
+                    jac_parent[i] = -(self._rhyzo_head(i, psi[i], psi_base + delta_psi, dist_roots, rad_roots)[0] -
+                                      psi_head) / delta_psi
+
+        return residual, jac_diag, jac_parent, k_act
+
+    def newton_xylem_water_potential(self, g, psi_soil=-0.8, model='tuzet', psi_min=-3.0, psi_error_crit=0.001,
+                                     max_iter=100, length_conv=1.E-2, fifty_cent=-0.51, sig_slope=0.1,
+                                     dist_roots=0.013, rad_roots=.0001, negligible_shoot_resistance=False,
+                                     start_vid=None, stop_vid=None, deadline=None):
+        """Computes the hydraulic structure of plant's shoot by Newton iterations.
+
+        The Jacobian of the hydraulic structure being lower triangular in pre-order (see :meth:`_newton_system`), each
+        Newton step is solved in linear time by forward substitution, level by level from the base of the network. The
+        step is halved as long as it does not decrease the residual, and the iterations stop (keeping the current
+        water potential) if 10 halvings do not suffice.
+
+        Args:
+            See :func:`hydroshoot.hydraulic.xylem_water_potential`.
+
+        Returns:
+            (int): the number of Newton iterations
+
+        Notes:
+            At least one Newton iteration is performed (as is one sweep by
+                :func:`hydroshoot.hydraulic.xylem_water_potential`), then the iterations stop once the sum of the
+                absolute residuals of all segments is below :arg:`psi_error_crit`, which compares to the sum of the
+                absolute differences between two sweeps used by :func:`hydroshoot.hydraulic.xylem_water_potential`.
+            :arg:`length_conv` is only given for compatibility, that of the network is used instead.
+
+        """
+        self._cavitation = (model, fifty_cent, sig_slope, psi_min, negligible_shoot_resistance)
+        first, last = self._range(start_vid, stop_vid)
+        args = (psi_soil, first, last, model, psi_min, fifty_cent, sig_slope, dist_roots, rad_roots,
+                negligible_shoot_resistance)
+        psi = self._read_psi(g)
+        psi_read = psi.copy() if self.incremental else None
+        self.n_touched_psi = 0
+        if np.isnan(psi[first:last]).any():
+            self._sweep(psi, *args)
+        levels = [np.concatenate(level) for level in self._sweep_levels(first, last)]
+
+        residual, jac_diag, jac_parent, k_act = self._newton_system(psi, *args)
+        psi_error = np.abs(residual).sum()
+        counter = 0
+
+        while (counter == 0 or psi_error >= psi_error_crit) and counter < max_iter:
+            step = np.zeros(len(self.vids))
+            for level in levels:
+                step[level] = -(residual[level] + jac_parent[level] * step[self.parent[level]]) / jac_diag[level]
+
+            descent = False
+            for _ in range(10):
+                psi_trial = psi.copy()
+                psi_trial[first:last] = np.maximum(psi_min, psi[first:last] + step[first:last])
+                system = self._newton_system(psi_trial, *args)
+                psi_error_trial = np.abs(system[0]).sum()
+                if psi_error_trial <= psi_error:
+                    descent = True
+                    break
+                step *= 0.5
+            counter += 1
+
+            if not descent:
+                # No step decreases the residual: the current water potential is kept
+                break
+
+            psi, psi_error = psi_trial, psi_error_trial
+            residual, jac_diag, jac_parent, k_act = system
+
+            if deadline is not None and time.time() > deadline:
+                break
+
+        self._write_psi(g, psi, k_act, first, last, psi_read)
+
+        return counter
+
+    def sweep_jacobian_inverse(self, g, model='tuzet', psi_soil=-0.6, psi_min=-3., fifty_cent=-0.51, sig_slope=1.,
+                               dist_roots=0.013, rad_roots=.0001, negligible_shoot_resistance=False, start_vid=None,
+                               stop_vid=None):
+        """Returns the inverse of the Jacobian of the residual psi - S(psi), where S is a sweep of
+        :meth:`transient_xylem_water_potential`, at the water potential of the mtg.
+
+        The sweep propagating from the base upwards, the head of each segment is computed from the swept water potential
+        of its parent. With L the Jacobian of :meth:`_newton_system` and B its entries on the parent columns, the
+        Jacobian of the residual is then (I + B)^-1 L, whose inverse L^-1 (I + B) is applied in linear time by forward
+        substitution, level by level from the base of the network.
+
+        Args:
+            See :meth:`transient_xylem_water_potential`.
+
+        Returns:
+            (callable): function returning the product of the inverse Jacobian with an array of values of the segments
+                between :arg:`start_vid` and :arg:`stop_vid` (in the order of :attr:`vids`)
+
+        Notes:
+            The derivatives of the head of each segment are those of :meth:`_newton_system`, taken at the water
+                potential of its parent instead of the swept one, which is exact at a fixed point of the sweep (i.e. at
+                the solution of the hydraulic structure) and approximate elsewhere.
+            The sap flux is that of the last call to :meth:`hydraulic_prop`, its dependence on the water potential is
+                ignored.
+
+        """
+        first, last = self._range(start_vid, stop_vid)
+        _, jac_diag, jac_parent, _ = self._newton_system(self._read_psi(g), psi_soil, first, last, model, psi_min,
+                                                         fifty_cent, sig_slope, dist_roots, rad_roots,
+                                                         negligible_shoot_resistance)
+        levels = [np.concatenate(level) for level in self._sweep_levels(first, last)]
+
+        def _solve(values):
+            rhs, step = np.zeros(len(self.vids)), np.zeros(len(self.vids))
+            rhs[first:last] = values
+            for level in levels:
+                parent = self.parent[level]
+                step[level] = (rhs[level] + jac_parent[level] * (rhs[parent] - step[parent])) / jac_diag[level]
+            return step[first:last]
+
+        return _solve
+
+    def reconstruct_water_potential(self, g):
+        """Attaches to the lumped segments of a coarsened network their water potential `psi_head` and actual
+        conductivity `KL`.
+
+        The water potential drop along each chain is distributed among its segments according to their resistance and
+        height difference, the cavitation factor of all the chain segments being that of the equivalent segment. The
+        water potential of the chain ends is read from the mtg, as attached by the last computation of the hydraulic
+        structure.
+
+        """
+        if len(self.lumped_vids) == 0 or self._cavitation is None:
+            return
+
+        model, fifty_cent, sig_slope, psi_min, negligible_shoot_resistance = self._cavitation
+        psi_head = g.property('psi_head')
+        psi_chain_head = np.array([psi_head[self.vids[i]] for i in self.lumped_head])
+        psi_chain_base = np.array([psi_head[self.vids[self.parent[i]]] for i in self.lumped_head])
+        gravity = rho * g_p * 1.e-6 * self._lumped_dz
+
+        if negligible_shoot_resistance:
+            psi = psi_chain_base - gravity
+            k_act = [None] * len(self.lumped_vids)
+        else:
+            k_reduction = cavitation_factor(0.5 * (psi_chain_head + psi_chain_base), model, fifty_cent, sig_slope)
+            psi = psi_chain_base - self.flux[self.lumped_head] * self._lumped_resistance / k_reduction - gravity
+            k_act = (self._lumped_k_max * k_reduction).tolist()
+
+        psi_head.update(zip(self.lumped_vids, np.maximum(psi_min, psi).tolist()))
+        g.properties().setdefault('KL', {}).update(zip(self.lumped_vids, k_act))
+
@@ -6,6 +6,9 @@ plant shoot geometry.
 TODO: plug to the standard interface of Caribu module.
 """
 
+import time
+from multiprocessing import Pool, cpu_count
+import numpy as np
 from numpy import array, deg2rad
 from pandas import date_range
 from pytz import timezone, utc
@@ -19,6 +22,10 @@ import alinea.astk.icosphere as ico
 
 from hydroshoot.architecture import vector_rotation
 
+# State of the irradiance worker processes (see :func:`irradiance_pool`): the mtg, inherited from the parent process,
+# and the Caribu scenes of the worker
+_worker_state = {}
+
 
 def local2solar(local_time, latitude, longitude, time_zone, temperature=25.):
     """Calculates UTC time and Solar time in decimal hours (solar noon is 12.00), based on
@@ -127,9 +134,55 @@ def e_conv_PPFD(irradiance_unit):
         raise TypeError("E_type must be one of the following 'Rg_Watt/m2', 'RgPAR_Watt/m2' or'PPFD_umol/m2/s'.")
 
 
+def is_night(meteo, irradiance_unit):
+    """Checks whether the incident irradiance is null over the given meteo data.
+
+    Args:
+        meteo (DataFrame): meteo data having either a 'Rg' or a 'PPFD' column, see :func:`irradiance_distribution`
+        irradiance_unit (str): unit of the irradiance flux density,
+            one of ('Rg_Watt/m2', 'RgPAR_Watt/m2', 'PPFD_umol/m2/s')
+
+    Returns:
+        (bool): True if no irradiance is received
+
+    """
+    if irradiance_unit.split('_')[0] == 'PPFD':
+        energy = meteo.PPFD
+    else:
+        energy = meteo.Rg
+    return not (energy > 0).any()
+
+
+def sky_directions(turtle_sectors='46', turtle_format='uoc', icosphere_level=None):
+    """Returns the directions of the diffuse irradiance sources distributed over the sky dome.
+
+    Args:
+        turtle_sectors (str): number of turtle sectors (see :func:`turtle` from `sky_tools` package)
+        turtle_format (str): format irradiance distribution, could be 'soc', or 'uoc'
+            (see :func:`turtle` from `sky_tools` package for details)
+        icosphere_level (int): the level of refinement of the dual icosphere
+            (see :func:`alinea.astk.icosphere.turtle_dome` for details)
+
+    Returns:
+        (list of tuple): (x, y, z) directions of the diffuse irradiance sources
+
+    """
+    if not icosphere_level:
+        energy, emission, direction, elevation, azimuth = turtle.turtle(sectors=turtle_sectors,
+                                                                        format=turtle_format,
+                                                                        energy=1.)
+    else:
+        vert, fac = ico.turtle_dome(icosphere_level)
+        direction = ico.sample_faces(vert, fac, iter=None, spheric=False).values()
+        direction = [idirect[0] for idirect in direction]
+        direction = map(lambda x: tuple(list(x[:2]) + [-x[2]]), direction)
+
+    return list(direction)
+
+
 def irradiance_distribution(meteo, geo_location, irradiance_unit,
                             time_zone='Europe/Paris', turtle_sectors='46', turtle_format='uoc',
-                            sun2scene=None, rotation_angle=0., icosphere_level=None):
+                            sun2scene=None, rotation_angle=0., icosphere_level=None, diffuse_sky=True):
     """Calculates irradiance distribution over a semi-hemisphere surrounding the plant [umol m-2 s-1].
 
     Args:
@@ -153,6 +206,9 @@ def irradiance_distribution(meteo, geo_location, irradiance_unit,
             direction of X-axis
         icosphere_level (int): the level of refinement of the dual icosphere
             (see :func:`alinea.astk.icosphere.turtle_dome` for details)
+        diffuse_sky (bool): if False, the diffuse irradiance is not distributed over the sky dome and only the sources
+            of direct irradiance (sun positions) are returned, the diffuse irradiance being then accounted for by
+            :func:`diffuse_interception` and :func:`diffuse_irradiance`
 
     Returns:
         [umol m-2 s-1] tuple of tuples, cumulative irradiance flux densities distributed across the semi-hemisphere
@@ -170,6 +226,7 @@ def irradiance_distribution(meteo, geo_location, irradiance_unit,
     """
     diffuse_ratio = []
     nrj_sum = 0
+    direction = sky_directions(turtle_sectors, turtle_format, icosphere_level) if diffuse_sky else []
     for idate, date in enumerate(meteo.index):
 
         if irradiance_unit.split('_')[0] == 'PPFD':
@@ -203,17 +260,7 @@ def irradiance_distribution(meteo, geo_location, irradiance_unit,
         irradiance_dir = (1 - diffuse_ratio_hourly) * energy
 
         # diffuse irradiance
-        if not icosphere_level:
-            energy2, emission, direction, elevation, azimuth = turtle.turtle(sectors=turtle_sectors,
-                                                                             format=turtle_format,
-                                                                             energy=irradiance_diff)
-        else:
-            vert, fac = ico.turtle_dome(icosphere_level)
-            direction = ico.sample_faces(vert, fac, iter=None, spheric=False).values()
-            direction = [idirect[0] for idirect in direction]
-            direction = map(lambda x: tuple(list(x[:2]) + [-x[2]]), direction)
-
-        sky = zip(len(direction) * [irradiance_diff / len(direction)], direction)
+        sky = [(irradiance_diff / len(direction), idirect) for idirect in direction]
 
         # direct irradiance
         sun = Gensun.Gensun()(Rsun=irradiance_dir, DOY=doy_utc, heureTU=hour_utc, lat=latitude)
@@ -265,10 +312,32 @@ def irradiance_distribution(meteo, geo_location, irradiance_unit,
     return source_cum, diffuse_ratio
 
 
+def diffuse_irradiance(meteo, irradiance_unit, diffuse_ratio):
+    """Calculates the diffuse irradiance flux density cumulated over the given meteo data [umol m-2 s-1].
+
+    Args:
+        meteo (DataFrame): meteo data having either a 'Rg' or a 'PPFD' column, see :func:`irradiance_distribution`
+        irradiance_unit (str): unit of the irradiance flux density,
+            one of ('Rg_Watt/m2', 'RgPAR_Watt/m2', 'PPFD_umol/m2/s')
+        diffuse_ratio (float): [-] diffuse-to-total irradiance ratio, as returned by :func:`irradiance_distribution`
+
+    Returns:
+        (float): [umol m-2 s-1] diffuse irradiance, that is the total energy of the sky sources returned by
+            :func:`irradiance_distribution`
+
+    """
+    if irradiance_unit.split('_')[0] == 'PPFD':
+        energy = meteo.PPFD.sum()
+    else:
+        energy = meteo.Rg.sum()
+    return diffuse_ratio * energy * e_conv_PPFD(irradiance_unit)
+
+
 def hsCaribu(mtg, unit_scene_length, geometry='geometry', opticals='opticals', consider=None,
              source=None, direct=True,
              infinite=False,
-             nz=50, ds=0.5, pattern=None, soil_reflectance=0.15):
+             nz=50, ds=0.5, pattern=None, soil_reflectance=0.15, stats=None, diffuse=None, caribu_scene=None,
+             pool=None, source_chunks=None):
     """Calculates intercepted and absorbed irradiance flux densities by the plant canopy.
 
     Args:
@@ -287,17 +356,39 @@ def hsCaribu(mtg, unit_scene_length, geometry='geometry', opticals='opticals', c
         ds: see :func:`runCaribu` from `CaribuScene` package
         pattern: see :func:`runCaribu` from `CaribuScene` package
         soil_reflectance (float): [-] the reflectance of the soil (between 0 and 1)
+        stats (SolverStats): if given, Caribu runs are counted and timed in this
+            :class:`hydroshoot.stats.SolverStats` object (the times of building and running the scenes of the worker
+            processes are only included in the total time)
+        diffuse (tuple): if given, the diffuse irradiance [umol m-2 s-1] (cf. :func:`diffuse_irradiance`) and the
+            irradiance intercepted and absorbed under a unit diffuse sky (cf. :func:`diffuse_interception`), which
+            are added to the irradiance of :arg:`source`
+        caribu_scene (CaribuScene): if given, a scene returned by a previous call, whose light sources only are
+            updated, the scene arguments (:arg:`geometry`, :arg:`opticals`, :arg:`consider`, :arg:`pattern`,
+            :arg:`soil_reflectance` and :arg:`unit_scene_length`) being then ignored
+        pool (multiprocessing.Pool): if given, a pool of worker processes created by :func:`irradiance_pool` for the
+            same mtg, among which the light sources are split, each worker running Caribu for a chunk of sources
+        source_chunks (int): number of chunks of light sources dispatched to :arg:`pool`, if None (default) the
+            number of CPUs is used
 
     Returns:
         mtg object with the incident irradiance (`Ei`) and absorbed irradiance (`Eabs`), both in [umol m-2 s-1],
             attached to mtg vertices as properties.
+        the CaribuScene object, None if no Caribu run was needed (null irradiance) and :arg:`caribu_scene` is None
+            (:arg:`caribu_scene` if the sources are split among worker processes)
 
     Notes:
         `Ei` and `Eabs` units are returned in [umol m-2 s-1] **REGARDLESS** of the `unit_scence_length` type.
+        Building the scene (triangulation of the geometry, optical properties and pattern) is a significant part of
+            the cost of a call, which reusing a scene (:arg:`caribu_scene`) saves as long as the geometry and optical
+            properties of the mtg do not change.
+        The irradiance is linear in the energy of the light sources, hence that of a set of sources is the sum of the
+            irradiance of any partition of this set. When the sources are split among worker processes, they are
+            partitioned into consecutive chunks whose results are summed in the order of the chunks, so that a given
+            number of chunks always gives the same result, equal to that of a single run up to the roundoff errors.
+            Each worker builds its Caribu scene once, at its first chunk.
 
     """
-    assert geometry in mtg.property_names()
-    assert opticals in mtg.property_names()
+    t_start = time.time()
 
     # Currently used as a dummy variable
     wave_band = 'SW'
@@ -305,6 +396,35 @@ def hsCaribu(mtg, unit_scene_length, geometry='geometry', opticals='opticals', c
     if source is None:
         source = [(1, (0, 0, -1))]
 
+    if pool is not None and len(source) > 1:
+        scene_args = (geometry, opticals, consider, pattern, soil_reflectance, unit_scene_length)
+        run_args = (direct, infinite, nz, ds)
+        chunks = [list(chunk) for chunk in _source_chunks(source, source_chunks or cpu_count())]
+        results = pool.map(_chunk_interception, [(chunk, scene_args, run_args) for chunk in chunks])
+        for prop in ('Ei', 'Eabs'):
+            mtg.properties()[prop] = {vid: sum([result[prop][vid] for result in results]) for vid in results[0][prop]}
+        if stats is not None:
+            stats.caribu_calls += len(chunks)
+        _add_diffuse(mtg, diffuse)
+        if stats is not None:
+            stats.caribu_time += time.time() - t_start
+        return mtg, caribu_scene
+
+    if caribu_scene is not None:
+        if sum([x[0] for x in source]) == 0.:
+            mtg.properties()['Ei'] = {k: 0. for k in caribu_scene.scene}
+            mtg.properties()['Eabs'] = {k: 0. for k in caribu_scene.scene}
+        else:
+            caribu_scene.light = source
+            _run_caribu(mtg, caribu_scene, wave_band, direct, infinite, ds, nz, stats)
+        _add_diffuse(mtg, diffuse)
+        if stats is not None:
+            stats.caribu_time += time.time() - t_start
+        return mtg, caribu_scene
+
+    assert geometry in mtg.property_names()
+    assert opticals in mtg.property_names()
+
     # Hack : would be much better to have geometry as a caribuscene args directly
     geom0 = mtg.property(geometry)
     geometry0 = {}
@@ -330,18 +450,15 @@ def hsCaribu(mtg, unit_scene_length, geometry='geometry', opticals='opticals', c
             opts = {wave_band: mtg.property(opticals)}
 
             # Setup CaribuScene
+            t_scene = time.time()
             caribu_scene = CaribuScene(mtg, light=source, opt=opts,
                                        soil_reflectance={wave_band: soil_reflectance},
                                        scene_unit=unit_scene_length,
                                        pattern=pattern)
+            if stats is not None:
+                stats.caribu_scene_time += time.time() - t_scene
 
-            # Run caribu
-            raw, aggregated = caribu_scene.run(direct=direct, infinite=infinite, d_sphere=ds, layers=nz,
-                                               split_face=False)
-
-            # Attaching output to MTG
-            mtg.properties()['Ei'] = aggregated[wave_band]['Ei']
-            mtg.properties()['Eabs'] = aggregated[wave_band]['Eabs']
+            _run_caribu(mtg, caribu_scene, wave_band, direct, infinite, ds, nz, stats)
     except:
         pass
     finally:
@@ -352,4 +469,380 @@ def hsCaribu(mtg, unit_scene_length, geometry='geometry', opticals='opticals', c
             if len(geometry0) > 0:
                 mtg.properties()['geometry'] = geometry0
 
+    _add_diffuse(mtg, diffuse)
+    if stats is not None:
+        stats.caribu_time += time.time() - t_start
+
     return mtg, caribu_scene
+
+
+def _run_caribu(mtg, caribu_scene, wave_band, direct, infinite, ds, nz, stats):
+    """Runs Caribu on :arg:`caribu_scene` and attaches the `Ei` and `Eabs` outputs to the mtg
+    (cf. :func:`hsCaribu`)."""
+    t_run = time.time()
+    raw, aggregated = caribu_scene.run(direct=direct, infinite=infinite, d_sphere=ds, layers=nz, split_face=False)
+    if stats is not None:
+        stats.caribu_calls += 1
+        stats.caribu_run_time += time.time() - t_run
+
+    # Attaching output to MTG
+    mtg.properties()['Ei'] = aggregated[wave_band]['Ei']
+    mtg.properties()['Eabs'] = aggregated[wave_band]['Eabs']
+
+
+def _source_chunks(source, n_chunks):
+    """Partitions the light sources into (at most) :arg:`n_chunks` consecutive chunks of nearly equal lengths."""
+    n_chunks = max(1, min(n_chunks, len(source)))
+    bounds = [len(source) * i // n_chunks for i in range(n_chunks + 1)]
+    return [source[bounds[i]:bounds[i + 1]] for i in range(n_chunks)]
+
+
+def _chunk_interception(job):
+    """Computes the irradiance of a chunk of light sources on the mtg of :data:`_worker_state` (cf. :func:`hsCaribu`).
+    """
+    source, scene_args, run_args = job
+    geometry, opticals, consider, pattern, soil_reflectance, unit_scene_length = scene_args
+    direct, infinite, nz, ds = run_args
+    mtg = _worker_state['mtg']
+
+    # The scene is built at the first chunk of the worker, then only its light sources are updated
+    scenes = _worker_state.setdefault('chunk_scenes', {})
+    key = repr(scene_args)
+    mtg, caribu_scene = hsCaribu(mtg, unit_scene_length, geometry, opticals, consider, source, direct, infinite, nz,
+                                 ds, pattern, soil_reflectance, caribu_scene=scenes.get(key))
+    if caribu_scene is not None:
+        scenes[key] = caribu_scene
+
+    return {prop: dict(mtg.property(prop)) for prop in ('Ei', 'Eabs')}
+
+
+def _add_diffuse(mtg, diffuse):
+    """Adds the irradiance of a diffuse sky to the `Ei` and `Eabs` properties of the mtg (cf. :func:`hsCaribu`)."""
+    if diffuse is not None:
+        diffuse_energy, unit_interception = diffuse
+        for prop in ('Ei', 'Eabs'):
+            mtg.properties()[prop] = {vid: value + diffuse_energy * unit_interception[prop][vid]
+                                      for vid, value in mtg.property(prop).iteritems()}
+
+
+def diffuse_interception(mtg, unit_scene_length, turtle_sectors='46', turtle_format='uoc', rotation_angle=0.,
+                         icosphere_level=None, **kwargs):
+    """Calculates the irradiance flux densities intercepted and absorbed by the plant canopy under a unit diffuse sky.
+
+    Args:
+        mtg (MTG): plant Multiscale Tree Graph
+        unit_scene_length (str): the unit of length used for scene coordinate and for pattern
+            (should be one of `CaribuScene.units` default)
+        turtle_sectors (str): number of turtle sectors (see :func:`turtle` from `sky_tools` package)
+        turtle_format (str): format irradiance distribution, could be 'soc', or 'uoc'
+            (see :func:`turtle` from `sky_tools` package for details)
+        rotation_angle (float): [°] counter clockwise azimuth between the default X-axis direction (South) and real
+            direction of X-axis
+        icosphere_level (int): the level of refinement of the dual icosphere
+            (see :func:`alinea.astk.icosphere.turtle_dome` for details)
+        **kwargs: other arguments of :func:`hsCaribu`
+
+    Returns:
+        (dict): the incident (`Ei`) and absorbed (`Eabs`) irradiance of the mtg vertices per unit diffuse irradiance
+            [-], each given as a {vid: value} dictionary
+
+    Notes:
+        The directions of the sky sources do not change from one time step to the other and Caribu is linear in the
+            energy of the sources. The irradiance intercepted under any diffuse sky is hence that of the unit sky times
+            the diffuse irradiance. Passing the result of this function to :func:`hsCaribu` (:arg:`diffuse`) together
+            with the sun sources only (see :arg:`diffuse_sky` in :func:`irradiance_distribution`) saves the sky
+            sources from each Caribu run.
+        The `Ei` and `Eabs` properties of the mtg are left unchanged.
+
+    """
+    direction = sky_directions(turtle_sectors, turtle_format, icosphere_level)
+    if rotation_angle != 0.:
+        direction = [tuple(vector_rotation(vec, (0., 0., 1.), deg2rad(rotation_angle))) for vec in direction]
+    sky = [(1. / len(direction), vec) for vec in direction]
+
+    return _interception(mtg, unit_scene_length, sky, **kwargs)[0]
+
+
+def _interception(mtg, unit_scene_length, source, **kwargs):
+    """Returns the `Ei` and `Eabs` dictionaries computed by :func:`hsCaribu` for :arg:`source`, leaving the `Ei` and
+    `Eabs` properties of the mtg unchanged, and the CaribuScene object."""
+    previous = _irradiance_properties(mtg)
+    mtg, caribu_scene = hsCaribu(mtg, unit_scene_length, source=source, **kwargs)
+    interception = {prop: dict(mtg.property(prop)) for prop in ('Ei', 'Eabs')}
+    _restore_irradiance_properties(mtg, previous)
+
+    return interception, caribu_scene
+
+
+def _irradiance_properties(mtg):
+    """Returns the `Ei` and `Eabs` properties of the mtg, if any."""
+    return {prop: mtg.properties()[prop] for prop in ('Ei', 'Eabs') if prop in mtg.property_names()}
+
+
+def _restore_irradiance_properties(mtg, previous):
+    """Restores the `Ei` and `Eabs` properties of the mtg returned by :func:`_irradiance_properties`."""
+    for prop in ('Ei', 'Eabs'):
+        if prop in previous:
+            mtg.properties()[prop] = previous[prop]
+        elif prop in mtg.property_names():
+            mtg.remove_property(prop)
+
+
+def interception_basis(mtg, unit_scene_length, elevation_step=5., azimuth_step=10., **kwargs):
+    """Calculates the irradiance flux densities intercepted and absorbed by the plant canopy under unit sources
+    distributed over a regular grid of sky directions.
+
+    Args:
+        mtg (MTG): plant Multiscale Tree Graph
+        unit_scene_length (str): the unit of length used for scene coordinate and for pattern
+            (should be one of `CaribuScene.units` default)
+        elevation_step (float): [°] elevation step of the grid, whose elevations range from
+            :arg:`elevation_step` to 90°
+        azimuth_step (float): [°] azimuth step of the grid, whose azimuths range from 0 to 360° (the step is rounded
+            so as to divide 360°)
+        **kwargs: other arguments of :func:`hsCaribu`
+
+    Returns:
+        (dict): the interception basis, having the following keys:
+            elevation (numpy.ndarray): [°] elevations of the grid
+            azimuth (numpy.ndarray): [°] azimuths of the grid
+            vid (list): ids of the mtg vertices
+            Ei (numpy.ndarray): [-] incident irradiance of the vertices per unit source energy, an array of shape
+                (elevation, azimuth, vertex)
+            Eabs (numpy.ndarray): [-] absorbed irradiance of the vertices per unit source energy, same shape as `Ei`
+
+    Notes:
+        The basis only depends on the geometry and optical properties of the canopy and can be computed once per
+            simulation, at the expense of one Caribu run per direction of the grid (on a single scene, see
+            :arg:`caribu_scene` in :func:`hsCaribu`). The irradiance of any set of sources is then interpolated from
+            the basis without running Caribu (see :func:`basis_interception`), the accuracy of which can be checked
+            against Caribu by :func:`interception_basis_error`.
+        The `Ei` and `Eabs` properties of the mtg are left unchanged.
+
+    """
+    elevation = np.arange(90., 0., -elevation_step)[::-1]
+    azimuth = np.linspace(0., 360., int(round(360. / azimuth_step)), endpoint=False)
+
+    basis = {'elevation': elevation, 'azimuth': azimuth, 'vid': None}
+    caribu_scene = kwargs.pop('caribu_scene', None)
+    for i, elev in enumerate(elevation):
+        for j, azim in enumerate(azimuth):
+            interception, caribu_scene = _interception(mtg, unit_scene_length, [(1., _source_direction(elev, azim))],
+                                                       caribu_scene=caribu_scene, **kwargs)
+            if basis['vid'] is None:
+                basis['vid'] = sorted(interception['Ei'])
+                for prop in ('Ei', 'Eabs'):
+                    basis[prop] = np.zeros((len(elevation), len(azimuth), len(basis['vid'])))
+            for prop in ('Ei', 'Eabs'):
+                basis[prop][i, j] = [interception[prop][vid] for vid in basis['vid']]
+
+    return basis
+
+
+def _source_direction(elevation, azimuth):
+    """Returns the (x, y, z) direction of a source located at the given elevation and azimuth [°]."""
+    elevation, azimuth = deg2rad(elevation), deg2rad(azimuth)
+    return np.cos(elevation) * np.cos(azimuth), np.cos(elevation) * np.sin(azimuth), -np.sin(elevation)
+
+
+def _basis_weights(basis, direction):
+    """Returns the indices and the weights of the four grid directions of :arg:`basis` surrounding
+    :arg:`direction`, for a bilinear interpolation in elevation and azimuth."""
+    x, y, z = direction
+    elevation = np.rad2deg(np.arcsin(min(1., -z / np.sqrt(x ** 2 + y ** 2 + z ** 2))))
+    azimuth = np.rad2deg(np.arctan2(y, x)) % 360.
+
+    elevations = basis['elevation']
+    elevation = min(max(elevation, elevations[0]), elevations[-1])
+    i = int(np.clip(np.searchsorted(elevations, elevation, side='right') - 1, 0, max(0, len(elevations) - 2)))
+    i_next = min(i + 1, len(elevations) - 1)
+    w_elevation = (elevation - elevations[i]) / (elevations[i_next] - elevations[i]) if i_next > i else 0.
+
+    azimuths = basis['azimuth']
+    position = azimuth / (360. / len(azimuths))
+    j = int(position) % len(azimuths)
+    j_next = (j + 1) % len(azimuths)
+    w_azimuth = position - int(position)
+
+    return (((i, j), (1. - w_elevation) * (1. - w_azimuth)), ((i, j_next), (1. - w_elevation) * w_azimuth),
+            ((i_next, j), w_elevation * (1. - w_azimuth)), ((i_next, j_next), w_elevation * w_azimuth))
+
+
+def basis_interception(mtg, basis, source, diffuse=None):
+    """Calculates intercepted and absorbed irradiance flux densities by the plant canopy by interpolation of an
+    interception basis, without running Caribu.
+
+    Args:
+        mtg (MTG): plant Multiscale Tree Graph
+        basis (dict): interception basis of the canopy, as returned by :func:`interception_basis`
+        source (list): a tuple of tuples, giving energy unit and sky coordinates (see :func:`hsCaribu`)
+        diffuse (tuple): if given, the diffuse irradiance and the interception of a unit diffuse sky, which are added
+            to the irradiance of :arg:`source` (see :func:`hsCaribu`)
+
+    Returns:
+        mtg object with the incident irradiance (`Ei`) and absorbed irradiance (`Eabs`), both in [umol m-2 s-1],
+            attached to mtg vertices as properties.
+
+    Notes:
+        The interception of each source is bilinearly interpolated in elevation and azimuth between the four
+            surrounding directions of the basis, sources lower than the first elevation of the basis being given the
+            interception at this elevation.
+
+    """
+    for prop in ('Ei', 'Eabs'):
+        mtg.properties()[prop] = dict(zip(basis['vid'], _basis_values(basis, source, prop).tolist()))
+
+    _add_diffuse(mtg, diffuse)
+
+    return mtg
+
+
+def _basis_values(basis, source, prop):
+    """Returns the array of the values of :arg:`prop` ('Ei' or 'Eabs') of the vertices of :arg:`basis` interpolated
+    for :arg:`source`."""
+    values = np.zeros(len(basis['vid']))
+    for energy, direction in source:
+        if energy > 0:
+            for index, weight in _basis_weights(basis, direction):
+                values += energy * weight * basis[prop][index]
+    return values
+
+
+def interception_basis_error(mtg, unit_scene_length, basis, source, leaf_lbl_prefix='L', **kwargs):
+    """Compares the leaf irradiance interpolated from an interception basis to that computed by Caribu.
+
+    Args:
+        mtg (MTG): plant Multiscale Tree Graph
+        unit_scene_length (str): the unit of length used for scene coordinate and for pattern
+            (should be one of `CaribuScene.units` default)
+        basis (dict): interception basis of the canopy, as returned by :func:`interception_basis`
+        source (list): a tuple of tuples, giving energy unit and sky coordinates (see :func:`hsCaribu`)
+        leaf_lbl_prefix (str): prefix of the label of the leaves
+        **kwargs: other arguments of :func:`hsCaribu`
+
+    Returns:
+        (dict): errors of the interpolated incident irradiance (`Ei`) of the leaves, having the following keys:
+            rmse (float): [umol m-2 s-1] root mean square error
+            max (float): [umol m-2 s-1] maximum absolute error
+            total (float): [-] relative error on the sum of `Ei` over the leaves
+
+    Notes:
+        The `Ei` and `Eabs` properties of the mtg are left unchanged.
+
+    """
+    reference = _interception(mtg, unit_scene_length, source, **kwargs)[0]['Ei']
+    interpolated = dict(zip(basis['vid'], _basis_values(basis, source, 'Ei')))
+
+    leaves = [vid for vid in reference if mtg.node(vid).label.startswith(leaf_lbl_prefix)]
+    error = np.array([interpolated[vid] - reference[vid] for vid in leaves])
+    total = sum(reference[vid] for vid in leaves)
+
+    return {'rmse': np.sqrt(np.mean(error ** 2)),
+            'max': abs(error).max(),
+            'total': abs(error.sum()) / total if total > 0 else 0.}
+
+
+def irradiance_pool(mtg, processes=None):
+    """Creates a pool of worker processes computing the irradiance interception of the given mtg.
+
+    Args:
+        mtg (MTG): plant Multiscale Tree Graph
+        processes (int): number of worker processes, if None (default) the number of CPUs is used
+
+    Returns:
+        (multiprocessing.Pool): the pool of worker processes, to be passed to :func:`irradiance_time_series` or
+            :func:`hsCaribu`
+
+    Notes:
+        The mtg is not sent to the workers but inherited by them when the pool is created (fork start method of POSIX
+            systems). Its geometry and optical properties must hence not change during the lifetime of the pool.
+        The pool should be closed by the caller once the irradiance is computed.
+
+    """
+    _worker_state.clear()
+    _worker_state['mtg'] = mtg
+    return Pool(processes)
+
+
+def _hourly_interception(job):
+    """Computes the irradiance of one time step on the mtg of :data:`_worker_state` (cf.
+    :func:`irradiance_time_series`)."""
+    meteo, geo_location, irradiance_unit, time_zone, turtle_sectors, turtle_format, rotation_angle, \
+        unit_scene_length, diffuse, persistent_scene, kwargs = job
+    mtg = _worker_state['mtg']
+
+    source, diffuse_ratio = irradiance_distribution(meteo, geo_location, irradiance_unit, time_zone, turtle_sectors,
+                                                    turtle_format, None, rotation_angle, None, diffuse is None)
+    if diffuse is not None:
+        diffuse = (diffuse_irradiance(meteo, irradiance_unit, diffuse_ratio), diffuse)
+
+    mtg, caribu_scene = hsCaribu(mtg, unit_scene_length, source=source, diffuse=diffuse,
+                                 caribu_scene=_worker_state.get('caribu_scene'), **kwargs)
+    if persistent_scene and caribu_scene is not None:
+        _worker_state['caribu_scene'] = caribu_scene
+
+    return dict(mtg.property('Ei')), dict(mtg.property('Eabs')), diffuse_ratio
+
+
+def irradiance_time_series(mtg, meteo, geo_location, irradiance_unit, unit_scene_length, time_zone='Europe/Paris',
+                           turtle_sectors='46', turtle_format='uoc', rotation_angle=0., diffuse_interception=None,
+                           persistent_scene=False, pool=None, **kwargs):
+    """Calculates the intercepted and absorbed irradiance flux densities of each time step of the given meteo data.
+
+    Args:
+        mtg (MTG): plant Multiscale Tree Graph
+        meteo (DataFrame): meteo data, see :func:`irradiance_distribution`
+        geo_location: tuple of (latitude [°], longitude [°], elevation [°])
+        irradiance_unit (str): unit of the irradiance flux density,
+            one of ('Rg_Watt/m2', 'RgPAR_Watt/m2', 'PPFD_umol/m2/s')
+        unit_scene_length (str): the unit of length used for scene coordinate and for pattern
+            (should be one of `CaribuScene.units` default)
+        time_zone (str): a 'pytz.timezone' (e.g. 'Europe/Paris')
+        turtle_sectors (str): number of turtle sectors (see :func:`turtle` from `sky_tools` package)
+        turtle_format (str): format irradiance distribution, could be 'soc', or 'uoc'
+            (see :func:`turtle` from `sky_tools` package for details)
+        rotation_angle (float): [°] counter clockwise azimuth between the default X-axis direction (South) and real
+            direction of X-axis
+        diffuse_interception (dict): if given, the interception of a unit diffuse sky (see
+            :func:`diffuse_interception`), Caribu being then run for the sun positions only
+        persistent_scene (bool): if True, each process builds its Caribu scene once and reuses it for all its time
+            steps (see :arg:`caribu_scene` in :func:`hsCaribu`)
+        pool (multiprocessing.Pool): if given, a pool of worker processes created by :func:`irradiance_pool` for the
+            same mtg, among which the time steps are dispatched, otherwise they are computed one after the other
+        **kwargs: other arguments of :func:`hsCaribu`
+
+    Returns:
+        (dict): the irradiance time series, having the following keys:
+            vid (list): ids of the mtg vertices
+            time (DatetimeIndex): the time steps, that is the index of :arg:`meteo`
+            Ei (numpy.ndarray): [umol m-2 s-1] incident irradiance, an array of shape (vertex, time step)
+            Eabs (numpy.ndarray): [umol m-2 s-1] absorbed irradiance, same shape as `Ei`
+            diffuse_ratio (numpy.ndarray): [-] diffuse-to-total irradiance ratio of each time step
+
+    Notes:
+        The irradiance only depends on the (static) geometry of the plant and on the meteo data, not on the state of
+            the plant, hence it can be computed for all the time steps of a simulation before solving the
+            physiological processes.
+        The `Ei` and `Eabs` properties of the mtg are left unchanged.
+
+    """
+    jobs = [(meteo.iloc[[i], :], geo_location, irradiance_unit, time_zone, turtle_sectors, turtle_format,
+             rotation_angle, unit_scene_length, diffuse_interception, persistent_scene, kwargs)
+            for i in range(len(meteo))]
+
+    if pool is not None:
+        results = pool.map(_hourly_interception, jobs)
+    else:
+        previous = _irradiance_properties(mtg)
+        _worker_state.clear()
+        _worker_state['mtg'] = mtg
+        results = map(_hourly_interception, jobs)
+        _worker_state.clear()
+        _restore_irradiance_properties(mtg, previous)
+
+    vids = sorted(results[0][0]) if results else []
+    return {'vid': vids,
+            'time': meteo.index,
+            'Ei': np.array([[ei[vid] for vid in vids] for ei, eabs, diffuse_ratio in results]).T,
+            'Eabs': np.array([[eabs[vid] for vid in vids] for ei, eabs, diffuse_ratio in results]).T,
+            'diffuse_ratio': np.array([diffuse_ratio for ei, eabs, diffuse_ratio in results])}
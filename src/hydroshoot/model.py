@@ -2,8 +2,8 @@
 """This module performs a complete comutation scheme: irradiance absorption, gas-exchange, hydraulic structure,
 energy-exchange, and soil water depletion, for each given time step.
 """
+import time
 import numpy as np
-from copy import deepcopy
 from os.path import isfile
 from datetime import datetime, timedelta
 from pandas import read_csv, DataFrame, date_range, DatetimeIndex, merge
@@ -14,290 +14,463 @@ from openalea.plantgl.all import Scene, surface
 from hydroshoot import (architecture, irradiance, exchange, hydraulic, energy,
                         display, solver)
 from hydroshoot.params import Params
+from hydroshoot.recorder import Recorder, default_variables
+from hydroshoot.stats import SolverStats, log, summary_keys
 
 
-def run(g, wd, scene=None, write_result=True, **kwargs):
-    """
-    Calculates leaf gas and energy exchange in addition to the hydraulic structure of an individual plant.
+class Simulation(object):
+    """Simulation engine computing leaf gas and energy exchange in addition to the hydraulic structure of an individual
+    plant, one time step at a time.
+
+    All the static setup (reading parameters and meteorological data, form factors, soil and rhyzosphere components,
+    optical properties, the nitrogen profile and the hydraulic network) is performed once at instantiation. Time steps
+    are then computed by calling :meth:`step` with one row of meteorological data, or by consuming the :meth:`iterate`
+    generator, which yields the outputs of each time step of the simulation period as soon as they are computed.
 
     :Parameters:
     - **g**: a multiscale tree graph object
     - **wd**: string, working directory
     - **scene**: PlantGl scene
-    - **kwargs** can include:
-        - **psi_soil**: [MPa] predawn soil water potential
-        - **gdd_since_budbreak**: [°Cd] growing degree-day since bubreak
-        - **sun2scene**: PlantGl scene, when prodivided, a sun object (sphere) is added to it
-        - **soil_size**: [cm] length of squared mesh size
+    - **kwargs**: see :func:`run`
+
+    :Example:
+        >>> sim = Simulation(g, wd, psi_soil=-0.5, gdd_since_budbreak=1000.)
+        >>> for outputs in sim.iterate():
+        ...     if outputs['E'] > 100.:
+        ...         break
     """
-    print '++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'
-    print '+ Project: ', wd
-    print '++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++'
-    time_on = datetime.now()
 
-    # Read user parameters
-    params_path = wd + 'params.json'
-    params = Params(params_path)
+    def __init__(self, g, wd, scene=None, **kwargs):
+        # Read user parameters
+        params_path = wd + 'params.json'
+        params = Params(params_path)
+
+        verbosity = kwargs.get('verbosity', params.simulation.verbosity)
+        params.energy.linearized = kwargs.get('linearized_energy', params.energy.linearized)
+
+        log(verbosity, 1, '++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++')
+        log(verbosity, 1, '+ Project: ', wd)
+        log(verbosity, 1, '++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++')
+
+        output_index = params.simulation.output_index
+
+        # ==============================================================================
+        # Initialisation
+        # ==============================================================================
+        #   Climate data
+        meteo_path = wd + params.simulation.meteo
+        meteo_tab = read_csv(meteo_path, sep=';', decimal='.', header=0)
+        meteo_tab.time = DatetimeIndex(meteo_tab.time)
+        meteo_tab = meteo_tab.set_index(meteo_tab.time)
+
+        #   Adding missing data
+        if 'Ca' not in meteo_tab.columns:
+            meteo_tab['Ca'] = [400.] * len(meteo_tab)  # ppm [CO2]
+        if 'Pa' not in meteo_tab.columns:
+            meteo_tab['Pa'] = [101.3] * len(meteo_tab)  # atmospheric pressure
+
+        #   Determination of the simulation period
+        sdate = datetime.strptime(params.simulation.sdate, "%Y-%m-%d %H:%M:%S")
+        edate = datetime.strptime(params.simulation.edate, "%Y-%m-%d %H:%M:%S")
+        datet = date_range(sdate, edate, freq='H')
+        meteo = meteo_tab.ix[datet]
+        time_conv = {'D': 86.4e3, 'H': 3600., 'T': 60., 'S': 1.}[datet.freqstr]
+
+        # Reading available pre-dawn soil water potential data
+        if 'psi_soil' in kwargs:
+            psi_pd = DataFrame([kwargs['psi_soil']] * len(meteo.time),
+                               index=meteo.time, columns=['psi'])
+        else:
+            assert (isfile(wd + 'psi_soil.input')), "The 'psi_soil.input' file is missing."
+            psi_pd = read_csv(wd + 'psi_soil.input', sep=';', decimal='.').set_index('time')
+            psi_pd.index = [datetime.strptime(s, "%Y-%m-%d") for s in psi_pd.index]
+
+        # Unit length conversion (from scene unit to the standard [m]) unit)
+        unit_scene_length = params.simulation.unit_scene_length
+        length_conv = {'mm': 1.e-3, 'cm': 1.e-2, 'm': 1.}[unit_scene_length]
+
+        # Determination of cumulative degree-days parameter
+        t_base = params.phenology.t_base
+        budbreak_date = datetime.strptime(params.phenology.emdate, "%Y-%m-%d %H:%M:%S")
+
+        if 'gdd_since_budbreak' in kwargs:
+            gdd_since_budbreak = kwargs['gdd_since_budbreak']
+        elif min(meteo_tab.index) <= budbreak_date:
+            tdays = date_range(budbreak_date, sdate, freq='D')
+            tmeteo = meteo_tab.ix[tdays].Tac.to_frame()
+            tmeteo = tmeteo.set_index(DatetimeIndex(tmeteo.index).normalize())
+            df_min = tmeteo.groupby(tmeteo.index).aggregate(np.min).Tac
+            df_max = tmeteo.groupby(tmeteo.index).aggregate(np.max).Tac
+            # df_tt = merge(df_max, df_min, how='inner', left_index=True, right_index=True)
+            # df_tt.columns = ('max', 'min')
+            # df_tt['gdd'] = df_tt.apply(lambda x: 0.5 * (x['max'] + x['min']) - t_base)
+            # gdd_since_budbreak = df_tt['gdd'].cumsum()[-1]
+            df_tt = 0.5 * (df_min + df_max) - t_base
+            gdd_since_budbreak = df_tt.cumsum()[-1]
+        else:
+            raise ValueError('Cumulative degree-days temperature is not provided.')
 
-    output_index = params.simulation.output_index
+        log(verbosity, 1, 'GDD since budbreak = %d °Cd' % gdd_since_budbreak)
 
-    # ==============================================================================
-    # Initialisation
-    # ==============================================================================
-    #   Climate data
-    meteo_path = wd + params.simulation.meteo
-    meteo_tab = read_csv(meteo_path, sep=';', decimal='.', header=0)
-    meteo_tab.time = DatetimeIndex(meteo_tab.time)
-    meteo_tab = meteo_tab.set_index(meteo_tab.time)
-
-    #   Adding missing data
-    if 'Ca' not in meteo_tab.columns:
-        meteo_tab['Ca'] = [400.] * len(meteo_tab)  # ppm [CO2]
-    if 'Pa' not in meteo_tab.columns:
-        meteo_tab['Pa'] = [101.3] * len(meteo_tab)  # atmospheric pressure
-
-    #   Determination of the simulation period
-    sdate = datetime.strptime(params.simulation.sdate, "%Y-%m-%d %H:%M:%S")
-    edate = datetime.strptime(params.simulation.edate, "%Y-%m-%d %H:%M:%S")
-    datet = date_range(sdate, edate, freq='H')
-    meteo = meteo_tab.ix[datet]
-    time_conv = {'D': 86.4e3, 'H': 3600., 'T': 60., 'S': 1.}[datet.freqstr]
-
-    # Reading available pre-dawn soil water potential data
-    if 'psi_soil' in kwargs:
-        psi_pd = DataFrame([kwargs['psi_soil']] * len(meteo.time),
-                           index=meteo.time, columns=['psi'])
-    else:
-        assert (isfile(wd + 'psi_soil.input')), "The 'psi_soil.input' file is missing."
-        psi_pd = read_csv(wd + 'psi_soil.input', sep=';', decimal='.').set_index('time')
-        psi_pd.index = [datetime.strptime(s, "%Y-%m-%d") for s in psi_pd.index]
-
-    # Unit length conversion (from scene unit to the standard [m]) unit)
-    unit_scene_length = params.simulation.unit_scene_length
-    length_conv = {'mm': 1.e-3, 'cm': 1.e-2, 'm': 1.}[unit_scene_length]
-
-    # Determination of cumulative degree-days parameter
-    t_base = params.phenology.t_base
-    budbreak_date = datetime.strptime(params.phenology.emdate, "%Y-%m-%d %H:%M:%S")
-
-    if 'gdd_since_budbreak' in kwargs:
-        gdd_since_budbreak = kwargs['gdd_since_budbreak']
-    elif min(meteo_tab.index) <= budbreak_date:
-        tdays = date_range(budbreak_date, sdate, freq='D')
-        tmeteo = meteo_tab.ix[tdays].Tac.to_frame()
-        tmeteo = tmeteo.set_index(DatetimeIndex(tmeteo.index).normalize())
-        df_min = tmeteo.groupby(tmeteo.index).aggregate(np.min).Tac
-        df_max = tmeteo.groupby(tmeteo.index).aggregate(np.max).Tac
-        # df_tt = merge(df_max, df_min, how='inner', left_index=True, right_index=True)
-        # df_tt.columns = ('max', 'min')
-        # df_tt['gdd'] = df_tt.apply(lambda x: 0.5 * (x['max'] + x['min']) - t_base)
-        # gdd_since_budbreak = df_tt['gdd'].cumsum()[-1]
-        df_tt = 0.5 * (df_min + df_max) - t_base
-        gdd_since_budbreak = df_tt.cumsum()[-1]
-    else:
-        raise ValueError('Cumulative degree-days temperature is not provided.')
-
-    print 'GDD since budbreak = %d °Cd' % gdd_since_budbreak
-
-    # Determination of perennial structure arms (for grapevine)
-    # arm_vid = {g.node(vid).label: g.node(vid).components()[0]._vid for vid in g.VtxList(Scale=2) if
-    #            g.node(vid).label.startswith('arm')}
-
-    # Soil reservoir dimensions (inter row, intra row, depth) [m]
-    soil_dimensions = params.soil.soil_dimensions
-    soil_total_volume = soil_dimensions[0] * soil_dimensions[1] * soil_dimensions[2]
-    rhyzo_coeff = params.soil.rhyzo_coeff
-    rhyzo_total_volume = rhyzo_coeff * np.pi * min(soil_dimensions[:2]) ** 2 / 4. * soil_dimensions[2]
-
-    # Counter clockwise angle between the default X-axis direction (South) and
-    # the real direction of X-axis.
-    scene_rotation = params.irradiance.scene_rotation
-
-    # Sky and cloud temperature [degreeC]
-    t_sky = params.energy.t_sky
-    t_cloud = params.energy.t_cloud
-
-    # Topological location
-    latitude = params.simulation.latitude
-    longitude = params.simulation.longitude
-    elevation = params.simulation.elevation
-    geo_location = (latitude, longitude, elevation)
-
-    # Pattern
-    ymax, xmax = map(lambda dim: dim / length_conv, soil_dimensions[:2])
-    pattern = ((-xmax / 2.0, -ymax / 2.0), (xmax / 2.0, ymax / 2.0))
-
-    # Label prefix of the collar internode
-    vtx_label = params.mtg_api.collar_label
-
-    # Label prefix of the leaves
-    leaf_lbl_prefix = params.mtg_api.leaf_lbl_prefix
-
-    # Label prefices of stem elements
-    stem_lbl_prefix = params.mtg_api.stem_lbl_prefix
-
-    E_type = params.irradiance.E_type
-    tzone = params.simulation.tzone
-    turtle_sectors = params.irradiance.turtle_sectors
-    icosphere_level = params.irradiance.icosphere_level
-    turtle_format = params.irradiance.turtle_format
-
-    limit = params.energy.limit
-    energy_budget = params.simulation.energy_budget
-    solo = params.energy.solo
-    simplified_form_factors = params.simulation.simplified_form_factors
-    print 'Energy_budget: %s' % energy_budget
-
-    # Optical properties
-    opt_prop = params.irradiance.opt_prop
-
-    print 'Hydraulic structure: %s' % params.simulation.hydraulic_structure
-
-    psi_min = params.hydraulic.psi_min
-
-    # Parameters of leaf Nitrogen content-related models
-    Na_dict = params.exchange.Na_dict
-
-    # Computation of the form factor matrix
-    form_factors=None
-    if energy_budget:
-        print 'Computing form factors...'
-        if not simplified_form_factors:
-            form_factors = energy.form_factors_matrix(g, pattern, length_conv, limit=limit)
-        else:
-            form_factors = energy.form_factors_simplified(g, pattern=pattern, infinite=True, leaf_lbl_prefix=leaf_lbl_prefix,
-                                           turtle_sectors=turtle_sectors, icosphere_level=icosphere_level,
-                                           unit_scene_length=unit_scene_length)
+        # Determination of perennial structure arms (for grapevine)
+        # arm_vid = {g.node(vid).label: g.node(vid).components()[0]._vid for vid in g.VtxList(Scale=2) if
+        #            g.node(vid).label.startswith('arm')}
+
+        # Soil reservoir dimensions (inter row, intra row, depth) [m]
+        soil_dimensions = params.soil.soil_dimensions
+        soil_total_volume = soil_dimensions[0] * soil_dimensions[1] * soil_dimensions[2]
+        rhyzo_coeff = params.soil.rhyzo_coeff
+        rhyzo_total_volume = rhyzo_coeff * np.pi * min(soil_dimensions[:2]) ** 2 / 4. * soil_dimensions[2]
+
+        # Counter clockwise angle between the default X-axis direction (South) and
+        # the real direction of X-axis.
+        scene_rotation = params.irradiance.scene_rotation
 
-    # Soil class
-    soil_class = params.soil.soil_class
-    print 'Soil class: %s' % soil_class
+        # Sky and cloud temperature [degreeC]
+        t_sky = params.energy.t_sky
+        t_cloud = params.energy.t_cloud
 
-    # Rhyzosphere concentric radii determination
-    rhyzo_radii = params.soil.rhyzo_radii
-    rhyzo_number = len(rhyzo_radii)
+        # Topological location
+        latitude = params.simulation.latitude
+        longitude = params.simulation.longitude
+        elevation = params.simulation.elevation
+        geo_location = (latitude, longitude, elevation)
 
-    # Add rhyzosphere elements to mtg
-    rhyzo_solution = params.soil.rhyzo_solution
-    print 'rhyzo_solution: %s' % rhyzo_solution
+        # Pattern
+        ymax, xmax = map(lambda dim: dim / length_conv, soil_dimensions[:2])
+        pattern = ((-xmax / 2.0, -ymax / 2.0), (xmax / 2.0, ymax / 2.0))
 
-    if rhyzo_solution:
-        dist_roots, rad_roots = params.soil.roots
-        if not any(item.startswith('rhyzo') for item in g.property('label').values()):
+        # Label prefix of the collar internode
+        vtx_label = params.mtg_api.collar_label
+
+        # Label prefix of the leaves
+        leaf_lbl_prefix = params.mtg_api.leaf_lbl_prefix
+
+        # Label prefices of stem elements
+        stem_lbl_prefix = params.mtg_api.stem_lbl_prefix
+
+        E_type = params.irradiance.E_type
+        tzone = params.simulation.tzone
+        turtle_sectors = params.irradiance.turtle_sectors
+        icosphere_level = params.irradiance.icosphere_level
+        turtle_format = params.irradiance.turtle_format
+
+        limit = params.energy.limit
+        energy_budget = params.simulation.energy_budget
+        solo = params.energy.solo
+        simplified_form_factors = params.simulation.simplified_form_factors
+        log(verbosity, 1, 'Energy_budget: %s' % energy_budget)
+
+        # Optical properties
+        opt_prop = params.irradiance.opt_prop
+
+        log(verbosity, 1, 'Hydraulic structure: %s' % params.simulation.hydraulic_structure)
+
+        psi_min = params.hydraulic.psi_min
+
+        # Parameters of leaf Nitrogen content-related models
+        Na_dict = params.exchange.Na_dict
+
+        # Computation of the form factor matrix
+        form_factors=None
+        if energy_budget:
+            log(verbosity, 1, 'Computing form factors...')
+            if not simplified_form_factors:
+                form_factors = energy.form_factors_matrix(g, pattern, length_conv, limit=limit)
+            else:
+                form_factors = energy.form_factors_simplified(g, pattern=pattern, infinite=True, leaf_lbl_prefix=leaf_lbl_prefix,
+                                               turtle_sectors=turtle_sectors, icosphere_level=icosphere_level,
+                                               unit_scene_length=unit_scene_length,
+                                               stats=SolverStats(verbosity))
+
+        # Soil class
+        soil_class = params.soil.soil_class
+        log(verbosity, 1, 'Soil class: %s' % soil_class)
+
+        # Rhyzosphere concentric radii determination
+        rhyzo_radii = params.soil.rhyzo_radii
+        rhyzo_number = len(rhyzo_radii)
+
+        # Add rhyzosphere elements to mtg
+        rhyzo_solution = params.soil.rhyzo_solution
+        log(verbosity, 1, 'rhyzo_solution: %s' % rhyzo_solution)
+
+        if rhyzo_solution:
+            dist_roots, rad_roots = params.soil.roots
+            if not any(item.startswith('rhyzo') for item in g.property('label').values()):
+                vid_collar = architecture.mtg_base(g, vtx_label=vtx_label)
+                vid_base = architecture.add_soil_components(g, rhyzo_number, rhyzo_radii,
+                                                            soil_dimensions, soil_class, vtx_label)
+            else:
+                vid_collar = g.node(g.root).vid_collar
+                vid_base = g.node(g.root).vid_base
+
+                radius_prev = 0.
+
+                for ivid, vid in enumerate(g.Ancestors(vid_collar)[1:]):
+                    radius = rhyzo_radii[ivid]
+                    g.node(vid).Length = radius - radius_prev
+                    g.node(vid).depth = soil_dimensions[2] / length_conv  # [m]
+                    g.node(vid).TopDiameter = radius * 2.
+                    g.node(vid).BotDiameter = radius * 2.
+                    g.node(vid).soil_class = soil_class
+                    radius_prev = radius
+
+        else:
+            dist_roots, rad_roots = None, None
+            # Identifying and attaching the base node of a single MTG
             vid_collar = architecture.mtg_base(g, vtx_label=vtx_label)
-            vid_base = architecture.add_soil_components(g, rhyzo_number, rhyzo_radii,
-                                                        soil_dimensions, soil_class, vtx_label)
+            vid_base = vid_collar
+
+        g.node(g.root).vid_base = vid_base
+        g.node(g.root).vid_collar = vid_collar
+
+        # Initializing sapflow to 0
+        for vtx_id in traversal.pre_order2(g, vid_base):
+            g.node(vtx_id).Flux = 0.
+
+        # Addition of a soil element
+        if 'Soil' not in g.properties()['label'].values():
+            if 'soil_size' in kwargs:
+                if kwargs['soil_size'] > 0.:
+                    architecture.add_soil(g, kwargs['soil_size'])
+            else:
+                architecture.add_soil(g, 500.)
+
+        # Suppression of undesired geometry for light and energy calculations
+        geom_prop = g.properties()['geometry']
+        vidkeys = []
+        for vid in g.properties()['geometry']:
+            n = g.node(vid)
+            if not n.label.startswith(('L', 'other', 'soil')):
+                vidkeys.append(vid)
+        [geom_prop.pop(x) for x in vidkeys]
+        g.properties()['geometry'] = geom_prop
+
+        # Attaching optical properties to MTG elements
+        g = irradiance.optical_prop(g, leaf_lbl_prefix=leaf_lbl_prefix,
+                                    stem_lbl_prefix=stem_lbl_prefix, wave_band='SW',
+                                    opt_prop=opt_prop)
+
+        # Irradiance intercepted under a unit diffuse sky, whose directions do not change over the simulation
+        if params.irradiance.precompute_diffuse or params.irradiance.interception_basis:
+            log(verbosity, 1, 'Computing diffuse irradiance interception...')
+            diffuse_interception = irradiance.diffuse_interception(g, unit_scene_length, turtle_sectors, turtle_format,
+                                                                   scene_rotation, None, direct=False, infinite=True,
+                                                                   nz=50, ds=0.5, pattern=pattern)
         else:
-            vid_collar = g.node(g.root).vid_collar
-            vid_base = g.node(g.root).vid_base
-
-            radius_prev = 0.
-
-            for ivid, vid in enumerate(g.Ancestors(vid_collar)[1:]):
-                radius = rhyzo_radii[ivid]
-                g.node(vid).Length = radius - radius_prev
-                g.node(vid).depth = soil_dimensions[2] / length_conv  # [m]
-                g.node(vid).TopDiameter = radius * 2.
-                g.node(vid).BotDiameter = radius * 2.
-                g.node(vid).soil_class = soil_class
-                radius_prev = radius
-
-    else:
-        dist_roots, rad_roots = None, None
-        # Identifying and attaching the base node of a single MTG
-        vid_collar = architecture.mtg_base(g, vtx_label=vtx_label)
-        vid_base = vid_collar
-
-    g.node(g.root).vid_base = vid_base
-    g.node(g.root).vid_collar = vid_collar
-
-    # Initializing sapflow to 0
-    for vtx_id in traversal.pre_order2(g, vid_base):
-        g.node(vtx_id).Flux = 0.
-
-    # Addition of a soil element
-    if 'Soil' not in g.properties()['label'].values():
-        if 'soil_size' in kwargs:
-            if kwargs['soil_size'] > 0.:
-                architecture.add_soil(g, kwargs['soil_size'])
+            diffuse_interception = None
+
+        # Irradiance intercepted under unit sources over a grid of sky directions, from which that of the sun is
+        # interpolated
+        if params.irradiance.interception_basis:
+            log(verbosity, 1, 'Computing irradiance interception basis...')
+            basis = irradiance.interception_basis(g, unit_scene_length, params.irradiance.basis_elevation_step,
+                                                  params.irradiance.basis_azimuth_step, direct=False, infinite=True,
+                                                  nz=50, ds=0.5, pattern=pattern)
+            # Accuracy of the basis against Caribu for the sun positions of the first simulated day
+            sun_source, _ = irradiance.irradiance_distribution(meteo.iloc[:24], geo_location, E_type, tzone,
+                                                               turtle_sectors, turtle_format, None, scene_rotation,
+                                                               None, False)
+            basis_error = irradiance.interception_basis_error(g, unit_scene_length, basis, sun_source,
+                                                              leaf_lbl_prefix, direct=False, infinite=True, nz=50,
+                                                              ds=0.5, pattern=pattern)
+            log(verbosity, 1, 'Interception basis error on leaf Ei: rmse = %.3g, max = %.3g, total = %.2g %%'
+                % (basis_error['rmse'], basis_error['max'], 100. * basis_error['total']))
         else:
-            architecture.add_soil(g, 500.)
-
-    # Suppression of undesired geometry for light and energy calculations
-    geom_prop = g.properties()['geometry']
-    vidkeys = []
-    for vid in g.properties()['geometry']:
-        n = g.node(vid)
-        if not n.label.startswith(('L', 'other', 'soil')):
-            vidkeys.append(vid)
-    [geom_prop.pop(x) for x in vidkeys]
-    g.properties()['geometry'] = geom_prop
-
-    # Attaching optical properties to MTG elements
-    g = irradiance.optical_prop(g, leaf_lbl_prefix=leaf_lbl_prefix,
-                                stem_lbl_prefix=stem_lbl_prefix, wave_band='SW',
-                                opt_prop=opt_prop)
-
-    # Estimation of Nitroen surface-based content according to Prieto et al. (2012)
-    # Estimation of intercepted irradiance over past 10 days:
-    if not 'Na' in g.property_names():
-        print 'Computing Nitrogen profile...'
-        assert (sdate - min(
-            meteo_tab.index)).days >= 10, 'Meteorological data do not cover 10 days prior to simulation date.'
-
-        ppfd10_date = sdate + timedelta(days=-10)
-        ppfd10t = date_range(ppfd10_date, sdate, freq='H')
-        ppfd10_meteo = meteo_tab.ix[ppfd10t]
-        caribu_source, RdRsH_ratio = irradiance.irradiance_distribution(ppfd10_meteo, geo_location, E_type,
-                                                                        tzone, turtle_sectors, turtle_format,
-                                                                        None, scene_rotation, None)
-
-        # Compute irradiance interception and absorbtion
-        g, caribu_scene = irradiance.hsCaribu(mtg=g,
-                                              unit_scene_length=unit_scene_length,
-                                              source=caribu_source, direct=False,
-                                              infinite=True, nz=50, ds=0.5,
-                                              pattern=pattern)
-
-        g.properties()['Ei10'] = {vid: g.node(vid).Ei * time_conv / 10. / 1.e6 for vid in g.property('Ei').keys()}
-
-        # Estimation of leaf surface-based nitrogen content:
-        for vid in g.VtxList(Scale=3):
-            if g.node(vid).label.startswith(leaf_lbl_prefix):
-                g.node(vid).Na = exchange.leaf_Na(gdd_since_budbreak, g.node(vid).Ei10,
-                                                  Na_dict['aN'],
-                                                  Na_dict['bN'],
-                                                  Na_dict['aM'],
-                                                  Na_dict['bM'])
-
-    # Define path to folder
-    output_path = wd + 'output' + output_index + '/'
-
-    # Save geometry in an external file
-    # HSArc.mtg_save_geometry(scene, output_path)
+            basis = None
 
-    # ==============================================================================
-    # Simulations
-    # ==============================================================================
+        caribu_scene = None
+        caribu_stats = SolverStats(verbosity)
 
-    sapflow = []
-    # sapEast = []
-    # sapWest = []
-    an_ls = []
-    rg_ls = []
-    psi_stem = {}
-    Tlc_dict = {}
-    Ei_dict = {}
-    an_dict = {}
-    gs_dict = {}
-
-    # The time loop +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
-    for date in meteo.time:
-        print "=" * 72
-        print 'Date', date, '\n'
-
-        # Select of meteo data
-        imeteo = meteo[meteo.time == date]
+        # Pool of worker processes computing either the hourly irradiance of the simulation before it starts or, at
+        # each time step, the irradiance of chunks of the light sources
+        precompute_hourly = params.irradiance.precompute_hourly and basis is None
+        if precompute_hourly or (params.irradiance.split_sources and basis is None):
+            pool = irradiance.irradiance_pool(g, params.irradiance.processes)
+        else:
+            pool = None
+        caribu_kwargs = dict(direct=False, infinite=True, nz=50, ds=0.5, pattern=pattern)
+
+        # Estimation of Nitroen surface-based content according to Prieto et al. (2012)
+        # Estimation of intercepted irradiance over past 10 days:
+        if not 'Na' in g.property_names():
+            log(verbosity, 1, 'Computing Nitrogen profile...')
+            assert (sdate - min(
+                meteo_tab.index)).days >= 10, 'Meteorological data do not cover 10 days prior to simulation date.'
+
+            ppfd10_date = sdate + timedelta(days=-10)
+            ppfd10t = date_range(ppfd10_date, sdate, freq='H')
+            ppfd10_meteo = meteo_tab.ix[ppfd10t]
+            caribu_source, RdRsH_ratio = irradiance.irradiance_distribution(ppfd10_meteo, geo_location, E_type,
+                                                                            tzone, turtle_sectors, turtle_format,
+                                                                            None, scene_rotation, None,
+                                                                            diffuse_interception is None)
+            if diffuse_interception is not None:
+                diffuse = (irradiance.diffuse_irradiance(ppfd10_meteo, E_type, RdRsH_ratio), diffuse_interception)
+            else:
+                diffuse = None
+
+            # Compute irradiance interception and absorbtion
+            if basis is not None:
+                g = irradiance.basis_interception(g, basis, caribu_source, diffuse)
+            elif precompute_hourly:
+                # The irradiance intercepted over the 10 days is the sum of that of each hour
+                ppfd10_series = irradiance.irradiance_time_series(g, ppfd10_meteo, geo_location, E_type,
+                                                                  unit_scene_length, tzone, turtle_sectors,
+                                                                  turtle_format, scene_rotation, diffuse_interception,
+                                                                  params.irradiance.persistent_scene, pool,
+                                                                  **caribu_kwargs)
+                for prop in ('Ei', 'Eabs'):
+                    g.properties()[prop] = dict(zip(ppfd10_series['vid'], ppfd10_series[prop].sum(axis=1)))
+            else:
+                g, caribu_scene = irradiance.hsCaribu(mtg=g,
+                                                      unit_scene_length=unit_scene_length,
+                                                      source=caribu_source, direct=False,
+                                                      infinite=True, nz=50, ds=0.5,
+                                                      pattern=pattern, diffuse=diffuse, pool=pool,
+                                                      stats=caribu_stats)
+
+            g.properties()['Ei10'] = {vid: g.node(vid).Ei * time_conv / 10. / 1.e6 for vid in g.property('Ei').keys()}
+
+            # Estimation of leaf surface-based nitrogen content:
+            for vid in g.VtxList(Scale=3):
+                if g.node(vid).label.startswith(leaf_lbl_prefix):
+                    g.node(vid).Na = exchange.leaf_Na(gdd_since_budbreak, g.node(vid).Ei10,
+                                                      Na_dict['aN'],
+                                                      Na_dict['bN'],
+                                                      Na_dict['aM'],
+                                                      Na_dict['bM'])
+
+        # Irradiance of the (daytime) time steps of the simulation
+        if precompute_hourly:
+            log(verbosity, 1, 'Computing hourly irradiance interception...')
+            day_meteo = meteo[[not (params.simulation.night_mode and irradiance.is_night(meteo.iloc[[i]], E_type))
+                               for i in range(len(meteo))]]
+            irradiance_series = irradiance.irradiance_time_series(g, day_meteo, geo_location, E_type,
+                                                                  unit_scene_length, tzone, turtle_sectors,
+                                                                  turtle_format, scene_rotation, diffuse_interception,
+                                                                  params.irradiance.persistent_scene, pool,
+                                                                  **caribu_kwargs)
+            pool.close()
+            pool.join()
+            pool = None
+        else:
+            irradiance_series = None
+
+        # Photosynthetic capacities, which only depend on the (fixed) nitrogen content of the leaves
+        photo_capacities = exchange.leaf_photo_capacities(g, params.exchange.par_photo_N, leaf_lbl_prefix)
+
+        # Solver of the hydraulic structure, which only depends on the plant geometry
+        hydraulics = solver.hydraulic_solver(g, length_conv, params)
+
+        # Define path to folder
+        output_path = wd + 'output' + output_index + '/'
+
+        # Save geometry in an external file
+        # HSArc.mtg_save_geometry(scene, output_path)
+
+        self.g = g
+        self.wd = wd
+        self.scene = scene
+        self.kwargs = kwargs
+        self.params = params
+        self.verbosity = verbosity
+
+        self.meteo = meteo
+        self.psi_pd = psi_pd
+        self.psi_soil = kwargs.get('psi_soil', None)
+        self.time_conv = time_conv
+        self.length_conv = length_conv
+        self.unit_scene_length = unit_scene_length
+        self.geo_location = geo_location
+        self.pattern = pattern
+        self.diffuse_interception = diffuse_interception
+        self.interception_basis = basis
+        self.caribu_scene = caribu_scene if params.irradiance.persistent_scene else None
+        self._caribu_scene_time = caribu_stats.caribu_scene_time
+        self.irradiance_series = irradiance_series
+        self.irradiance_pool = pool
+        self.photo_capacities = photo_capacities
+        self.hydraulics = hydraulics
+
+        self.soil_class = soil_class
+        self.soil_area = soil_dimensions[0] * soil_dimensions[1]
+        self.soil_total_volume = soil_total_volume
+        self.rhyzo_total_volume = rhyzo_total_volume
+        self.psi_min = psi_min
+
+        self.form_factors = form_factors
+        self.simplified_form_factors = simplified_form_factors
+
+        self.vid_collar = vid_collar
+        self.vid_base = vid_base
+        self.output_path = output_path
+
+        self._psi_history = []
+        self._t_history = []
+
+        self.step_time_budget = kwargs.get('step_time_budget', params.numerical_resolution.step_time_budget)
+        self.run_time_budget = kwargs.get('run_time_budget', params.numerical_resolution.run_time_budget)
+        self._run_start = None
+
+        recorded_vertices = sorted(set(traversal.pre_order2(g, vid_base)) | set(g.property('geometry')))
+        self.recorder = Recorder(recorded_vertices, meteo.time, kwargs.get('recorded_variables', default_variables))
+
+    def step(self, meteo_row):
+        """Computes irradiance absorption, gas-exchange, hydraulic structure and energy-exchange for one time step.
+
+        :Parameters:
+        - **meteo_row**: DataFrame, meteorological data of the time step (a single row indexed by time)
+
+        :Returns:
+        - (dict) plant-scale outputs of the time step, having the following keys:
+            - **time**: datetime of the time step
+            - **Rg**: [W m-2 ground] intercepted global radiation
+            - **An**: [umol s-1] plant net carbon assimilation
+            - **E**: [g T-1] plant transpiration
+            - **Tleaf**: [°C] median leaf temperature
+            - **psi_soil**: [MPa] soil water potential
+            - **night**: bool, True if the time step was computed with the night mode (see
+                :func:`hydroshoot.solver.solve_interactions_night`)
+            - **n_iter_t**: number of iterations of the temperature loop of the solver (number of Newton iterations
+                with the 'newton' solver)
+            - **n_iter_psi**: total number of iterations of the hydraulic loop of the solver (number of residual
+                evaluations with the 'newton' solver)
+            - **stats**: :class:`hydroshoot.stats.SolverStats`, numerical statistics of the time step (error traces,
+                step halvings, calls to the Newton-Krylov solver and to Caribu)
+            - **converged**: bool, True if the solver converged
+            - **budget_hit**: bool, True if the solver was stopped by the time budget (see **step_time_budget** and
+                **run_time_budget** in :func:`run`)
+
+        :Notes:
+        The values of the recorded variables are stored by the :attr:`recorder` when the date of **meteo_row** belongs
+        to the simulation period.
+        """
+        g = self.g
+        kwargs = self.kwargs
+        params = self.params
+        vid_collar = self.vid_collar
+        time_conv = self.time_conv
+        length_conv = self.length_conv
+
+        date = meteo_row.index[0]
+
+        # Wall-clock deadline of the solver
+        step_start = time.time()
+        if self._run_start is None:
+            self._run_start = step_start
+        deadlines = []
+        if self.step_time_budget is not None:
+            deadlines.append(step_start + self.step_time_budget)
+        if self.run_time_budget is not None:
+            deadlines.append(self._run_start + self.run_time_budget)
+        deadline = min(deadlines) if deadlines else None
+
+        stats = SolverStats(self.verbosity)
+
+        stats.log(1, "=" * 72)
+        stats.log(1, 'Date', date, '\n')
 
         # Add a date index to g
         g.date = datetime.strftime(date, "%Y%m%d%H%M%S")
@@ -306,9 +479,10 @@ def run(g, wd, scene=None, write_result=True, **kwargs):
         if 'psi_soil' in kwargs:
             psi_soil = kwargs['psi_soil']
         else:
+            psi_soil = self.psi_soil
             if date.hour == 0:
                 try:
-                    psi_soil_init = psi_pd.ix[date.date()][0]
+                    psi_soil_init = self.psi_pd.ix[date.date()][0]
                     psi_soil = psi_soil_init
                 except KeyError:
                     pass
@@ -316,112 +490,240 @@ def run(g, wd, scene=None, write_result=True, **kwargs):
             else:
                 psi_soil = hydraulic.soil_water_potential(psi_soil,
                                                           g.node(vid_collar).Flux * time_conv,
-                                                          soil_class, soil_total_volume, psi_min)
-
-        if 'sun2scene' not in kwargs or not kwargs['sun2scene']:
-            sun2scene = None
-        elif kwargs['sun2scene']:
-            sun2scene = display.visu(g, def_elmnt_color_dict=True, scene=Scene())
-
-        # Compute irradiance distribution over the scene
-        caribu_source, RdRsH_ratio = irradiance.irradiance_distribution(imeteo, geo_location, E_type, tzone,
-                                                                        turtle_sectors, turtle_format, sun2scene,
-                                                                        scene_rotation, None)
+                                                          self.soil_class, self.soil_total_volume, self.psi_min)
+        self.psi_soil = psi_soil
+
+        night = params.simulation.night_mode and irradiance.is_night(meteo_row, params.irradiance.E_type)
+        series = self.irradiance_series
+
+        if night:
+            # No irradiance: the radiation model is skipped
+            RdRsH_ratio = 1.
+            g.properties()['Ei'] = {vid: 0. for vid in g.property('geometry')}
+            g.properties()['Eabs'] = {vid: 0. for vid in g.property('geometry')}
+        elif series is not None and date in series['time'] and not kwargs.get('sun2scene', False):
+            # Irradiance computed before the simulation started
+            i = series['time'].get_loc(date)
+            for prop in ('Ei', 'Eabs'):
+                g.properties()[prop] = dict(zip(series['vid'], series[prop][:, i]))
+            RdRsH_ratio = series['diffuse_ratio'][i]
+        else:
+            if 'sun2scene' not in kwargs or not kwargs['sun2scene']:
+                sun2scene = None
+            elif kwargs['sun2scene']:
+                sun2scene = display.visu(g, def_elmnt_color_dict=True, scene=Scene())
+
+            # Compute irradiance distribution over the scene
+            caribu_source, RdRsH_ratio = irradiance.irradiance_distribution(meteo_row, self.geo_location,
+                                                                            params.irradiance.E_type,
+                                                                            params.simulation.tzone,
+                                                                            params.irradiance.turtle_sectors,
+                                                                            params.irradiance.turtle_format, sun2scene,
+                                                                            params.irradiance.scene_rotation, None,
+                                                                            self.diffuse_interception is None)
+            if self.diffuse_interception is not None:
+                diffuse = (irradiance.diffuse_irradiance(meteo_row, params.irradiance.E_type, RdRsH_ratio),
+                           self.diffuse_interception)
+            else:
+                diffuse = None
 
-        # Compute irradiance interception and absorbtion
-        g, caribu_scene = irradiance.hsCaribu(mtg=g,
-                                              unit_scene_length=unit_scene_length,
-                                              source=caribu_source, direct=False,
-                                              infinite=True, nz=50, ds=0.5,
-                                              pattern=pattern)
+            # Compute irradiance interception and absorbtion
+            if self.interception_basis is not None:
+                g = irradiance.basis_interception(g, self.interception_basis, caribu_source, diffuse)
+            else:
+                reused_scene = self.caribu_scene is not None
+                g, caribu_scene = irradiance.hsCaribu(mtg=g,
+                                                      unit_scene_length=self.unit_scene_length,
+                                                      source=caribu_source, direct=False,
+                                                      infinite=True, nz=50, ds=0.5,
+                                                      pattern=self.pattern, stats=stats, diffuse=diffuse,
+                                                      caribu_scene=self.caribu_scene, pool=self.irradiance_pool)
+                # The scene is kept for the next time steps
+                if params.irradiance.persistent_scene and caribu_scene is not None:
+                    if not reused_scene:
+                        self._caribu_scene_time = stats.caribu_scene_time
+                    self.caribu_scene = caribu_scene
+                stats.log(2, 'Caribu time', round(stats.caribu_time, 3), 's (scene', round(stats.caribu_scene_time, 3),
+                          's, run', round(stats.caribu_run_time, 3), 's)')
+                if reused_scene:
+                    stats.log(1, 'Caribu scene reused, saving', round(self._caribu_scene_time, 3), 's')
 
         # g.properties()['Ei'] = {vid: 1.2 * g.node(vid).Ei for vid in g.property('Ei').keys()}
 
         # Trace intercepted irradiance on each time step
-        rg_ls.append(sum([g.node(vid).Ei / (0.48 * 4.6) * surface(g.node(vid).geometry) * (length_conv ** 2) \
-                          for vid in g.property('geometry') if g.node(vid).label.startswith('L')]))
-
+        rg = sum([g.node(vid).Ei / (0.48 * 4.6) * surface(g.node(vid).geometry) * (length_conv ** 2)
+                  for vid in g.property('geometry') if g.node(vid).label.startswith('L')])
 
         # Hack forcing of soil temperture (model of soil temperature under development)
-        t_soil = energy.forced_soil_temperature(imeteo)
+        t_soil = energy.forced_soil_temperature(meteo_row)
 
         # Climatic data for energy balance module
         # TODO: Change the t_sky_eff formula (cf. Gliah et al., 2011, Heat and Mass Transfer, DOI: 10.1007/s00231-011-0780-1)
-        t_sky_eff = RdRsH_ratio * t_cloud + (1 - RdRsH_ratio) * t_sky
+        t_sky_eff = RdRsH_ratio * params.energy.t_cloud + (1 - RdRsH_ratio) * params.energy.t_sky
+
+        # Initial state of the solver (taken from the previous time steps if warm start is required)
+        warm_start = params.numerical_resolution.warm_start
+        extrapolate = warm_start == 'extrapolate'
+        if warm_start != 'none':
+            psi_init = solver.warm_start_state(self._psi_history, extrapolate, lower=self.psi_min, upper=0.)
+            t_init = solver.warm_start_state(self._t_history, extrapolate)
+        else:
+            psi_init, t_init = None, None
 
-        solver.solve_interactions(g, imeteo, psi_soil, t_soil, t_sky_eff,
-                                  vid_collar, vid_base, length_conv, time_conv,
-                                  rhyzo_total_volume, params, form_factors, simplified_form_factors)
+        if night:
+            solve_interactions = solver.solve_interactions_night
+        elif params.numerical_resolution.solver == 'newton':
+            solve_interactions = solver.solve_interactions_newton
+        else:
+            solve_interactions = solver.solve_interactions
+        n_iter_t, n_iter_psi = solve_interactions(g, meteo_row, psi_soil, t_soil, t_sky_eff,
+                                                  vid_collar, self.vid_base, length_conv, time_conv,
+                                                  self.rhyzo_total_volume, params, self.form_factors,
+                                                  self.simplified_form_factors, psi_init=psi_init, t_init=t_init,
+                                                  stats=stats, deadline=deadline,
+                                                  photo_capacities=self.photo_capacities,
+                                                  hydraulics=self.hydraulics)
+
+        if stats.budget_hit:
+            stats.log(1, 'Time budget exhausted: the solution of this time step is not converged.')
+
+        if warm_start != 'none':
+            self._psi_history = (self._psi_history + [dict(g.property('psi_head'))])[-2:]
+            self._t_history = (self._t_history + [dict(g.property('Tlc'))])[-2:]
 
         # Write mtg to an external file
-        if scene is not None:
-            architecture.mtg_save(g, scene, output_path)
-
-        # Plot stuff..
-        sapflow.append(g.node(vid_collar).Flux)
-        # sapEast.append(g.node(arm_vid['arm1']).Flux)
-        # sapWest.append(g.node(arm_vid['arm2']).Flux)
-
-        an_ls.append(g.node(vid_collar).FluxC)
-
-        psi_stem[date] = deepcopy(g.property('psi_head'))
-        Tlc_dict[date] = deepcopy(g.property('Tlc'))
-        Ei_dict[date] = deepcopy(g.property('Eabs'))
-        an_dict[date] = deepcopy(g.property('An'))
-        gs_dict[date] = deepcopy(g.property('gs'))
-
-        print '---------------------------'
-        print 'psi_soil', round(psi_soil, 4)
-        print 'psi_collar', round(g.node(3).psi_head, 4)
-        print 'psi_leaf', round(np.median([g.node(vid).psi_head for vid in g.property('gs').keys()]), 4)
-        print ''
+        if self.scene is not None:
+            architecture.mtg_save(g, self.scene, self.output_path)
+
+        if date in self.recorder.index:
+            self.recorder.record(g, date)
+
+        stats.log(1, '---------------------------')
+        stats.log(1, 'psi_soil', round(psi_soil, 4))
+        stats.log(1, 'psi_collar', round(g.node(3).psi_head, 4))
+        stats.log(1, 'psi_leaf', round(np.median([g.node(vid).psi_head for vid in g.property('gs').keys()]), 4))
+        stats.log(1, '')
         # print 'Rdiff/Rglob ', RdRsH_ratio
         # print 't_sky_eff ', t_sky_eff
-        print 'gs', np.median(g.property('gs').values())
-        print 'flux H2O', round(g.node(vid_collar).Flux * 1000. * time_conv, 4)
-        print 'flux C2O', round(g.node(vid_collar).FluxC, 4)
-        print 'Tleaf ', round(np.median([g.node(vid).Tlc for vid in g.property('gs').keys()]), 2), \
-            'Tair ', round(imeteo.Tac[0], 4)
-        print ''
-        print "=" * 72
+        stats.log(1, 'gs', np.median(g.property('gs').values()))
+        stats.log(1, 'flux H2O', round(g.node(vid_collar).Flux * 1000. * time_conv, 4))
+        stats.log(1, 'flux C2O', round(g.node(vid_collar).FluxC, 4))
+        stats.log(1, 'Tleaf ', round(np.median([g.node(vid).Tlc for vid in g.property('gs').keys()]), 2),
+                  'Tair ', round(meteo_row.Tac[0], 4))
+        stats.log(1, '')
+        stats.log(1, "=" * 72)
+
+        return {'time': date,
+                'Rg': rg / self.soil_area,
+                'An': g.node(vid_collar).FluxC,
+                'E': g.node(vid_collar).Flux * time_conv * 1000.,
+                'Tleaf': np.median(g.property('Tlc').values()),
+                'psi_soil': psi_soil,
+                'night': night,
+                'n_iter_t': n_iter_t,
+                'n_iter_psi': n_iter_psi,
+                'converged': stats.converged,
+                'budget_hit': stats.budget_hit,
+                'stats': stats}
+
+    def iterate(self):
+        """Computes the time steps of the simulation period one after the other.
+
+        :Returns:
+        - a generator yielding the outputs of each time step (see :meth:`step`)
+
+        :Notes:
+        The simulation is closed (see :meth:`close`) once the generator is exhausted, closed or interrupted by an
+        exception.
+        """
+        meteo = self.meteo
+        try:
+            for date in meteo.time:
+                yield self.step(meteo[meteo.time == date])
+        finally:
+            self.close()
+
+    def close(self):
+        """Terminates the worker processes computing the irradiance, if any. The time steps computed afterwards run
+        Caribu in the current process.
+        """
+        if self.irradiance_pool is not None:
+            self.irradiance_pool.close()
+            self.irradiance_pool.join()
+            self.irradiance_pool = None
 
-    # End time loop +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
-    # Write output
-    # Plant total transpiration
-    sapflow = [flow * time_conv * 1000. for flow in sapflow]
+def run(g, wd, scene=None, write_result=True, **kwargs):
+    """
+    Calculates leaf gas and energy exchange in addition to the hydraulic structure of an individual plant.
 
-    # sapEast, sapWest = [np.array(flow) * time_conv * 1000. for i, flow in enumerate((sapEast, sapWest))]
+    :Parameters:
+    - **g**: a multiscale tree graph object
+    - **wd**: string, working directory
+    - **scene**: PlantGl scene
+    - **kwargs** can include:
+        - **psi_soil**: [MPa] predawn soil water potential
+        - **gdd_since_budbreak**: [°Cd] growing degree-day since bubreak
+        - **sun2scene**: PlantGl scene, when prodivided, a sun object (sphere) is added to it
+        - **soil_size**: [cm] length of squared mesh size
+        - **recorded_variables**: list of the names of the MTG properties to be recorded at each time step for all
+            vertices (default ('psi_head', 'Tlc', 'Eabs', 'An', 'gs')), see :class:`hydroshoot.recorder.Recorder`
+        - **return_records**: bool, if True, the recorded vertex-scale outputs are returned together with the
+            time-series outputs as a :class:`hydroshoot.recorder.Records` object
+        - **step_time_budget**: [s] maximum wall-clock time of each time step, after which the solver stops and keeps
+            its current (not converged) state, overrides the `step_time_budget` value of params.json
+        - **run_time_budget**: [s] maximum wall-clock time of the whole simulation, after which the solver stops at
+            its first iteration for the remaining time steps, overrides the `run_time_budget` value of params.json
+        - **return_status**: bool, if True, the solver statistics of each time step (see
+            :data:`hydroshoot.stats.summary_keys`) are returned as a DataFrame after the other outputs
+        - **verbosity**: int, level of console output (0: silent, 1: time step summaries and warnings, 2: errors of
+            each solver iteration), overrides the `verbosity` value of params.json
+        - **linearized_energy**: bool, if True, leaf temperature is computed by the closed-form linearised energy
+            budget (see :func:`hydroshoot.energy.linearized_leaf_temperature`), overrides the `linearized` value of the
+            `energy` section of params.json
+
+    :Returns:
+    - (DataFrame) plant-scale time-series outputs, or a tuple starting with it and followed by the records if
+        **return_records** is True and by the solver status if **return_status** is True
+
+    :Notes:
+    This function runs a :class:`Simulation` over the whole simulation period.
+    """
+    time_on = datetime.now()
 
-    # Median leaf temperature
-    t_ls = [np.median(Tlc_dict[date].values()) for date in meteo.time]
+    sim = Simulation(g, wd, scene, **kwargs)
 
-    # Intercepted global radiation
-    rg_ls = np.array(rg_ls) / (soil_dimensions[0] * soil_dimensions[1])
+    # ==============================================================================
+    # Simulations
+    # ==============================================================================
 
-    results_dict = {
-        'Rg': rg_ls,
-        'An': an_ls,
-        'E': sapflow,
-        # 'sapEast': sapEast,
-        # 'sapWest': sapWest,
-        'Tleaf': t_ls
-    }
+    outputs = list(sim.iterate())
 
+    # Write output
     # Results DataFrame
-    results_df = DataFrame(results_dict, index=meteo.time)
+    results_df = DataFrame(outputs, index=sim.meteo.time, columns=['An', 'E', 'Rg', 'Tleaf'])
+    status_df = DataFrame([o['stats'].summary() for o in outputs], index=sim.meteo.time, columns=list(summary_keys))
 
     # Write
     if write_result:
-        results_df.to_csv(output_path + 'time_series.output',
-                      sep=';', decimal='.')
+        results_df.to_csv(sim.output_path + 'time_series.output',
+                          sep=';', decimal='.')
+        status_df.to_csv(sim.output_path + 'solver_status.output',
+                         sep=';', decimal='.')
 
     time_off = datetime.now()
 
-    print ("")
-    print ("beg time", time_on)
-    print ("end time", time_off)
-    print ("--- Total runtime: %d minute(s) ---" %
-           int((time_off - time_on).seconds / 60.))
+    log(sim.verbosity, 1, "")
+    log(sim.verbosity, 1, "beg time", time_on)
+    log(sim.verbosity, 1, "end time", time_off)
+    log(sim.verbosity, 1, "--- Total runtime: %d minute(s) ---" % int((time_off - time_on).seconds / 60.))
+    if status_df.budget_hit.any():
+        log(sim.verbosity, 1, "--- Time budget exhausted for %d time step(s) ---" % status_df.budget_hit.sum())
+
+    returned = [results_df]
+    if kwargs.get('return_records', False):
+        returned.append(sim.recorder.records())
+    if kwargs.get('return_status', False):
+        returned.append(status_df)
 
-    return results_df
+    return tuple(returned) if len(returned) > 1 else results_df
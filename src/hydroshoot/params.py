@@ -65,6 +65,8 @@ class Simulation:
         self.negligible_shoot_resistance = simulation_dict['negligible_shoot_resistance']
         self.energy_budget = simulation_dict['energy_budget']
         self.soil_water_deficit = simulation_dict['soil_water_deficit']
+        self.night_mode = simulation_dict.get('night_mode', False)
+        self.verbosity = simulation_dict.get('verbosity', 2)
 	self.meteo = simulation_dict['meteo']
 
 
@@ -91,6 +93,19 @@ class NumericalResolution:
         self.psi_error_threshold = numerical_resolution_dict['psi_error_threshold']
         self.t_step = numerical_resolution_dict['t_step']
         self.t_error_crit = numerical_resolution_dict['t_error_crit']
+        self.warm_start = numerical_resolution_dict.get('warm_start', 'none')
+        self.acceleration = numerical_resolution_dict.get('acceleration', 'relaxation')
+        self.anderson_depth = numerical_resolution_dict.get('anderson_depth', 5)
+        self.solver = numerical_resolution_dict.get('solver', 'fixed_point')
+        self.active_set = numerical_resolution_dict.get('active_set', False)
+        self.vectorized_exchange = numerical_resolution_dict.get('vectorized_exchange', False)
+        self.vectorized_hydraulic = numerical_resolution_dict.get('vectorized_hydraulic', False)
+        self.hydraulic_solver = numerical_resolution_dict.get('hydraulic_solver', 'fixed_point')
+        self.coarsen_hydraulic = numerical_resolution_dict.get('coarsen_hydraulic', False)
+        self.incremental_hydraulic = numerical_resolution_dict.get('incremental_hydraulic', False)
+        self.incremental_psi_tol = numerical_resolution_dict.get('incremental_psi_tol', 1.e-4)
+        self.step_time_budget = numerical_resolution_dict.get('step_time_budget', None)
+        self.run_time_budget = numerical_resolution_dict.get('run_time_budget', None)
 
 
 class Irradiance:
@@ -103,6 +118,14 @@ class Irradiance:
         self.turtle_format = irradiance_dict['turtle_format']
         self.turtle_sectors = irradiance_dict['turtle_sectors']
         self.icosphere_level = irradiance_dict['icosphere_level']
+        self.precompute_diffuse = irradiance_dict.get('precompute_diffuse', False)
+        self.interception_basis = irradiance_dict.get('interception_basis', False)
+        self.basis_elevation_step = irradiance_dict.get('basis_elevation_step', 5.)
+        self.basis_azimuth_step = irradiance_dict.get('basis_azimuth_step', 10.)
+        self.persistent_scene = irradiance_dict.get('persistent_scene', False)
+        self.precompute_hourly = irradiance_dict.get('precompute_hourly', False)
+        self.split_sources = irradiance_dict.get('split_sources', False)
+        self.processes = irradiance_dict.get('processes', None)
 
 
 class Energy:
@@ -112,6 +135,8 @@ class Energy:
         self.limit = energy_dict['limit']
         self.t_cloud = energy_dict['t_cloud']
         self.t_sky = energy_dict['t_sky']
+        self.vectorized = energy_dict.get('vectorized', False)
+        self.linearized = energy_dict.get('linearized', False)
 
 
 class Hydraulic:
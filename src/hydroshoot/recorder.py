@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+"""Recording module of HydroShoot.
+
+This module stores the per-vertex outputs of a simulation (e.g. leaf temperature or xylem water potential) into a
+single array that is preallocated for the whole simulation period, instead of copying the MTG property dictionaries at
+each time step.
+"""
+
+import numpy as np
+from pandas import DataFrame, DatetimeIndex
+
+default_variables = ('psi_head', 'Tlc', 'Eabs', 'An', 'gs')
+
+
+class Recorder(object):
+    """Records MTG properties of a fixed set of vertices at each time step of a simulation.
+
+    The recorded values are held in a (vertex x time x variable) array allocated once at construction, so that memory
+    use only depends on the number of vertices, time steps and recorded variables.
+
+    Args:
+        vertices (iterable): ids of the vertices to be recorded
+        index (iterable): datetime values of the simulation time steps
+        variables (iterable): names of the MTG properties to be recorded
+
+    Notes:
+        Values of vertices that do not carry a given property (e.g. `Tlc` for stem segments), or that carry a `None`
+            value, are recorded as `NaN`.
+
+    """
+
+    def __init__(self, vertices, index, variables=default_variables):
+        self.vertices = list(vertices)
+        self.index = DatetimeIndex(index)
+        self.variables = list(variables)
+
+        self._row = {vid: irow for irow, vid in enumerate(self.vertices)}
+        self._values = np.full((len(self.vertices), len(self.index), len(self.variables)), np.nan)
+
+    @property
+    def nbytes(self):
+        """(int): memory size of the recorded values array [bytes]"""
+        return self._values.nbytes
+
+    def record(self, g, date):
+        """Copies the current values of the recorded properties of `g` into the column of `date`.
+
+        Args:
+            g (openalea.mtg.MTG): a multiscale tree graph object
+            date (datetime): the current time step, must belong to :attr:`index`
+
+        """
+        icol = self.index.get_loc(date)
+        row = self._row
+        for ivar, var in enumerate(self.variables):
+            column = self._values[:, icol, ivar]
+            for vid, value in g.property(var).iteritems():
+                irow = row.get(vid)
+                if irow is not None and value is not None:
+                    column[irow] = value
+
+    def records(self):
+        """Returns the recorded values as a :class:`Records` object."""
+        return Records(self.vertices, self.index, self.variables, self._values)
+
+
+class Records(object):
+    """Labelled view on the values stored by a :class:`Recorder`.
+
+    Args:
+        vertices (list): ids of the recorded vertices
+        index (DatetimeIndex): datetime values of the simulation time steps
+        variables (list): names of the recorded properties
+        values (numpy.ndarray): (vertex x time x variable) array of the recorded values
+
+    Examples:
+        >>> records['Tlc']  # DataFrame of leaf temperatures, indexed by time, one column per vertex
+        >>> records.vertex(vid)  # DataFrame of all recorded variables of `vid`, indexed by time
+
+    """
+
+    def __init__(self, vertices, index, variables, values):
+        self.vertices = vertices
+        self.index = index
+        self.variables = variables
+        self.values = values
+
+    def __getitem__(self, variable):
+        """Returns a (time x vertex) DataFrame of the given recorded variable."""
+        ivar = self.variables.index(variable)
+        return DataFrame(self.values[:, :, ivar].T, index=self.index, columns=self.vertices)
+
+    def __contains__(self, variable):
+        return variable in self.variables
+
+    def vertex(self, vid):
+        """Returns a (time x variable) DataFrame of the recorded variables of the vertex `vid`."""
+        irow = self.vertices.index(vid)
+        return DataFrame(self.values[irow, :, :], index=self.index, columns=self.variables)
+
+    def at(self, date, variable):
+        """Returns a {vid: value} dictionary of the given variable at the given date, ignoring `NaN` values.
+
+        This is the array-backed equivalent of a copy of the MTG property at `date`.
+        """
+        icol = self.index.get_loc(date)
+        ivar = self.variables.index(variable)
+        column = self.values[:, icol, ivar]
+        return {vid: column[irow] for irow, vid in enumerate(self.vertices) if not np.isnan(column[irow])}
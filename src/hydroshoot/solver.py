@@ -1,80 +1,342 @@
+import time
 from copy import deepcopy
+import numpy as np
+from scipy import optimize
+from scipy.sparse.linalg import LinearOperator
 import openalea.mtg.traversal as traversal
-from hydroshoot import hydraulic, exchange, energy
+from hydroshoot import hydraulic, exchange, energy, acceleration, utilities as utils
+from hydroshoot.stats import SolverStats
 
+try:
+    from scipy.optimize import NoConvergence
+except ImportError:  # older scipy releases only expose it in the nonlin module
+    from scipy.optimize.nonlin import NoConvergence
 
-def solve_interactions(g, meteo, psi_soil, t_soil, t_sky_eff, vid_collar, vid_base,
-                       length_conv, time_conv, rhyzo_total_volume, params, form_factors, simplified_form_factors):
-    """Computes gas-exchange, energy and hydraulic structure of plant's shoot jointly.
+
+def initialize_state(g, meteo, psi_soil, vid_collar, vid_base, leaf_lbl_prefix='L', psi_init=None, t_init=None):
+    """Initializes xylem water potential and leaf temperature before solving the interactions of a time step.
 
     Args:
         g: MTG object
         meteo (DataFrame): forcing meteorological variables
         psi_soil (float): [MPa] soil (root zone) water potential
-        t_soil (float): [degreeC] soil surface temperature
-        t_sky_eff (float): [degreeC] effective sky temperature
         vid_collar (int): id of the collar node of the mtg
         vid_base (int): id of the basal node of the mtg
+        leaf_lbl_prefix (str): the prefix of the leaf label
+        psi_init (dict): [MPa] if given, xylem water potential of the shoot nodes (from the collar upwards), nodes
+            missing from :arg:`psi_init` are initialized to :arg:`psi_soil`
+        t_init (dict): [degreeC] if given, temperature of the leaves, leaves missing from :arg:`t_init` are
+            initialized to air temperature
+
+    Notes:
+        Without :arg:`psi_init` and :arg:`t_init`, all xylem water potential values are set to soil water potential
+            and leaf temperature is set to air temperature (cold start).
+        Nodes below the collar (rhyzosphere) are always initialized to :arg:`psi_soil`.
+
+    """
+    # Initialize all xylem potential values to soil water potential
+    for vtx_id in traversal.pre_order2(g, vid_base):
+        g.node(vtx_id).psi_head = psi_soil
+
+    if psi_init is not None:
+        for vtx_id in traversal.pre_order2(g, vid_collar):
+            if vtx_id in psi_init:
+                g.node(vtx_id).psi_head = psi_init[vtx_id]
+
+    # Initialize leaf  temperature to air temperature
+    t_leaves = energy.leaf_temperature_as_air_temperature(g, meteo, leaf_lbl_prefix)
+    if t_init is not None:
+        t_leaves.update({vid: t_init[vid] for vid in t_leaves if vid in t_init})
+    g.properties()['Tlc'] = t_leaves
+
+
+def warm_start_state(history, extrapolate=False, lower=None, upper=None):
+    """Returns the initial values of a state variable from its values at the previous time steps.
+
+    Args:
+        history (list of dict): converged values of the state variable at the previous time steps, the latest being
+            the last
+        extrapolate (bool): if True, the initial values are linearly extrapolated from the last two time steps,
+            otherwise the values of the last time step are used
+        lower (float): lower bound of the initial values (no bound if None)
+        upper (float): upper bound of the initial values (no bound if None)
+
+    Returns:
+        (dict): initial values of the state variable, or None if :arg:`history` is empty
+
+    """
+    if len(history) == 0:
+        return None
+    elif not extrapolate or len(history) == 1:
+        return dict(history[-1])
+
+    prev, last = history[-2], history[-1]
+    init = {}
+    for vid, value in last.iteritems():
+        if vid in prev:
+            value = 2. * value - prev[vid]
+            if lower is not None:
+                value = max(lower, value)
+            if upper is not None:
+                value = min(upper, value)
+        init[vid] = value
+    return init
+
+
+def deadline_passed(deadline):
+    """Returns True if the wall-clock :arg:`deadline` (in seconds since the epoch, as returned by `time.time()`) is
+    passed, False otherwise or if :arg:`deadline` is None."""
+    return deadline is not None and time.time() > deadline
+
+
+def hydraulic_solver(g, length_conv, params):
+    """Computes the static hydraulic properties of the plant (see
+    :func:`hydroshoot.hydraulic.static_hydraulic_properties`) and returns the solver of its hydraulic structure.
+
+    Args:
+        g: MTG object
         length_conv (float): [-] conversion factor from the `unit_scene_length` to 1 m
-        time_conv (float): [-] conversion factor from meteo data time step to seconds
-        rhyzo_total_volume (float): [m3] volume of the soil occupied with roots
         params (params): [-] :class:`hydroshoot.params.Params()` object
 
+    Returns:
+        a :class:`hydroshoot.hydraulic.HydraulicNetwork` object if the numerical resolution requires it (vectorized,
+            newton, coarsened or incremental hydraulic structure), the :mod:`hydroshoot.hydraulic` module otherwise
+
+    Notes:
+        The returned solver only depends on the plant geometry, it can therefore be built once and passed to the
+            solvers of the interactions of every time step (see :func:`solve_interactions`).
+
     """
-    unit_scene_length = params.simulation.unit_scene_length
+    xylem_k_max = params.hydraulic.Kx_dict
+    hydraulic.static_hydraulic_properties(g, length_conv=length_conv, a=xylem_k_max['a'], b=xylem_k_max['b'],
+                                          min_kmax=xylem_k_max['min_kmax'])
+    numerical_resolution = params.numerical_resolution
+    hydraulic_newton = numerical_resolution.hydraulic_solver == 'newton'
+    if (numerical_resolution.vectorized_hydraulic or hydraulic_newton or numerical_resolution.coarsen_hydraulic or
+            numerical_resolution.incremental_hydraulic):
+        return hydraulic.HydraulicNetwork(g, length_conv, newton=hydraulic_newton,
+                                          coarsen=numerical_resolution.coarsen_hydraulic,
+                                          incremental=numerical_resolution.incremental_hydraulic,
+                                          psi_tol=numerical_resolution.incremental_psi_tol)
+    else:
+        return hydraulic
 
-    hydraulic_structure = params.simulation.hydraulic_structure
-    negligible_shoot_resistance = params.simulation.negligible_shoot_resistance
-    soil_water_deficit = params.simulation.soil_water_deficit
-    energy_budget = params.simulation.energy_budget
 
-    par_photo = params.exchange.par_photo
-    par_photo_n = params.exchange.par_photo_N
-    par_gs = params.exchange.par_gs
-    rbt = params.exchange.rbt
+class _StepSetup(object):
+    """Parameters and invariants of a time step shared by the solvers of the interactions (see :func:`_prepare_step`).
 
-    mass_conv = params.hydraulic.MassConv
-    xylem_k_max = params.hydraulic.Kx_dict
-    xylem_k_cavitation = params.hydraulic.par_K_vul
-    psi_min = params.hydraulic.psi_min
+    Attributes:
+        hydraulics: the hydraulic solver, either a :class:`hydroshoot.hydraulic.HydraulicNetwork` object or the
+            :mod:`hydroshoot.hydraulic` module
+        leaves (list): ids of the leaves
+        leaves_gb (dict): [mol m-2 s-1] boundary layer conductance of the leaves for water vapour
+        gbh (dict): [W m-2 K-1] boundary layer conductance of the leaves for heat
+        stats (SolverStats): statistics of the solution
+        the other attributes are the parameters used by the solvers (see :class:`hydroshoot.params.Params`)
+
+    """
+
+    def __init__(self, params, vid_collar, length_conv, time_conv, rhyzo_total_volume):
+        self.vid_collar = vid_collar
+        self.length_conv = length_conv
+        self.time_conv = time_conv
+        self.rhyzo_total_volume = rhyzo_total_volume
+
+        self.hydraulic_structure = params.simulation.hydraulic_structure
+        self.negligible_shoot_resistance = params.simulation.negligible_shoot_resistance
+        self.soil_water_deficit = params.simulation.soil_water_deficit
+        self.energy_budget = params.simulation.energy_budget
+
+        self.par_photo = params.exchange.par_photo
+        self.par_photo_n = params.exchange.par_photo_N
+        self.par_gs = params.exchange.par_gs
+        self.rbt = params.exchange.rbt
+
+        self.mass_conv = params.hydraulic.MassConv
+        self.xylem_k_max = params.hydraulic.Kx_dict
+        self.psi_min = params.hydraulic.psi_min
+        self.cavitation_model, self.fifty_cent, self.sig_slope = [params.hydraulic.par_K_vul[ikey] for ikey in
+                                                                  ('model', 'fifty_cent', 'sig_slope')]
+        self.coarsen_hydraulic = params.numerical_resolution.coarsen_hydraulic
+        self.incremental_hydraulic = params.numerical_resolution.incremental_hydraulic
+
+        self.solo = params.energy.solo
+        self.vectorized_energy = params.energy.vectorized
+        self.linearized_energy = params.energy.linearized
+
+        self.irradiance_type2 = params.irradiance.E_type2
+
+        self.leaf_lbl_prefix = params.mtg_api.leaf_lbl_prefix
+
+        self.soil_class = params.soil.soil_class
+        self.dist_roots, self.rad_roots = params.soil.roots
+
+        self.t_step = params.numerical_resolution.t_step
+        self.psi_step = params.numerical_resolution.psi_step
+        self.max_iter = params.numerical_resolution.max_iter
+        self.psi_error_threshold = params.numerical_resolution.psi_error_threshold
+        self.t_error_crit = params.numerical_resolution.t_error_crit
+        self.acceleration = params.numerical_resolution.acceleration
+        self.anderson_depth = params.numerical_resolution.anderson_depth
+        self.active_set = params.numerical_resolution.active_set
+        self.gas_exchange_rates = (exchange.gas_exchange_rates_array if params.numerical_resolution.vectorized_exchange
+                                   else exchange.gas_exchange_rates)
+
+        self.hydraulics = None
+        self.leaves = None
+        self.leaves_gb = None
+        self.gbh = None
+        self.stats = None
+
+    def hydraulic_prop(self, g):
+        """Computes the sap flow of the hydraulic segments (see :func:`hydroshoot.hydraulic.hydraulic_prop`)."""
+        self.hydraulics.hydraulic_prop(g, mass_conv=self.mass_conv, length_conv=self.length_conv,
+                                       a=self.xylem_k_max['a'], b=self.xylem_k_max['b'],
+                                       min_kmax=self.xylem_k_max['min_kmax'], compute_kmax=False)
+
+    def collar_water_potential(self, g, psi_soil):
+        """Returns the water potential at the collar [MPa] given the soil water potential :arg:`psi_soil` [MPa] and the
+        sap flow of the collar, which is also imposed to the nodes below the collar without soil water deficit."""
+        psi_collar = hydraulic.soil_water_potential(psi_soil, g.node(self.vid_collar).Flux * self.time_conv,
+                                                    self.soil_class, self.rhyzo_total_volume, self.psi_min)
+
+        if self.soil_water_deficit:
+            psi_collar = max(-1.3, psi_collar)
+        else:
+            psi_collar = max(-0.7, psi_collar)
+
+            for vid in g.Ancestors(self.vid_collar):
+                g.node(vid).psi_head = psi_collar
+
+        return psi_collar
+
+    def xylem_water_potential(self, g, psi_collar, deadline=None):
+        """Computes the xylem water potential of the shoot (see :func:`hydroshoot.hydraulic.xylem_water_potential`)
+        and returns the number of iterations."""
+        return self.hydraulics.xylem_water_potential(g, psi_soil=psi_collar, model=self.cavitation_model,
+                                                     psi_min=self.psi_min, psi_error_crit=self.psi_error_threshold,
+                                                     max_iter=self.max_iter, length_conv=self.length_conv,
+                                                     fifty_cent=self.fifty_cent, sig_slope=self.sig_slope,
+                                                     dist_roots=self.dist_roots, rad_roots=self.rad_roots,
+                                                     negligible_shoot_resistance=self.negligible_shoot_resistance,
+                                                     start_vid=self.vid_collar, stop_vid=None, psi_step=self.psi_step,
+                                                     accelerator=acceleration.accelerator(
+                                                         self.acceleration, self.psi_step, self.anderson_depth),
+                                                     deadline=deadline)
+
+    def leaf_temperature(self, g, meteo, t_soil, t_sky_eff, t_init, form_factors, simplified_form_factors):
+        """Computes the temperature of the leaves (see :func:`hydroshoot.energy.leaf_temperature`)."""
+        return energy.leaf_temperature(g, meteo, t_soil, t_sky_eff, t_init=t_init, form_factors=form_factors,
+                                       gbh=self.gbh, ev=g.property('E'), ei=g.property('Ei'), solo=self.solo,
+                                       ff_type=simplified_form_factors, leaf_lbl_prefix=self.leaf_lbl_prefix,
+                                       max_iter=self.max_iter, t_error_crit=self.t_error_crit, t_step=self.t_step,
+                                       active_set=self.active_set, stats=self.stats,
+                                       vectorized=self.vectorized_energy, linearized=self.linearized_energy)
+
+
+def _prepare_step(g, meteo, psi_soil, vid_collar, vid_base, length_conv, time_conv, rhyzo_total_volume, params,
+                  psi_init=None, t_init=None, stats=None, hydraulics=None):
+    """Prepares the solution of the interactions of a time step, common to all the solvers.
+
+    The parameters forced by the absence of hydraulic structure are set, the state of the mtg is initialized (see
+    :func:`initialize_state`), the hydraulic solver is built (see :func:`hydraulic_solver`) or reset if
+    :arg:`hydraulics` is given, and the boundary layer conductances of the leaves are computed.
 
-    solo = params.energy.solo
+    Args:
+        See :func:`solve_interactions`.
 
-    irradiance_type2 = params.irradiance.E_type2
+    Returns:
+        (_StepSetup): the parameters and invariants of the time step
 
-    leaf_lbl_prefix = params.mtg_api.leaf_lbl_prefix
-    collar_label = params.mtg_api.collar_label
+    """
+    setup = _StepSetup(params, vid_collar, length_conv, time_conv, rhyzo_total_volume)
+    setup.stats = stats if stats is not None else SolverStats()
 
-    soil_class = params.soil.soil_class
-    dist_roots, rad_roots = params.soil.roots
+    if setup.hydraulic_structure:
+        assert (setup.par_gs['model'] != 'vpd'), \
+            "Stomatal conductance model should be linked to the hydraulic strucutre"
+    else:
+        setup.par_gs['model'] = 'vpd'
+        setup.negligible_shoot_resistance = True
 
-    temp_step = params.numerical_resolution.t_step
-    psi_step = params.numerical_resolution.psi_step
-    max_iter = params.numerical_resolution.max_iter
-    psi_error_threshold = params.numerical_resolution.psi_error_threshold
-    temp_error_threshold = params.numerical_resolution.t_error_crit
+        setup.stats.log(1, "par_gs: 'model' is forced to 'vpd'")
+        setup.stats.log(1, "negligible_shoot_resistance is forced to True.")
 
-    modelx, psi_critx, slopex = [xylem_k_cavitation[ikey] for ikey in ('model', 'fifty_cent', 'sig_slope')]
+    initialize_state(g, meteo, psi_soil, vid_collar, vid_base, setup.leaf_lbl_prefix, psi_init, t_init)
 
-    if hydraulic_structure:
-        assert (par_gs['model'] != 'vpd'), "Stomatal conductance model should be linked to the hydraulic strucutre"
+    # Time step invariants
+    if hydraulics is None:
+        setup.hydraulics = hydraulic_solver(g, length_conv, params)
     else:
-        par_gs['model'] = 'vpd'
-        negligible_shoot_resistance = True
+        setup.hydraulics = hydraulics
+        if isinstance(hydraulics, hydraulic.HydraulicNetwork):
+            hydraulics.reset()
+    if setup.coarsen_hydraulic:
+        setup.stats.log(2, 'hydraulic network: %d segments, %d lumped' % (len(setup.hydraulics.vids),
+                                                                          len(setup.hydraulics.lumped_vids)))
+    setup.leaves = energy.get_leaves(g, setup.leaf_lbl_prefix)
+    setup.leaves_gb = exchange.leaves_boundary_layer_conductance(g, meteo, setup.leaf_lbl_prefix)
+    leaves_length = energy.get_leaves_length(g, leaf_lbl_prefix=setup.leaf_lbl_prefix,
+                                             unit_scene_length=params.simulation.unit_scene_length)
+    leaf_wind_speed = energy.leaf_wind_as_air_wind(g, meteo, setup.leaf_lbl_prefix)
+    setup.gbh = energy.heat_boundary_layer_conductance(leaves_length, leaf_wind_speed)
+
+    return setup
 
-        print "par_gs: 'model' is forced to 'vpd'"
-        print "negligible_shoot_resistance is forced to True."
 
-    # Initialize all xylem potential values to soil water potential
-    for vtx_id in traversal.pre_order2(g, vid_base):
-        g.node(vtx_id).psi_head = psi_soil
+def solve_interactions(g, meteo, psi_soil, t_soil, t_sky_eff, vid_collar, vid_base,
+                       length_conv, time_conv, rhyzo_total_volume, params, form_factors, simplified_form_factors,
+                       psi_init=None, t_init=None, stats=None, deadline=None, photo_capacities=None,
+                       hydraulics=None):
+    """Computes gas-exchange, energy and hydraulic structure of plant's shoot jointly.
+
+    Args:
+        g: MTG object
+        meteo (DataFrame): forcing meteorological variables
+        psi_soil (float): [MPa] soil (root zone) water potential
+        t_soil (float): [degreeC] soil surface temperature
+        t_sky_eff (float): [degreeC] effective sky temperature
+        vid_collar (int): id of the collar node of the mtg
+        vid_base (int): id of the basal node of the mtg
+        length_conv (float): [-] conversion factor from the `unit_scene_length` to 1 m
+        time_conv (float): [-] conversion factor from meteo data time step to seconds
+        rhyzo_total_volume (float): [m3] volume of the soil occupied with roots
+        params (params): [-] :class:`hydroshoot.params.Params()` object
+        psi_init (dict): [MPa] xylem water potential values used to initialize the shoot nodes (warm start), if None
+            (default) all nodes are initialized to :arg:`psi_soil`
+        t_init (dict): [degreeC] temperature values used to initialize the leaves (warm start), if None (default) all
+            leaves are initialized to air temperature
+        stats (SolverStats): if given, the statistics of the solution are collected in this
+            :class:`hydroshoot.stats.SolverStats` object, whose verbosity also controls the console output
+        deadline (float): [s] if given, wall-clock time (as returned by `time.time()`) after which the iterations stop
+            and the current state is kept, even if not converged
+        photo_capacities (dict): if given, photosynthetic capacities at 25 degreeC of the leaves (see
+            :func:`hydroshoot.exchange.leaf_photo_capacities`), which are then not recomputed at each iteration
+        hydraulics: if given, the solver of the hydraulic structure of the plant returned by :func:`hydraulic_solver`,
+            which is then reset instead of being built again
+
+    Returns:
+        (int): number of iterations of the temperature loop
+        (int): total number of iterations of the hydraulic loop
+
+    """
+    setup = _prepare_step(g, meteo, psi_soil, vid_collar, vid_base, length_conv, time_conv, rhyzo_total_volume,
+                          params, psi_init, t_init, stats, hydraulics)
+    stats, hydraulics, leaves = setup.stats, setup.hydraulics, setup.leaves
+    hydraulic_structure, energy_budget = setup.hydraulic_structure, setup.energy_budget
+    max_iter, temp_step, psi_step = setup.max_iter, setup.t_step, setup.psi_step
+    psi_error_threshold, temp_error_threshold = setup.psi_error_threshold, setup.t_error_crit
 
     # Temperature loop +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
     t_error_trace = []
+    psi_error_traces = []
+    n_active_traces = []
+    n_touched_traces = []
     it_step = temp_step
-
-    # Initialize leaf  temperature to air temperature
-    g.properties()['Tlc'] = energy.leaf_temperature_as_air_temperature(g, meteo, leaf_lbl_prefix)
+    n_iter_psi_total = 0
+    converged = budget_hit = False
+    psi_converged = not hydraulic_structure
+    t_accelerator = acceleration.accelerator(setup.acceleration, temp_step, setup.anderson_depth)
 
     for it in range(max_iter):
         t_prev = deepcopy(g.property('Tlc'))
@@ -82,38 +344,47 @@ def solve_interactions(g, meteo, psi_soil, t_soil, t_sky_eff, vid_collar, vid_ba
         # Hydraulic loop +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
         if hydraulic_structure:
             psi_error_trace = []
+            psi_error_traces.append(psi_error_trace)
             ipsi_step = psi_step
+            psi_accelerator = acceleration.accelerator(setup.acceleration, psi_step, setup.anderson_depth)
+            n_active_trace = []
+            n_active_traces.append(n_active_trace)
+            n_touched_trace = []
+            n_touched_traces.append(n_touched_trace)
+            psi_exchange = {}
+            verify = False
+            psi_converged = False
             for ipsi in range(max_iter):
                 psi_prev = deepcopy(g.property('psi_head'))
 
+                # Active set: leaves whose water potential barely changed since their last gas-exchange computation
+                # are frozen, until a final iteration over all leaves verifies the convergence
+                active_leaves = None
+                if setup.active_set and psi_exchange and not verify:
+                    active_leaves = [vid for vid in leaves
+                                     if abs(psi_prev[vid] - psi_exchange[vid]) >= psi_error_threshold]
+                verify = False
+
                 # Compute gas-exchange fluxes. Leaf T and Psi are from prev calc loop
-                exchange.gas_exchange_rates(g, par_photo, par_photo_n, par_gs,
-                                            meteo, irradiance_type2, leaf_lbl_prefix, rbt)
+                setup.gas_exchange_rates(g, setup.par_photo, setup.par_photo_n, setup.par_gs, meteo,
+                                         setup.irradiance_type2, setup.leaf_lbl_prefix, setup.rbt,
+                                         vertices=active_leaves, gb=setup.leaves_gb, photo_capacities=photo_capacities)
+                if setup.active_set:
+                    psi_exchange.update({vid: psi_prev[vid] for vid in
+                                         (leaves if active_leaves is None else active_leaves)})
+                n_active_trace.append(len(leaves) if active_leaves is None else len(active_leaves))
 
                 # Compute sap flow and hydraulic properties
-                hydraulic.hydraulic_prop(g, mass_conv=mass_conv, length_conv=length_conv,
-                                         a=xylem_k_max['a'], b=xylem_k_max['b'], min_kmax=xylem_k_max['min_kmax'])
+                setup.hydraulic_prop(g)
 
                 # Update soil water status
-                psi_collar = hydraulic.soil_water_potential(psi_soil, g.node(vid_collar).Flux * time_conv,
-                                                            soil_class, rhyzo_total_volume, psi_min)
-
-                if soil_water_deficit:
-                    psi_collar = max(-1.3, psi_collar)
-                else:
-                    psi_collar = max(-0.7, psi_collar)
-
-                    for vid in g.Ancestors(vid_collar):
-                        g.node(vid).psi_head = psi_collar
+                psi_collar = setup.collar_water_potential(g, psi_soil)
 
                 # Compute xylem water potential
-                n_iter_psi = hydraulic.xylem_water_potential(g, psi_soil=psi_collar, model=modelx, psi_min=psi_min,
-                                                             psi_error_crit=psi_error_threshold, max_iter=max_iter,
-                                                             length_conv=length_conv, fifty_cent=psi_critx,
-                                                             sig_slope=slopex, dist_roots=dist_roots,
-                                                             rad_roots=rad_roots,
-                                                             negligible_shoot_resistance=negligible_shoot_resistance,
-                                                             start_vid=vid_collar, stop_vid=None, psi_step=psi_step)
+                n_iter_psi = setup.xylem_water_potential(g, psi_collar, deadline)
+                stats.n_iter_xylem += n_iter_psi
+                if setup.incremental_hydraulic:
+                    n_touched_trace.append(hydraulics.n_touched_flux + hydraulics.n_touched_psi)
 
                 psi_new = g.property('psi_head')
 
@@ -124,17 +395,28 @@ def solve_interactions(g, meteo, psi_soil, t_soil, t_sky_eff, vid_collar, vid_ba
 
                 psi_error = max(psi_error_dict.values())
                 psi_error_trace.append(psi_error)
+                n_iter_psi_total += 1
 
-                print 'psi_error = ', round(psi_error,
-                                            3), ':: Nb_iter = %d' % n_iter_psi, 'ipsi_step = %f' % ipsi_step
+                stats.log(2, 'psi_error = ', round(psi_error, 3), ':: Nb_iter = %d' % n_iter_psi,
+                          'ipsi_step = %f' % ipsi_step)
 
                 # Manage temperature step to ensure convergence
                 if psi_error < psi_error_threshold:
+                    if active_leaves is None:
+                        psi_converged = True
+                        break
+                    verify = True
+                elif deadline_passed(deadline):
+                    budget_hit = True
                     break
+                elif psi_accelerator is not None:
+                    g.properties()['psi_head'] = acceleration.accelerate(psi_accelerator, psi_prev, psi_new,
+                                                                         lower=setup.psi_min)
                 else:
                     try:
                         if psi_error_trace[-1] >= psi_error_trace[-2] - psi_error_threshold:
                             ipsi_step = max(0.05, ipsi_step / 2.)
+                            stats.psi_step_halvings += 1
                     except IndexError:
                         pass
 
@@ -147,29 +429,23 @@ def solve_interactions(g, meteo, psi_soil, t_soil, t_sky_eff, vid_collar, vid_ba
 
         else:
             # Compute gas-exchange fluxes. Leaf T and Psi are from prev calc loop
-            exchange.gas_exchange_rates(g, par_photo, par_photo_n, par_gs,
-                                        meteo, irradiance_type2, leaf_lbl_prefix, rbt)
+            setup.gas_exchange_rates(g, setup.par_photo, setup.par_photo_n, setup.par_gs, meteo,
+                                     setup.irradiance_type2, setup.leaf_lbl_prefix, setup.rbt, gb=setup.leaves_gb,
+                                     photo_capacities=photo_capacities)
 
             # Compute sap flow and hydraulic properties
-            hydraulic.hydraulic_prop(g, mass_conv=mass_conv, length_conv=length_conv,
-                                     a=xylem_k_max['a'], b=xylem_k_max['b'], min_kmax=xylem_k_max['min_kmax'])
+            setup.hydraulic_prop(g)
 
         # End Hydraulic loop +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
 
+        if budget_hit or (not energy_budget and deadline_passed(deadline)):
+            budget_hit = True
+            break
+
         # Compute leaf temperature
         if energy_budget:
-            leaves_length = energy.get_leaves_length(g, leaf_lbl_prefix=leaf_lbl_prefix, unit_scene_length=unit_scene_length)
-            leaf_wind_speed = energy.leaf_wind_as_air_wind(g, meteo, leaf_lbl_prefix)
-            gbH = energy.heat_boundary_layer_conductance(leaves_length, leaf_wind_speed)
-            t_init = g.property('Tlc')
-            ev = g.property('E')
-            ei = g.property('Ei')
-            g.properties()['Tlc'], t_iter = energy.leaf_temperature(g, meteo, t_soil, t_sky_eff, t_init=t_init,
-                                                                    form_factors=form_factors, gbh=gbH, ev=ev, ei=ei,
-                                                                    solo=solo, ff_type=simplified_form_factors,
-                                                                    leaf_lbl_prefix=leaf_lbl_prefix, max_iter=max_iter,
-                                                                    t_error_crit=temp_error_threshold, t_step=temp_step)
-
+            g.properties()['Tlc'], t_iter = setup.leaf_temperature(g, meteo, t_soil, t_sky_eff, g.property('Tlc'),
+                                                                   form_factors, simplified_form_factors)
 
             # t_iter_list.append(t_iter)
             t_new = deepcopy(g.property('Tlc'))
@@ -178,18 +454,25 @@ def solve_interactions(g, meteo, psi_soil, t_soil, t_sky_eff, vid_collar, vid_ba
             error_dict = {vtx: abs(t_prev[vtx] - t_new[vtx]) for vtx in g.property('Tlc').keys()}
 
             t_error = round(max(error_dict.values()), 3)
-            print 't_error = ', t_error, 'counter =', it, 't_iter = ', t_iter, 'it_step = ', it_step
+            stats.log(2, 't_error = ', t_error, 'counter =', it, 't_iter = ', t_iter, 'it_step = ', it_step)
             t_error_trace.append(t_error)
 
             # Manage temperature step to ensure convergence
             if t_error < temp_error_threshold:
+                converged = True
                 break
+            elif deadline_passed(deadline):
+                budget_hit = True
+                break
+            elif t_accelerator is not None:
+                g.properties()['Tlc'] = acceleration.accelerate(t_accelerator, t_prev, t_new)
             else:
                 assert (it <= max_iter), 'The energy budget solution did not converge.'
 
                 try:
                     if t_error_trace[-1] >= t_error_trace[-2] - temp_error_threshold:
                         it_step = max(0.001, it_step / 2.)
+                        stats.t_step_halvings += 1
                 except IndexError:
                     pass
 
@@ -201,3 +484,349 @@ def solve_interactions(g, meteo, psi_soil, t_soil, t_sky_eff, vid_collar, vid_ba
                 g.properties()['Tlc'] = t_new_dict
 
     # End temperature loop +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    if setup.coarsen_hydraulic:
+        hydraulics.reconstruct_water_potential(g)
+
+    stats.n_iter_t, stats.n_iter_psi = it + 1, n_iter_psi_total
+    stats.t_error = t_error_trace
+    stats.psi_error = psi_error_traces
+    stats.n_active_leaves = n_active_traces
+    stats.n_touched_nodes = n_touched_traces
+    stats.converged = converged if energy_budget else psi_converged
+    stats.budget_hit = budget_hit
+
+    return it + 1, n_iter_psi_total
+
+
+def solve_interactions_night(g, meteo, psi_soil, t_soil, t_sky_eff, vid_collar, vid_base, length_conv, time_conv,
+                             rhyzo_total_volume, params, form_factors, simplified_form_factors,
+                             psi_init=None, t_init=None, stats=None, deadline=None, photo_capacities=None,
+                             hydraulics=None):
+    """Computes gas-exchange, energy and hydraulic structure of plant's shoot in the absence of irradiance.
+
+    Args:
+        g: MTG object
+        meteo (DataFrame): forcing meteorological variables
+        psi_soil (float): [MPa] soil (root zone) water potential
+        t_soil (float): [degreeC] soil surface temperature
+        t_sky_eff (float): [degreeC] effective sky temperature
+        vid_collar (int): id of the collar node of the mtg
+        vid_base (int): id of the basal node of the mtg
+        length_conv (float): [-] conversion factor from the `unit_scene_length` to 1 m
+        time_conv (float): [-] conversion factor from meteo data time step to seconds
+        rhyzo_total_volume (float): [m3] volume of the soil occupied with roots
+        params (params): [-] :class:`hydroshoot.params.Params()` object
+        psi_init (dict): [MPa] xylem water potential values used to initialize the shoot nodes (warm start)
+        t_init (dict): [degreeC] temperature values used to initialize the leaves (warm start)
+        stats (SolverStats): if given, the statistics of the solution are collected in this
+            :class:`hydroshoot.stats.SolverStats` object, whose verbosity also controls the console output
+        deadline (float): [s] if given, wall-clock time (as returned by `time.time()`) after which the iterations stop
+            and the current state is kept, even if not converged
+        photo_capacities (dict): if given, photosynthetic capacities at 25 degreeC of the leaves (see
+            :func:`hydroshoot.exchange.leaf_photo_capacities`), which are then not recomputed at each iteration
+        hydraulics: if given, the solver of the hydraulic structure of the plant returned by :func:`hydraulic_solver`,
+            which is then reset instead of being built again
+
+    Returns:
+        (int): number of iterations of the temperature loop
+        (int): number of iterations of the hydraulic loop
+
+    Notes:
+        In darkness, stomatal conductance equals its residual value whatever the leaf water potential (see
+            :func:`hydroshoot.exchange.dark_gas_exchange_rates`), so that transpiration only depends on leaf
+            temperature. The energy budget is therefore solved first, without the nested hydraulic loop of
+            :func:`solve_interactions`, and the hydraulic structure is then solved once for the resulting fluxes.
+
+    """
+    setup = _prepare_step(g, meteo, psi_soil, vid_collar, vid_base, length_conv, time_conv, rhyzo_total_volume,
+                          params, psi_init, t_init, stats, hydraulics)
+    stats, hydraulics = setup.stats, setup.hydraulics
+    temp_step, temp_error_threshold = setup.t_step, setup.t_error_crit
+
+    def _dark_gas_exchange_rates():
+        exchange.dark_gas_exchange_rates(g, setup.par_photo, setup.par_photo_n, setup.par_gs, meteo,
+                                         setup.leaf_lbl_prefix, setup.rbt, photo_capacities, setup.leaves_gb)
+
+    # Temperature loop +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+    t_error_trace = []
+    it_step = temp_step
+    converged = budget_hit = False
+    t_accelerator = acceleration.accelerator(setup.acceleration, temp_step, setup.anderson_depth)
+
+    for it in range(setup.max_iter):
+        _dark_gas_exchange_rates()
+
+        if not setup.energy_budget:
+            converged = True
+            break
+
+        t_prev = deepcopy(g.property('Tlc'))
+
+        t_new, t_iter = setup.leaf_temperature(g, meteo, t_soil, t_sky_eff, t_prev, form_factors,
+                                               simplified_form_factors)
+
+        # Evaluation of leaf temperature conversion creterion
+        t_error = round(max([abs(t_prev[vtx] - t_new[vtx]) for vtx in t_new]), 3)
+        stats.log(2, 't_error = ', t_error, 'counter =', it, 't_iter = ', t_iter, 'it_step = ', it_step)
+        t_error_trace.append(t_error)
+
+        if t_error < temp_error_threshold:
+            converged = True
+            g.properties()['Tlc'] = t_new
+            _dark_gas_exchange_rates()
+            break
+        elif deadline_passed(deadline):
+            budget_hit = True
+            break
+        elif t_accelerator is not None:
+            g.properties()['Tlc'] = acceleration.accelerate(t_accelerator, t_prev, t_new)
+        else:
+            try:
+                if t_error_trace[-1] >= t_error_trace[-2] - temp_error_threshold:
+                    it_step = max(0.001, it_step / 2.)
+                    stats.t_step_halvings += 1
+            except IndexError:
+                pass
+
+            g.properties()['Tlc'] = {vtx_id: t_prev[vtx_id] + it_step * (t_new[vtx_id] - t_prev[vtx_id])
+                                     for vtx_id in t_new}
+
+    # End temperature loop +++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++++
+
+    # Compute sap flow and hydraulic properties
+    setup.hydraulic_prop(g)
+
+    n_iter_psi = 0
+    if setup.hydraulic_structure:
+        # Update soil water status
+        psi_collar = setup.collar_water_potential(g, psi_soil)
+
+        # Compute xylem water potential once
+        n_iter_psi = setup.xylem_water_potential(g, psi_collar, deadline)
+        stats.n_iter_xylem += n_iter_psi
+
+        # Update leaf respiration to the final leaf water potential (water fluxes are unaffected)
+        _dark_gas_exchange_rates()
+        setup.hydraulic_prop(g)
+
+    if setup.coarsen_hydraulic:
+        hydraulics.reconstruct_water_potential(g)
+
+    stats.n_iter_t, stats.n_iter_psi = it + 1, n_iter_psi
+    stats.t_error = t_error_trace
+    stats.converged = converged
+    stats.budget_hit = budget_hit
+
+    return it + 1, n_iter_psi
+
+
+def solve_interactions_newton(g, meteo, psi_soil, t_soil, t_sky_eff, vid_collar, vid_base, length_conv, time_conv,
+                              rhyzo_total_volume, params, form_factors, simplified_form_factors,
+                              psi_init=None, t_init=None, stats=None, deadline=None, photo_capacities=None,
+                              hydraulics=None):
+    """Computes gas-exchange, energy and hydraulic structure of plant's shoot jointly, by solving them as a single
+    nonlinear system with a Newton-Krylov method.
+
+    Args:
+        g: MTG object
+        meteo (DataFrame): forcing meteorological variables
+        psi_soil (float): [MPa] soil (root zone) water potential
+        t_soil (float): [degreeC] soil surface temperature
+        t_sky_eff (float): [degreeC] effective sky temperature
+        vid_collar (int): id of the collar node of the mtg
+        vid_base (int): id of the basal node of the mtg
+        length_conv (float): [-] conversion factor from the `unit_scene_length` to 1 m
+        time_conv (float): [-] conversion factor from meteo data time step to seconds
+        rhyzo_total_volume (float): [m3] volume of the soil occupied with roots
+        params (params): [-] :class:`hydroshoot.params.Params()` object
+        psi_init (dict): [MPa] xylem water potential values used to initialize the shoot nodes (warm start)
+        t_init (dict): [degreeC] temperature values used to initialize the leaves (warm start)
+        stats (SolverStats): if given, the statistics of the solution are collected in this
+            :class:`hydroshoot.stats.SolverStats` object, whose verbosity also controls the console output
+        deadline (float): [s] if given, wall-clock time (as returned by `time.time()`) after which the Newton
+            iterations stop and the current iterate is kept, even if not converged
+        photo_capacities (dict): if given, photosynthetic capacities at 25 degreeC of the leaves (see
+            :func:`hydroshoot.exchange.leaf_photo_capacities`), which are then not recomputed at each iteration
+        hydraulics: if given, the solver of the hydraulic structure of the plant returned by :func:`hydraulic_solver`,
+            which is then reset instead of being built again
+
+    Returns:
+        (int): number of Newton iterations
+        (int): number of evaluations of the residual function
+
+    Notes:
+        The unknowns are the temperature of the leaves and the xylem water potential of the shoot nodes (from the
+            collar upwards). For given unknowns, the residual function computes gas-exchange rates, sap flow, collar
+            water potential and a single sweep of :func:`hydroshoot.hydraulic.transient_xylem_water_potential`, then
+            returns:
+            - the difference between the given and the swept water potential of each node, scaled by
+                `psi_error_threshold`,
+            - the energy balance of each leaf (see :func:`hydroshoot.energy.leaf_energy_balance`) divided by its
+                linearised heat loss conductance, scaled by `t_error_crit`.
+        The residual of a node only depends on its own and its parent's water potential, and on the leaf fluxes
+            through it, so that the Jacobian is as sparse as the tree. It is never assembled: Jacobian-vector products
+            are evaluated by finite differences of the residual function (Jacobian-free Newton-Krylov). The Krylov
+            iterations are preconditioned by the tree Jacobian of the water potential residual (solved by forward
+            substitution from the collar upwards) and the derivative of the energy balance of each leaf with respect
+            to its temperature, the coupling of temperature and water potential through the fluxes being left to the
+            Krylov iterations.
+        The converged fields are those of :func:`solve_interactions` with :arg:`solo` energy budget (the residual
+            being the energy balance of :func:`hydroshoot.energy.leaf_energy_balance`). When the energy budget is
+            computed with `solo` set to False, the coupled system is that of :func:`solve_interactions`, which is then
+            called instead.
+
+    """
+    if params.simulation.energy_budget and not params.energy.solo:
+        stats = stats if stats is not None else SolverStats()
+        stats.log(1, "The energy budget is not solo: the interactions are solved by fixed-point iterations.")
+        return solve_interactions(g, meteo, psi_soil, t_soil, t_sky_eff, vid_collar, vid_base, length_conv, time_conv,
+                                  rhyzo_total_volume, params, form_factors, simplified_form_factors,
+                                  psi_init=psi_init, t_init=t_init, stats=stats, deadline=deadline,
+                                  photo_capacities=photo_capacities, hydraulics=hydraulics)
+
+    setup = _prepare_step(g, meteo, psi_soil, vid_collar, vid_base, length_conv, time_conv, rhyzo_total_volume,
+                          params, psi_init, t_init, stats, hydraulics)
+    stats, hydraulics, gbh = setup.stats, setup.hydraulics, setup.gbh
+    hydraulic_structure, energy_budget = setup.hydraulic_structure, setup.energy_budget
+
+    leaves = setup.leaves if energy_budget else []
+    nodes = list(traversal.pre_order2(g, vid_collar)) if hydraulic_structure else []
+    if setup.coarsen_hydraulic:
+        nodes = [vid for vid in nodes if vid in hydraulics.index]
+
+    # linearised heat loss conductance of the leaves [W m-2 K-1]
+    t_air = utils.celsius_to_kelvin(meteo.Tac[0])
+    heat_loss = np.array([gbh[vid] + 8. * energy.e_leaf * energy.sigma * t_air ** 3 for vid in leaves])
+
+    n_leaves = len(leaves)
+    n_eval = [0]
+    boundary = {}
+
+    # The finite difference perturbations of the Jacobian-vector products are far below the tolerance of the
+    # incremental network, whose memoised results are hence bypassed
+    sweep_kwargs = {'use_memo': False} if setup.incremental_hydraulic else {}
+
+    def _set_state(x):
+        g.properties()['Tlc'].update(dict(zip(leaves, x[:n_leaves].tolist())))
+        g.properties()['psi_head'].update(dict(zip(nodes, x[n_leaves:].tolist())))
+
+    def _residual(x):
+        n_eval[0] += 1
+        _set_state(x)
+
+        # Compute gas-exchange fluxes
+        setup.gas_exchange_rates(g, setup.par_photo, setup.par_photo_n, setup.par_gs, meteo, setup.irradiance_type2,
+                                 setup.leaf_lbl_prefix, setup.rbt, gb=setup.leaves_gb,
+                                 photo_capacities=photo_capacities)
+
+        # Compute sap flow and hydraulic properties
+        setup.hydraulic_prop(g)
+
+        res_psi = []
+        if hydraulic_structure:
+            # Update soil water status
+            psi_collar = setup.collar_water_potential(g, psi_soil)
+            boundary['psi_collar'] = psi_collar
+
+            # Single sweep of xylem water potential
+            hydraulics.transient_xylem_water_potential(g, setup.cavitation_model, length_conv, psi_collar,
+                                                       setup.psi_min, setup.fifty_cent, setup.sig_slope,
+                                                       setup.dist_roots, setup.rad_roots,
+                                                       setup.negligible_shoot_resistance, start_vid=vid_collar,
+                                                       stop_vid=None, **sweep_kwargs)
+            psi_new = g.property('psi_head')
+            res_psi = (x[n_leaves:] - np.array([psi_new[vid] for vid in nodes])) / setup.psi_error_threshold
+
+        res_t = []
+        if energy_budget:
+            balance = energy.leaf_energy_balance(g, meteo, t_soil, t_sky_eff, g.property('Tlc'), form_factors,
+                                                 gbh, g.property('E'), g.property('Ei'),
+                                                 ff_type=simplified_form_factors, leaf_lbl_prefix=setup.leaf_lbl_prefix)
+            res_t = np.array([balance[vid] for vid in leaves]) / heat_loss / setup.t_error_crit
+
+        return np.concatenate((res_t, res_psi))
+
+    residual_trace = []
+
+    class _BudgetExhausted(Exception):
+        pass
+
+    def _callback(x, f):
+        residual_trace.append(float(np.max(np.abs(f))))
+        stats.log(2, 'residual = ', round(residual_trace[-1], 3), ':: Nb_eval = %d' % n_eval[0])
+        if deadline_passed(deadline):
+            raise _BudgetExhausted(x.copy())
+
+    t_leaves = g.property('Tlc')
+    psi_head = g.property('psi_head')
+    x0 = np.array([t_leaves[vid] for vid in leaves] + [psi_head[vid] for vid in nodes])
+
+    network = hydraulic_structure and isinstance(hydraulics, hydraulic.HydraulicNetwork)
+    if network:
+        first = hydraulics.index[vid_collar]
+        positions = np.array([hydraulics.index[vid] for vid in nodes], dtype=int) - first
+    gbh_leaves = np.array([gbh[vid] for vid in leaves])
+
+    class _Preconditioner(LinearOperator):
+        """Approximate inverse of the Jacobian of the residual, updated at each Newton iteration: the energy balance of
+        each leaf is derived with respect to its own temperature only, and the water potential residual with respect
+        to water potential only, by the tree Jacobian of the hydraulic network (see
+        :meth:`hydroshoot.hydraulic.HydraulicNetwork.sweep_jacobian_inverse`, the identity being used without
+        network)."""
+
+        def __init__(self):
+            super(_Preconditioner, self).__init__(float, (len(x0), len(x0)))
+            self.t_scale = np.ones(n_leaves)
+            self.psi_solve = None
+
+        def setup(self, x, f, func):
+            self.update(x, f)
+
+        def update(self, x, f):
+            temp = utils.celsius_to_kelvin(x[:n_leaves])
+            self.t_scale = -setup.t_error_crit * heat_loss / (8. * energy.e_leaf * energy.sigma * temp ** 3 +
+                                                              gbh_leaves)
+            if network:
+                _set_state(x)
+                self.psi_solve = hydraulics.sweep_jacobian_inverse(
+                    g, setup.cavitation_model, boundary['psi_collar'], setup.psi_min, setup.fifty_cent,
+                    setup.sig_slope, setup.dist_roots, setup.rad_roots, setup.negligible_shoot_resistance,
+                    start_vid=vid_collar)
+
+        def _matvec(self, v):
+            v = np.ravel(v)
+            step = np.concatenate((self.t_scale * v[:n_leaves], setup.psi_error_threshold * v[n_leaves:]))
+            if self.psi_solve is not None:
+                values = np.zeros(hydraulics.size[first])
+                values[positions] = step[n_leaves:]
+                step[n_leaves:] = self.psi_solve(values)[positions]
+            return step
+
+    converged = budget_hit = False
+    stats.newton_krylov_calls += 1
+    try:
+        x = optimize.newton_krylov(_residual, x0, f_tol=1., maxiter=setup.max_iter, rdiff=1.e-6,
+                                   line_search='armijo', callback=_callback, inner_M=_Preconditioner())
+        converged = True
+    except NoConvergence as e:
+        stats.log(1, "The Newton-Krylov solution did not converge.")
+        x = e.args[0]
+    except _BudgetExhausted as e:
+        stats.log(1, "The time budget of the Newton-Krylov solution is exhausted.")
+        budget_hit = True
+        x = e.args[0]
+
+    # Leave the mtg in the state computed at the solution
+    _residual(x)
+    _set_state(x)
+
+    if setup.coarsen_hydraulic:
+        hydraulics.reconstruct_water_potential(g)
+
+    stats.n_iter_t, stats.n_iter_psi = len(residual_trace), n_eval[0]
+    stats.residual = residual_trace
+    stats.converged = converged
+    stats.budget_hit = budget_hit
+
+    return len(residual_trace), n_eval[0]
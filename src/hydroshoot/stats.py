@@ -0,0 +1,89 @@
+# -*- coding: utf-8 -*-
+"""Solver statistics of HydroShoot.
+
+This module collects the numerical statistics of the computation of a time step (iteration counts, error traces,
+relaxation step halvings, calls to the costly external solvers) and controls the console output of the solver through a
+verbosity level.
+"""
+
+summary_keys = ('converged', 'budget_hit', 'n_iter_t', 'n_iter_psi', 'n_iter_xylem', 't_step_halvings',
+                'psi_step_halvings', 'newton_krylov_calls', 'caribu_calls', 'caribu_time', 'caribu_scene_time',
+                'caribu_run_time')
+
+
+def log(verbosity, level, *args):
+    """Prints the given arguments to the console if :arg:`verbosity` is at least :arg:`level`.
+
+    Args:
+        verbosity (int): current verbosity level, 0 silences all console output
+        level (int): verbosity level from which the message is printed, 1 for time step summaries and warnings, 2
+            for the details of each iteration
+        *args: objects to be printed, separated by spaces
+
+    """
+    if verbosity >= level:
+        print ' '.join([str(arg) for arg in args])
+
+
+class SolverStats(object):
+    """Numerical statistics of the computation of one time step.
+
+    Args:
+        verbosity (int): level of console output, 0 silences all output, 1 prints time step summaries and warnings, 2
+            (default) also prints the errors of each iteration of the solver loops
+
+    Attributes:
+        n_iter_t (int): number of iterations of the temperature loop (of Newton iterations with the Newton solver)
+        n_iter_psi (int): total number of iterations of the hydraulic loops (of residual evaluations with the Newton
+            solver)
+        n_iter_xylem (int): total number of iterations of the xylem water potential computations (relaxed sweeps, or
+            Newton iterations with the Newton hydraulic solver)
+        t_error (list): [°C] error trace of the temperature loop
+        psi_error (list of list): [MPa] error traces of the hydraulic loops, one per iteration of the temperature loop
+        residual (list): [-] trace of the scaled residual norm of the Newton solver
+        n_active_leaves (list of list): number of leaves whose gas-exchange rates are computed at each iteration of the
+            hydraulic loops
+        n_touched_nodes (list of list): number of hydraulic segments whose flux or water potential are recomputed at
+            each iteration of the hydraulic loops, with the incremental hydraulic network (see
+            :class:`hydroshoot.hydraulic.HydraulicNetwork`)
+        t_step_halvings (int): number of halvings of the relaxation step of the temperature loop
+        psi_step_halvings (int): number of halvings of the relaxation step of the hydraulic loops
+        newton_krylov_calls (int): number of calls to :func:`scipy.optimize.newton_krylov`
+        caribu_calls (int): number of Caribu runs
+        caribu_time (float): [s] wall-clock time spent computing irradiance interception with Caribu (building the
+            scene and running it)
+        caribu_scene_time (float): [s] part of :attr:`caribu_time` spent building Caribu scenes in the current process
+        caribu_run_time (float): [s] part of :attr:`caribu_time` spent running Caribu scenes in the current process
+        converged (bool): True if the solver converged
+        budget_hit (bool): True if the solver was stopped by its time budget
+
+    """
+
+    def __init__(self, verbosity=2):
+        self.verbosity = verbosity
+
+        self.n_iter_t = 0
+        self.n_iter_psi = 0
+        self.n_iter_xylem = 0
+        self.t_error = []
+        self.psi_error = []
+        self.residual = []
+        self.n_active_leaves = []
+        self.n_touched_nodes = []
+        self.t_step_halvings = 0
+        self.psi_step_halvings = 0
+        self.newton_krylov_calls = 0
+        self.caribu_calls = 0
+        self.caribu_time = 0.
+        self.caribu_scene_time = 0.
+        self.caribu_run_time = 0.
+        self.converged = False
+        self.budget_hit = False
+
+    def log(self, level, *args):
+        """Prints the given arguments to the console according to the verbosity level, see :func:`log`."""
+        log(self.verbosity, level, *args)
+
+    def summary(self):
+        """Returns a dictionary of the scalar statistics (see :data:`summary_keys`)."""
+        return {key: getattr(self, key) for key in summary_keys}
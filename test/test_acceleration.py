@@ -0,0 +1,40 @@
+import numpy as np
+from pytest import raises
+
+from hydroshoot import acceleration
+
+
+def _solve(acc, g, x, tol=1.e-8, max_iter=200):
+    for it in range(max_iter):
+        gx = g(x)
+        if np.max(np.abs(gx - x)) < tol:
+            break
+        x = x + 0.5 * (gx - x) if acc is None else acc.update(x, gx)
+    return x, it
+
+
+def test_accelerators_converge_faster_than_relaxation():
+    a = np.array([[0.9, 0.05, 0.], [0.02, 0.8, 0.1], [0., 0.1, 0.7]])
+    b = np.array([1., -2., 0.5])
+    x_star = np.linalg.solve(np.eye(3) - a, b)
+
+    def g(x):
+        return a.dot(x) + b
+
+    _, n_relaxation = _solve(None, g, np.zeros(3))
+    for method in ('anderson', 'aitken'):
+        acc = acceleration.accelerator(method, mixing=0.5, depth=3)
+        x, n_iter = _solve(acc, g, np.zeros(3))
+        assert n_iter < n_relaxation
+        np.testing.assert_allclose(x, x_star, atol=1.e-6)
+        assert acc.residuals[0] == max(abs(b))
+
+    assert acceleration.accelerator('relaxation') is None
+    with raises(ValueError):
+        acceleration.accelerator('newton')
+
+
+def test_accelerate():
+    acc = acceleration.accelerator('aitken', mixing=0.5)
+    x_next = acceleration.accelerate(acc, {1: -0.5, 2: -1.}, {1: -0.7, 2: -3.}, lower=-2., upper=0.)
+    assert x_next == {1: -0.6, 2: -2.}
@@ -1,5 +1,7 @@
 from non_regression_data import potted_syrah, meteo
 from hydroshoot.energy import form_factors_simplified, leaf_temperature, forced_soil_temperature
+import numpy as np
+from scipy import sparse
 from numpy.testing import assert_almost_equal
 import openalea.plantgl.all as pgl
 import hydroshoot.energy as energy
@@ -79,4 +81,143 @@ def test_leaf_temperature():
     for vid in tleaf:
         assert tleaf[vid] != met.Tac[0]
         if vid != first:
-            assert tleaf[vid] != tleaf[first]
\ No newline at end of file
+            assert tleaf[vid] != tleaf[first]
+
+def test_leaf_energy_balance():
+    g = potted_syrah()
+    met = meteo().iloc[[12], :]
+    tsoil = 20
+    tsky = 2
+
+    leaves = energy.get_leaves(g)
+    l = energy.get_leaves_length(g)
+    u = energy.leaf_wind_as_air_wind(g, met)
+    gbH = energy.heat_boundary_layer_conductance(l, u)
+    form_factors = [{vid: 0.5 for vid in leaves}] * 3
+    ev = {vid: 0.002 for vid in leaves}
+    ei = {vid: 1000. for vid in leaves}
+
+    tleaf, it = leaf_temperature(g, met, tsoil, tsky, form_factors=form_factors, gbh=gbH, ev=ev, ei=ei,
+                                 t_error_crit=1.e-6)
+    balance = energy.leaf_energy_balance(g, met, tsoil, tsky, tleaf, form_factors, gbH, ev, ei)
+    assert len(balance) == 46
+    for vid in balance:
+        assert abs(balance[vid]) < 1.e-3
+
+    warm = energy.leaf_energy_balance(g, met, tsoil, tsky, {vid: tleaf[vid] + 1. for vid in leaves}, form_factors,
+                                      gbH, ev, ei)
+    for vid in warm:
+        assert warm[vid] < balance[vid]
+
+
+def test_leaf_temperature_active_set():
+    g = potted_syrah()
+    met = meteo().iloc[[12], :]
+    tsoil = 20
+    tsky = 2
+
+    leaves = energy.get_leaves(g)
+    l = energy.get_leaves_length(g)
+    u = energy.leaf_wind_as_air_wind(g, met)
+    gbH = energy.heat_boundary_layer_conductance(l, u)
+    ei = {vid: 200. + 1500. * (i % 7 == 0) for i, vid in enumerate(leaves)}
+
+    tleaf, it = leaf_temperature(g, met, tsoil, tsky, gbh=gbH, ei=ei, t_error_crit=0.001)
+    tleaf_active, it_active = leaf_temperature(g, met, tsoil, tsky, gbh=gbH, ei=ei, t_error_crit=0.001,
+                                               active_set=True)
+    assert len(tleaf_active) == 46
+    for vid in tleaf:
+        assert_almost_equal(tleaf_active[vid], tleaf[vid], decimal=2)
+
+
+def test_leaf_temperature_vectorized():
+    g = potted_syrah()
+    met = meteo().iloc[[12], :]
+    tsoil = 20
+    tsky = 2
+
+    leaves = energy.get_leaves(g)
+    l = energy.get_leaves_length(g)
+    u = energy.leaf_wind_as_air_wind(g, met)
+    gbH = energy.heat_boundary_layer_conductance(l, u)
+    ei = {vid: 200. + 1500. * (i % 7 == 0) for i, vid in enumerate(leaves)}
+
+    tleaf, it = leaf_temperature(g, met, tsoil, tsky, gbh=gbH, ei=ei)
+    tleaf_vectorized, it_vectorized = leaf_temperature(g, met, tsoil, tsky, gbh=gbH, ei=ei, vectorized=True)
+    assert len(tleaf_vectorized) == 46
+    for vid in tleaf:
+        assert_almost_equal(tleaf_vectorized[vid], tleaf[vid], decimal=4)
+
+
+def test_solo_leaf_temperature_newton():
+    temp_leaf = np.array([290., 300., 310.])
+    args = (np.array([0., 200., 1000.]), np.full(3, 0.3), np.full(3, 0.4), np.array([5., 20., 40.]),
+            np.array([0., 1.e-3, 4.e-3]), np.array([100., 120., 140.]), 280., 298., 295.)
+    temp_leaf, it = energy.solo_leaf_temperature_newton(temp_leaf, *args)
+    assert it < 10
+
+    shortwave_inc, ff_sky, ff_soil, gbh, ev, longwave, temp_sky, temp_air, temp_soil = args
+    balance = (energy.a_glob * shortwave_inc +
+               energy.e_leaf * (ff_sky * energy.e_sky * energy.sigma * temp_sky ** 4 + energy.e_leaf * longwave +
+                                ff_soil * energy.e_soil * energy.sigma * temp_soil ** 4) -
+               2 * energy.e_leaf * energy.sigma * temp_leaf ** 4 - energy.lambda_ * ev - gbh * (temp_leaf - temp_air))
+    assert_almost_equal(balance, np.zeros(3), decimal=5)
+
+
+def test_coupled_leaf_temperature_newton():
+    k_leaves = sparse.csr_matrix(np.array([[0., 0.2, 0.], [0.1, 0., 0.1], [0., 0.3, 0.]]))
+    shortwave_inc, ff_sky, ff_soil = np.array([0., 200., 1000.]), np.full(3, 0.3), np.full(3, 0.4)
+    gbh, ev, temp_sky, temp_air = np.array([0.2, 0.5, 1.]), np.array([0., 1.e-3, 4.e-3]), 280., 298.
+
+    temp_leaf, it, converged = energy.coupled_leaf_temperature_newton(np.full(3, 298.), shortwave_inc, ff_sky, ff_soil,
+                                                                      gbh, ev, k_leaves, temp_sky, temp_air)
+    assert it < 10
+    assert converged
+
+    sigma, e_leaf = energy.sigma, energy.e_leaf
+    balance = (energy.a_glob * shortwave_inc +
+               e_leaf * sigma * (ff_sky * energy.e_sky * temp_sky ** 4 - e_leaf * k_leaves.dot(temp_leaf ** 4) +
+                                 ff_soil * energy.e_soil * temp_sky ** 4 - 2 * temp_leaf ** 4) -
+               energy.lambda_ * ev - gbh * energy.Cp * (temp_leaf - temp_air))
+    assert_almost_equal(balance, np.zeros(3), decimal=5)
+
+    # the iteration limit and the temperature tolerance of the caller
+    _, it_max, converged = energy.coupled_leaf_temperature_newton(np.full(3, 250.), shortwave_inc, ff_sky, ff_soil,
+                                                                  gbh, ev, k_leaves, temp_sky, temp_air, max_iter=1)
+    assert it_max == 1
+    assert not converged
+    temp_tol, it_tol, converged = energy.coupled_leaf_temperature_newton(np.full(3, 298.), shortwave_inc, ff_sky,
+                                                                         ff_soil, gbh, ev, k_leaves, temp_sky,
+                                                                         temp_air, t_tol=0.01)
+    assert converged
+    assert it_tol <= it
+    assert_almost_equal(temp_tol, temp_leaf, decimal=3)
+
+    # below the roundoff errors no step decreases the energy balance: the iterations stop without convergence
+    temp_stall, it_stall, converged = energy.coupled_leaf_temperature_newton(np.full(3, 298.), shortwave_inc, ff_sky,
+                                                                             ff_soil, gbh, ev, k_leaves, temp_sky,
+                                                                             temp_air, f_tol=0.)
+    assert not converged
+    assert it_stall < 50
+    assert_almost_equal(temp_stall, temp_leaf, decimal=5)
+
+
+def test_leaf_temperature_linearized():
+    g = potted_syrah()
+    met = meteo().iloc[[12], :]
+    tsoil = 20
+    tsky = 2
+
+    leaves = energy.get_leaves(g)
+    l = energy.get_leaves_length(g)
+    u = energy.leaf_wind_as_air_wind(g, met)
+    gbH = energy.heat_boundary_layer_conductance(l, u)
+    ei = {vid: 200. + 1500. * (i % 7 == 0) for i, vid in enumerate(leaves)}
+
+    tleaf, it = leaf_temperature(g, met, tsoil, tsky, gbh=gbH, ei=ei, linearized=True)
+    assert it == 1
+    assert len(tleaf) == 46
+
+    deviation = energy.linearization_deviation(g, met, tsoil, tsky, gbh=gbH, ei=ei)
+    assert sorted(deviation) == sorted(tleaf)
+    assert max(abs(dt) for dt in deviation.values()) < 3.
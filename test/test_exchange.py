@@ -0,0 +1,110 @@
+from copy import deepcopy
+import numpy as np
+from numpy.testing import assert_almost_equal
+
+from non_regression_data import potted_syrah, meteo, json_parameters
+from hydroshoot import exchange, energy, utilities as utils
+
+
+def _leaves_ready_syrah(psi=-0.5):
+    g = potted_syrah()
+    for vid in energy.get_leaves(g):
+        n = g.node(vid)
+        n.Na = 2.
+        n.psi_head = psi
+        n.Tlc = 20.
+        n.Ei = 0.
+    return g
+
+
+def test_dark_gas_exchange_rates():
+    pars = json_parameters()['exchange']
+    par_photo = pars['par_photo']
+    par_photo['Rd'] = par_photo['cRd'] * par_photo['Vcm25']
+    met = meteo().iloc[[1], :]
+
+    g_full, g_dark, g_dark_gb = _leaves_ready_syrah(), _leaves_ready_syrah(), _leaves_ready_syrah()
+    exchange.gas_exchange_rates(g_full, par_photo, pars['par_photo_N'], pars['par_gs'], met, 'Ei', 'L', pars['rbt'])
+    exchange.dark_gas_exchange_rates(g_dark, par_photo, pars['par_photo_N'], pars['par_gs'], met, 'L', pars['rbt'])
+    exchange.dark_gas_exchange_rates(g_dark_gb, par_photo, pars['par_photo_N'], pars['par_gs'], met, 'L', pars['rbt'],
+                                     gb=exchange.leaves_boundary_layer_conductance(g_dark_gb, met, 'L'))
+
+    g0, c_a = pars['par_gs']['g0'], met.Ca[0]
+    for vid in energy.get_leaves(g_full):
+        for prop in ('An', 'gs', 'E'):
+            assert_almost_equal(g_dark.node(vid).properties()[prop], g_full.node(vid).properties()[prop], 4)
+        for prop in ('An', 'gs', 'E', 'Ci'):
+            assert g_dark_gb.node(vid).properties()[prop] == g_dark.node(vid).properties()[prop]
+        node = g_dark.node(vid)
+        assert node.An < 0
+        # respiration-driven CO2 efflux through the boundary layer and the stomatal conductance to CO2
+        c_i = utils.cmol2cpa(node.Tlc, c_a) - node.An * (pars['rbt'] + 1.6 / g0)
+        assert_almost_equal(node.Ci, utils.cpa2cmol(node.Tlc, c_i), 6)
+
+
+def test_an_gs_ci_array():
+    pars = json_parameters()['exchange']
+    par_photo, par_photo_n = pars['par_photo'], pars['par_photo_N']
+
+    leaf_n = np.array([1., 2., 3.])
+    psi = np.array([-0.1, -0.9, -1.8])
+    t_leaf = np.array([18., 30., 38.])
+    ppfd = np.array([0., 500., 2000.])
+
+    leaves_par_photo = exchange.leaf_photo_params_array(par_photo, par_photo_n, leaf_n, psi, t_leaf)
+    a_n, c_c, c_i, gs = exchange.an_gs_ci_array(leaves_par_photo, ppfd, 28., 50., psi, t_leaf)
+
+    for i in range(len(leaf_n)):
+        leaf_par_photo = exchange.leaf_photo_params(par_photo, par_photo_n, leaf_n[i], psi[i], t_leaf[i])
+        assert_almost_equal(leaves_par_photo['dHd'][i], leaf_par_photo['dHd'])
+        expected = exchange.an_gs_ci(leaf_par_photo, {'Tac': 28., 'PPFD': ppfd[i], 'hs': 50.}, psi[i], t_leaf[i])
+        assert_almost_equal((a_n[i], c_c[i], c_i[i], gs[i]), expected)
+
+
+def test_gas_exchange_rates_array():
+    pars = json_parameters()['exchange']
+    par_photo = pars['par_photo']
+    par_photo['Rd'] = par_photo['cRd'] * par_photo['Vcm25']
+    met = meteo().iloc[[1], :]
+
+    g_leaf, g_array = _leaves_ready_syrah(-0.8), _leaves_ready_syrah(-0.8)
+    for g in (g_leaf, g_array):
+        for vid in energy.get_leaves(g):
+            g.node(vid).Ei = 10. * vid
+    exchange.gas_exchange_rates(g_leaf, par_photo, pars['par_photo_N'], pars['par_gs'], met, 'Ei', 'L', pars['rbt'])
+    exchange.gas_exchange_rates_array(g_array, par_photo, pars['par_photo_N'], pars['par_gs'], met, 'Ei', 'L',
+                                      pars['rbt'])
+
+    for vid in energy.get_leaves(g_leaf):
+        for prop in ('An', 'gs', 'gb', 'E', 'Ci'):
+            assert_almost_equal(g_array.node(vid).properties()[prop], g_leaf.node(vid).properties()[prop], 6)
+
+
+def test_leaf_photo_capacities():
+    pars = json_parameters()['exchange']
+    par_photo = pars['par_photo']
+    par_photo['Rd'] = par_photo['cRd'] * par_photo['Vcm25']
+    met = meteo().iloc[[1], :]
+
+    g_leaf = _leaves_ready_syrah(-0.8)
+    for vid in energy.get_leaves(g_leaf):
+        g_leaf.node(vid).Na = 1. + 0.01 * vid
+        g_leaf.node(vid).Ei = 10. * vid
+    photo_capacities = exchange.leaf_photo_capacities(g_leaf, pars['par_photo_N'])
+    assert sorted(photo_capacities['index']) == sorted(energy.get_leaves(g_leaf))
+
+    for gas_exchange_rates in (exchange.gas_exchange_rates, exchange.gas_exchange_rates_array):
+        g_cached = deepcopy(g_leaf)
+        gas_exchange_rates(g_leaf, par_photo, pars['par_photo_N'], pars['par_gs'], met, 'Ei', 'L', pars['rbt'])
+        gas_exchange_rates(g_cached, par_photo, pars['par_photo_N'], pars['par_gs'], met, 'Ei', 'L', pars['rbt'],
+                           photo_capacities=photo_capacities)
+        for vid in energy.get_leaves(g_leaf):
+            for prop in ('An', 'gs', 'E', 'Ci'):
+                assert_almost_equal(g_cached.node(vid).properties()[prop], g_leaf.node(vid).properties()[prop], 12)
+
+    g_cached = deepcopy(g_leaf)
+    exchange.dark_gas_exchange_rates(g_leaf, par_photo, pars['par_photo_N'], pars['par_gs'], met, 'L', pars['rbt'])
+    exchange.dark_gas_exchange_rates(g_cached, par_photo, pars['par_photo_N'], pars['par_gs'], met, 'L', pars['rbt'],
+                                     photo_capacities)
+    for vid in energy.get_leaves(g_leaf):
+        assert_almost_equal(g_cached.node(vid).An, g_leaf.node(vid).An, 12)
@@ -0,0 +1,254 @@
+from copy import deepcopy
+import numpy as np
+from numpy.testing import assert_almost_equal
+
+from non_regression_data import potted_syrah
+from hydroshoot import architecture, hydraulic, acceleration
+
+
+def _hydraulic_syrah():
+    g = potted_syrah()
+    g.node(g.root).vid_collar = architecture.mtg_base(g, vtx_label='inT')
+    g.node(g.root).vid_base = architecture.add_soil_components(g, 3, [5., 10., 20.], [0.5, 0.5, 0.4],
+                                                               'Sandy_Loam', 'inT')
+    hydraulic.static_hydraulic_properties(g, length_conv=1.e-2)
+    for vid in g.property('Kmax'):
+        g.node(vid).psi_head = -0.2
+    for i, vid in enumerate(sorted(g.property('leaf_area'))):
+        g.node(vid).psi_head = -0.2
+        g.node(vid).E = 0.001 + 1.e-5 * i
+        g.node(vid).An = 5. + 0.1 * i
+    return g
+
+
+def test_soil_water_potential():
+    for soil_class in ('Sand', 'Loam', 'Clay'):
+        theta_r, theta_s, alpha, n, k_sat = hydraulic.soil_classes[soil_class]
+        m = 1. - 1. / n
+
+        def _water_content(psi):
+            psi_cm = psi * 1.e6 / (hydraulic.rho * hydraulic.g_p) * 100.
+            return theta_r + (theta_s - theta_r) / (1. + abs(alpha * psi_cm) ** n) ** m
+
+        for psi_init, withdrawal in ((-0.005, 0.), (-0.01, 0.01), (-0.02, 0.02)):
+            psi = hydraulic.soil_water_potential(psi_init, withdrawal, soil_class, 0.1)
+            # the water content at the computed soil water potential accounts for the withdrawn water volume
+            assert_almost_equal(_water_content(psi_init) - _water_content(psi), withdrawal * 1.e-3 / (0.1 * theta_s), 9)
+
+    assert hydraulic.soil_water_potential(-0.5, 1.e6, 'Loam', 0.1, psi_min=-2.) == -2.
+
+
+def test_cavitation_factor_array():
+    psi = [-0.2, -0.8, -1.5]
+    for model in ('misson', 'tuzet', 'linear'):
+        assert_almost_equal(hydraulic.cavitation_factor(np.array(psi), model, -0.51, 3.),
+                            [hydraulic.cavitation_factor(x, model, -0.51, 3.) for x in psi])
+
+
+def test_cavitation_factor_derivative():
+    psi = np.array([0., -0.2, -0.8, -1.5])
+    for model in ('misson', 'tuzet', 'linear'):
+        derivative = (hydraulic.cavitation_factor(psi + 1.e-7, model, -0.51, 3.) -
+                      hydraulic.cavitation_factor(psi - 1.e-7, model, -0.51, 3.)) / 2.e-7
+        assert_almost_equal(hydraulic.cavitation_factor_derivative(psi, model, -0.51, 3.), derivative, 6)
+
+
+def test_hydraulic_network():
+    g_mtg = _hydraulic_syrah()
+    g_array = deepcopy(g_mtg)
+    vid_collar = g_mtg.node(g_mtg.root).vid_collar
+    network = hydraulic.HydraulicNetwork(g_array, length_conv=1.e-2)
+
+    hydraulic.hydraulic_prop(g_mtg, length_conv=1.e-2, compute_kmax=False)
+    network.hydraulic_prop(g_array, compute_kmax=False)
+    for prop in ('Flux', 'FluxC'):
+        for vid, value in g_mtg.property(prop).iteritems():
+            assert_almost_equal(g_array.property(prop)[vid], value, 12)
+
+    for method in ('relaxation', 'anderson'):
+        kwargs = dict(psi_soil=-0.3, model='tuzet', psi_min=-3., psi_error_crit=1.e-4, length_conv=1.e-2,
+                      fifty_cent=-0.51, sig_slope=3., start_vid=vid_collar)
+        n_mtg = hydraulic.xylem_water_potential(g_mtg, accelerator=acceleration.accelerator(method), **kwargs)
+        n_array = network.xylem_water_potential(g_array, accelerator=acceleration.accelerator(method), **kwargs)
+        assert n_array == n_mtg
+        for vid, value in g_mtg.property('psi_head').iteritems():
+            assert_almost_equal(g_array.property('psi_head')[vid], value, 9)
+        for vid, value in g_mtg.property('KL').iteritems():
+            if value is None:
+                assert g_array.property('KL')[vid] is None
+            else:
+                assert_almost_equal(g_array.property('KL')[vid], value, 9)
+
+    # a single sweep from the base of the mtg, through the rhyzosphere
+    hydraulic.transient_xylem_water_potential(g_mtg, 'tuzet', 1.e-2, -0.3, -3., -0.51, 3.)
+    network.transient_xylem_water_potential(g_array, 'tuzet', 1.e-2, -0.3, -3., -0.51, 3.)
+    for vid, value in g_mtg.property('psi_head').iteritems():
+        assert_almost_equal(g_array.property('psi_head')[vid], value, 9)
+
+
+def test_newton_xylem_water_potential():
+    g_fixed_point = _hydraulic_syrah()
+    for vid in g_fixed_point.property('leaf_area'):
+        g_fixed_point.node(vid).E *= 10.
+    g_newton = deepcopy(g_fixed_point)
+    vid_collar = g_fixed_point.node(g_fixed_point.root).vid_collar
+
+    kwargs = dict(psi_soil=-0.8, model='tuzet', psi_min=-3., psi_error_crit=1.e-6, max_iter=500, length_conv=1.e-2,
+                  fifty_cent=-0.51, sig_slope=3., start_vid=vid_collar)
+    network = hydraulic.HydraulicNetwork(g_fixed_point, length_conv=1.e-2)
+    network.hydraulic_prop(g_fixed_point, compute_kmax=False)
+    n_fixed_point = network.xylem_water_potential(g_fixed_point, **kwargs)
+
+    network = hydraulic.HydraulicNetwork(g_newton, length_conv=1.e-2, newton=True)
+    network.hydraulic_prop(g_newton, compute_kmax=False)
+    n_newton = network.xylem_water_potential(g_newton, **kwargs)
+
+    assert n_newton < n_fixed_point
+    for vid, value in g_fixed_point.property('psi_head').iteritems():
+        assert_almost_equal(g_newton.property('psi_head')[vid], value, 5)
+
+
+def test_newton_xylem_water_potential_uphill():
+    g = _hydraulic_syrah()
+    vid_collar = g.node(g.root).vid_collar
+    network = hydraulic.HydraulicNetwork(g, length_conv=1.e-2, newton=True)
+    network.hydraulic_prop(g, compute_kmax=False)
+    psi_head = dict(g.property('psi_head'))
+
+    # every trial step increases the residual
+    newton_system = network._newton_system
+    n_calls = [0]
+
+    def _uphill_system(*args):
+        residual, jac_diag, jac_parent, k_act = newton_system(*args)
+        n_calls[0] += 1
+        return (residual if n_calls[0] == 1 else np.abs(residual) + 1.), jac_diag, jac_parent, k_act
+
+    network._newton_system = _uphill_system
+    n_iter = network.xylem_water_potential(g, psi_soil=-0.8, model='tuzet', psi_min=-3., psi_error_crit=1.e-6,
+                                           max_iter=500, length_conv=1.e-2, fifty_cent=-0.51, sig_slope=3.,
+                                           start_vid=vid_collar)
+    assert n_iter == 1
+    first, last = network._range(vid_collar)
+    for vid in network.vids[first:last]:
+        assert g.property('psi_head')[vid] == psi_head[vid]
+
+
+def test_sweep_jacobian_inverse():
+    g = _hydraulic_syrah()
+    for vid in g.property('leaf_area'):
+        g.node(vid).E *= 10.
+    vid_collar = g.node(g.root).vid_collar
+    network = hydraulic.HydraulicNetwork(g, length_conv=1.e-2, newton=True)
+    network.hydraulic_prop(g, compute_kmax=False)
+    first, last = network._range(vid_collar)
+    vids = network.vids[first:last]
+    kwargs = dict(model='tuzet', psi_soil=-0.8, psi_min=-3., fifty_cent=-0.51, sig_slope=3., start_vid=vid_collar)
+    network.xylem_water_potential(g, psi_error_crit=1.e-9, max_iter=500, **kwargs)
+
+    def _sweep_residual(psi):
+        g.properties()['psi_head'].update(zip(vids, psi.tolist()))
+        network.transient_xylem_water_potential(g, **kwargs)
+        return psi - np.array([g.property('psi_head')[vid] for vid in vids])
+
+    # the Jacobian is exact at the solution of the hydraulic structure
+    psi = np.array([g.property('psi_head')[vid] for vid in vids])
+    direction = np.random.RandomState(0).uniform(-1., 1., len(vids))
+    jacobian_direction = (_sweep_residual(psi + 1.e-7 * direction) - _sweep_residual(psi)) / 1.e-7
+
+    g.properties()['psi_head'].update(zip(vids, psi.tolist()))
+    inverse = network.sweep_jacobian_inverse(g, **kwargs)
+    assert_almost_equal(inverse(jacobian_direction), direction, 4)
+
+
+def test_coarsened_hydraulic_network():
+    g_fine = _hydraulic_syrah()
+    vid_collar = g_fine.node(g_fine.root).vid_collar
+
+    for negligible_shoot_resistance, decimal in ((True, 9), (False, 2)):
+        g_coarse = deepcopy(g_fine)
+        kwargs = dict(psi_soil=-0.5, model='tuzet', psi_min=-3., psi_error_crit=1.e-8, max_iter=500, length_conv=1.e-2,
+                      fifty_cent=-0.51, sig_slope=3., start_vid=vid_collar,
+                      negligible_shoot_resistance=negligible_shoot_resistance)
+        fine = hydraulic.HydraulicNetwork(g_fine, length_conv=1.e-2, newton=True)
+        fine.hydraulic_prop(g_fine, compute_kmax=False)
+        fine.xylem_water_potential(g_fine, **kwargs)
+
+        coarse = hydraulic.HydraulicNetwork(g_coarse, length_conv=1.e-2, newton=True, coarsen=True)
+        assert len(coarse.vids) + len(coarse.lumped_vids) == len(fine.vids)
+        assert len(coarse.lumped_vids) > 0
+        coarse.hydraulic_prop(g_coarse, compute_kmax=False)
+        coarse.xylem_water_potential(g_coarse, **kwargs)
+        coarse.reconstruct_water_potential(g_coarse)
+
+        for vid in fine.vids:
+            assert_almost_equal(g_coarse.property('Flux')[vid], g_fine.property('Flux')[vid], 12)
+            assert_almost_equal(g_coarse.property('psi_head')[vid], g_fine.property('psi_head')[vid], decimal)
+
+
+def test_incremental_hydraulic_network():
+    g_full = _hydraulic_syrah()
+    g_incremental = deepcopy(g_full)
+    vid_collar = g_full.node(g_full.root).vid_collar
+    kwargs = dict(psi_soil=-0.5, model='tuzet', psi_min=-3., psi_error_crit=1.e-4, length_conv=1.e-2,
+                  fifty_cent=-0.51, sig_slope=3., start_vid=vid_collar)
+
+    full = hydraulic.HydraulicNetwork(g_full, length_conv=1.e-2)
+    incremental = hydraulic.HydraulicNetwork(g_incremental, length_conv=1.e-2, incremental=True, psi_tol=0.)
+    for g, network in ((g_full, full), (g_incremental, incremental)):
+        network.hydraulic_prop(g, compute_kmax=False)
+        network.xylem_water_potential(g, **kwargs)
+        for vid in sorted(g.property('leaf_area'))[:2]:
+            g.node(vid).E *= 2.
+        network.hydraulic_prop(g, compute_kmax=False)
+        network.xylem_water_potential(g, **kwargs)
+
+    assert full.n_touched_flux == len(full.vids)
+    assert incremental.n_touched_flux < len(incremental.vids)
+    for vid in full.vids:
+        assert_almost_equal(g_incremental.property('Flux')[vid], g_full.property('Flux')[vid], 12)
+        assert_almost_equal(g_incremental.property('psi_head')[vid], g_full.property('psi_head')[vid], 9)
+
+    # perturbations below the tolerance of the incremental network are propagated when the memo is bypassed
+    incremental.psi_tol = 1.e-4
+    psi_head = dict(g_incremental.property('psi_head'))
+    incremental.transient_xylem_water_potential(g_incremental, 'tuzet', 1.e-2, -0.5, -3., -0.51, 3.,
+                                                start_vid=vid_collar)
+    g_sweep = deepcopy(g_incremental)
+    sweep = hydraulic.HydraulicNetwork(g_sweep, length_conv=1.e-2)
+    sweep.hydraulic_prop(g_sweep, compute_kmax=False)
+    for g in (g_incremental, g_sweep):
+        for vid in full.vids:
+            g.node(vid).psi_head = psi_head[vid] + 1.e-7
+    sweep_args = ('tuzet', 1.e-2, -0.5 + 1.e-7, -3., -0.51, 3.)
+    incremental.transient_xylem_water_potential(g_incremental, *sweep_args, start_vid=vid_collar, use_memo=False)
+    sweep.transient_xylem_water_potential(g_sweep, *sweep_args, start_vid=vid_collar)
+    for vid in full.vids:
+        assert g_incremental.property('psi_head')[vid] == g_sweep.property('psi_head')[vid]
+
+
+def test_reset_hydraulic_network():
+    g = _hydraulic_syrah()
+    vid_collar = g.node(g.root).vid_collar
+    kwargs = dict(psi_soil=-0.5, model='tuzet', psi_min=-3., psi_error_crit=1.e-4, length_conv=1.e-2,
+                  fifty_cent=-0.51, sig_slope=3., start_vid=vid_collar)
+
+    g_reused = deepcopy(g)
+    reused = hydraulic.HydraulicNetwork(g_reused, length_conv=1.e-2, incremental=True)
+    reused.hydraulic_prop(g_reused, compute_kmax=False)
+    reused.xylem_water_potential(g_reused, **kwargs)
+
+    # next time step, on a fresh state
+    for vid in sorted(g.property('leaf_area'))[:2]:
+        g.node(vid).E *= 2.
+    g_reused, g_fresh = deepcopy(g), deepcopy(g)
+    fresh = hydraulic.HydraulicNetwork(g_fresh, length_conv=1.e-2, incremental=True)
+    reused.reset()
+    for g, network in ((g_reused, reused), (g_fresh, fresh)):
+        network.hydraulic_prop(g, compute_kmax=False)
+        network.xylem_water_potential(g, **kwargs)
+
+    assert reused.n_touched_flux == fresh.n_touched_flux == len(fresh.vids)
+    for vid in fresh.vids:
+        assert g_reused.property('Flux')[vid] == g_fresh.property('Flux')[vid]
+        assert g_reused.property('psi_head')[vid] == g_fresh.property('psi_head')[vid]
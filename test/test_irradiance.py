@@ -1,6 +1,9 @@
 from non_regression_data import potted_syrah, meteo
-from hydroshoot.irradiance import irradiance_distribution, hsCaribu, optical_prop, e_conv_PPFD
-from numpy.testing import assert_almost_equal
+from hydroshoot.irradiance import irradiance_distribution, hsCaribu, optical_prop, e_conv_PPFD, is_night, \
+    diffuse_irradiance, diffuse_interception, interception_basis, basis_interception, interception_basis_error, \
+    irradiance_pool, irradiance_time_series
+from hydroshoot.stats import SolverStats
+from numpy.testing import assert_almost_equal, assert_allclose
 
 
 def test_irradiance_distribution():
@@ -113,4 +116,122 @@ def test_hsCaribu():
     assert len(g.property('geometry')) == ng
     # non regression test
     ei_sum = sum(g.property('Ei').values())
-    assert_almost_equal(ei_sum, 14.83, 2)
\ No newline at end of file
+    assert_almost_equal(ei_sum, 14.83, 2)
+
+def test_hsCaribu_persistent_scene():
+    g = optical_prop(potted_syrah())
+    stats = SolverStats(0)
+    g, cs = hsCaribu(g, 'cm', source=[(100., (0., 0., -1.))], stats=stats)
+    assert stats.caribu_scene_time > 0.
+    assert stats.caribu_time >= stats.caribu_scene_time + stats.caribu_run_time
+
+    # only the light sources of the scene are updated
+    sources = [(300., (0., -0.5, -0.75 ** 0.5)), (50., (0.3, 0.2, -0.5 ** 0.5))]
+    stats = SolverStats(0)
+    g, cs_reused = hsCaribu(g, 'cm', source=sources, caribu_scene=cs, stats=stats)
+    assert cs_reused is cs
+    assert stats.caribu_scene_time == 0.
+    assert stats.caribu_run_time > 0.
+    ei = dict(g.property('Ei'))
+    g, cs = hsCaribu(g, 'cm', source=sources)
+    for vid in ei:
+        assert_almost_equal(ei[vid], g.property('Ei')[vid], 6)
+
+    g, cs_reused = hsCaribu(g, 'cm', source=[(0, (0, -1, 0))], caribu_scene=cs)
+    assert len(g.property('Ei')) == len(cs.scene)
+    assert sum(g.property('Ei').values()) == 0
+
+
+def test_hsCaribu_split_sources():
+    g = optical_prop(potted_syrah())
+    sources = [(300., (0., -0.5, -0.75 ** 0.5)), (50., (0.3, 0.2, -0.5 ** 0.5)), (100., (0., 0., -1.))]
+    g, cs = hsCaribu(g, 'cm', source=sources)
+    ei, eabs = dict(g.property('Ei')), dict(g.property('Eabs'))
+
+    pool = irradiance_pool(g, processes=2)
+    for source_chunks in (2, 3, 5):
+        g, cs = hsCaribu(g, 'cm', source=sources, pool=pool, source_chunks=source_chunks)
+        for vid in ei:
+            assert_almost_equal(g.property('Ei')[vid], ei[vid], 6)
+            assert_almost_equal(g.property('Eabs')[vid], eabs[vid], 6)
+    pool.close()
+    pool.join()
+
+
+def test_diffuse_interception():
+    location = (43.61, 3.87, 44.0)
+    e_type = 'Rg_Watt/m2'
+    g = optical_prop(potted_syrah())
+    unit_interception = diffuse_interception(g, 'cm')
+    assert 'Ei' not in g.property_names()
+
+    # a sunny hour, a cloudy hour and a whole day
+    for met in (meteo().iloc[[60], :], meteo().iloc[[12], :], meteo().iloc[48:72, :]):
+        sources, rdrs = irradiance_distribution(met, location, e_type)
+        g, cs = hsCaribu(g, 'cm', source=sources)
+        ei, eabs = dict(g.property('Ei')), dict(g.property('Eabs'))
+
+        sun_sources, sun_rdrs = irradiance_distribution(met, location, e_type, diffuse_sky=False)
+        assert sun_rdrs == rdrs
+        assert len(sun_sources) < len(sources)
+        diffuse = diffuse_irradiance(met, e_type, rdrs)
+        assert_almost_equal(sum(zip(*sun_sources)[0]) + diffuse, sum(zip(*sources)[0]), 6)
+
+        g, cs = hsCaribu(g, 'cm', source=sun_sources, diffuse=(diffuse, unit_interception))
+        for vid in ei:
+            assert_allclose(g.property('Ei')[vid], ei[vid], rtol=1.e-4, atol=1.e-6)
+            assert_allclose(g.property('Eabs')[vid], eabs[vid], rtol=1.e-4, atol=1.e-6)
+
+
+def test_interception_basis():
+    g = optical_prop(potted_syrah())
+    basis = interception_basis(g, 'cm', elevation_step=30., azimuth_step=90.)
+    assert 'Ei' not in g.property_names()
+    assert basis['Ei'].shape == (3, 4, len(g.property('geometry')))
+
+    # the basis is exact for sources located on its grid
+    sources = [(300., (0., 0., -1.)), (100., (0., -0.5, -0.75 ** 0.5))]
+    g, cs = hsCaribu(g, 'cm', source=sources)
+    ei = dict(g.property('Ei'))
+    g = basis_interception(g, basis, sources)
+    for vid in ei:
+        assert_allclose(g.property('Ei')[vid], ei[vid], rtol=1.e-4, atol=1.e-6)
+    assert_almost_equal(interception_basis_error(g, 'cm', basis, sources)['total'], 0., 4)
+
+    # sources between the directions of the grid are interpolated
+    error = interception_basis_error(g, 'cm', basis, [(300., (0.3, 0.2, -0.5 ** 0.5))])
+    assert error['max'] >= error['rmse'] >= 0.
+
+
+def test_irradiance_time_series():
+    location = (43.61, 3.87, 44.0)
+    e_type = 'Rg_Watt/m2'
+    g = optical_prop(potted_syrah())
+    met = meteo().iloc[6:18, :]
+
+    series = irradiance_time_series(g, met, location, e_type, 'cm')
+    assert 'Ei' not in g.property_names()
+    assert series['Ei'].shape == (len(series['vid']), len(met))
+
+    # the same time series computed by a pool of worker processes, each one reusing its Caribu scene
+    pool = irradiance_pool(g, processes=2)
+    pool_series = irradiance_time_series(g, met, location, e_type, 'cm', persistent_scene=True, pool=pool)
+    pool.close()
+    pool.join()
+    assert pool_series['vid'] == series['vid']
+    assert_allclose(pool_series['Ei'], series['Ei'], rtol=1.e-6, atol=1.e-6)
+    assert_allclose(pool_series['Eabs'], series['Eabs'], rtol=1.e-6, atol=1.e-6)
+
+    for i in (0, 6):
+        sources, rdrs = irradiance_distribution(met.iloc[[i], :], location, e_type)
+        assert series['diffuse_ratio'][i] == rdrs
+        g, cs = hsCaribu(g, 'cm', source=sources)
+        for j, vid in enumerate(series['vid']):
+            assert_almost_equal(series['Ei'][j, i], g.property('Ei')[vid], 6)
+
+
+def test_is_night():
+    met = meteo()
+    assert is_night(met.iloc[[1], :], 'Rg_Watt/m2')
+    assert not is_night(met.iloc[[12], :], 'Rg_Watt/m2')
+    assert not is_night(met.iloc[:24, :], 'Rg_Watt/m2')
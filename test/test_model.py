@@ -1,6 +1,8 @@
 """ A global test of hydroshoot model on potted grapevine, to secure refactoring"""
 from os.path import join
-from numpy.testing import assert_array_almost_equal
+from json import dump
+from shutil import copy
+from numpy.testing import assert_allclose, assert_array_almost_equal
 
 import non_regression_data
 from hydroshoot import model
@@ -13,3 +15,60 @@ def test_potted_grapevine():
     ref = non_regression_data.reference_time_series_output()
     # do not compare date index
     assert_array_almost_equal(ref.iloc[0, 1:], results.reset_index(drop=True).iloc[0, :], decimal=0)
+
+
+def test_simulation_iterate():
+    g = non_regression_data.potted_syrah()
+    sim = model.Simulation(g, join(non_regression_data.sources_dir, ''), psi_soil=-0.5, gdd_since_budbreak=1000.)
+    outputs = list(sim.iterate())
+    assert len(outputs) == len(sim.meteo)
+    ref = non_regression_data.reference_time_series_output()
+    for col in ('An', 'E', 'Rg', 'Tleaf'):
+        assert_array_almost_equal(ref[col].iloc[0], outputs[0][col], decimal=0)
+    assert outputs[0]['psi_soil'] == -0.5
+
+
+def test_simulation_warm_start():
+    meteo = non_regression_data.meteo().loc['2012-08-01 11:00':'2012-08-01 12:00']
+    meteo_rows = [meteo.iloc[[i]] for i in range(len(meteo))]
+    n_iter = {}
+    for warm_start in ('none', 'previous'):
+        g = non_regression_data.potted_syrah()
+        sim = model.Simulation(g, join(non_regression_data.sources_dir, ''), psi_soil=-0.5, gdd_since_budbreak=1000.)
+        sim.params.numerical_resolution.warm_start = warm_start
+        outputs = [sim.step(meteo_row) for meteo_row in meteo_rows]
+        assert all(output['converged'] for output in outputs)
+        n_iter[warm_start] = [output['n_iter_t'] + output['n_iter_psi'] for output in outputs]
+    # the first time step starts from the same state, the second one from the solution of the first one
+    assert n_iter['previous'][0] == n_iter['none'][0]
+    assert n_iter['previous'][1] <= n_iter['none'][1]
+
+
+def _irradiance_option_outputs(wd, **irradiance_params):
+    """Returns the outputs of a two-hour simulation of the potted syrah run from the working directory :arg:`wd` with
+    the given irradiance parameters."""
+    params = non_regression_data.json_parameters()
+    params['simulation']['edate'] = '2012-08-01 12:00:00'
+    params['irradiance'].update(irradiance_params)
+    with open(join(wd, 'params.json'), 'w') as f:
+        dump(params, f)
+    copy(join(non_regression_data.sources_dir, 'meteo.input'), wd)
+
+    g = non_regression_data.potted_syrah()
+    sim = model.Simulation(g, join(wd, ''), psi_soil=-0.5, gdd_since_budbreak=1000.)
+    outputs = list(sim.iterate())
+    assert sim.irradiance_pool is None
+    return outputs
+
+
+def test_simulation_irradiance_options(tmpdir):
+    reference = _irradiance_option_outputs(str(tmpdir.mkdir('default')))
+    for options, rtol in (({'precompute_hourly': True, 'processes': 2}, 1.e-3),
+                          ({'split_sources': True, 'processes': 2}, 1.e-3),
+                          ({'persistent_scene': True}, 1.e-3),
+                          ({'precompute_diffuse': True}, 1.e-2),
+                          ({'interception_basis': True}, 0.1)):
+        outputs = _irradiance_option_outputs(str(tmpdir.mkdir('_'.join(sorted(options)))), **options)
+        assert len(outputs) == len(reference)
+        for col in ('Rg', 'An', 'E', 'Tleaf'):
+            assert_allclose([output[col] for output in outputs], [output[col] for output in reference], rtol=rtol)
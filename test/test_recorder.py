@@ -0,0 +1,31 @@
+from datetime import datetime
+from numpy import isnan
+from pandas import date_range
+
+from non_regression_data import potted_syrah
+from hydroshoot import energy
+from hydroshoot.recorder import Recorder
+
+
+def test_recorder():
+    g = potted_syrah()
+    leaves = energy.get_leaves(g)
+    vertices = sorted(g.property('geometry'))
+    index = date_range(datetime(2012, 8, 1, 11), datetime(2012, 8, 1, 13), freq='H')
+    recorder = Recorder(vertices, index, variables=('Tlc', 'gs'))
+    assert recorder.nbytes == len(vertices) * len(index) * 2 * 8
+
+    for i, date in enumerate(index):
+        g.properties()['Tlc'] = {vid: 20. + i for vid in leaves}
+        g.properties()['gs'] = {vid: 0.1 * i for vid in leaves}
+        recorder.record(g, date)
+
+    records = recorder.records()
+    tlc = records['Tlc']
+    assert tlc.shape == (len(index), len(vertices))
+    assert all(tlc.loc[index[-1], leaves] == 22.)
+    other = [vid for vid in vertices if vid not in leaves]
+    assert isnan(tlc.loc[index[0], other]).all()
+
+    assert records.vertex(leaves[0]).loc[index[1], 'gs'] == 0.1
+    assert records.at(index[2], 'Tlc') == {vid: 22. for vid in leaves}
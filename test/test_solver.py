@@ -0,0 +1,143 @@
+import time
+from os.path import join
+import numpy as np
+from numpy.testing import assert_allclose, assert_almost_equal
+
+import non_regression_data
+from hydroshoot import energy, exchange, model, solver
+from hydroshoot.stats import SolverStats
+
+
+def potted_syrah_simulation():
+    """Returns a :class:`hydroshoot.model.Simulation` of the potted syrah grapevine."""
+    return model.Simulation(non_regression_data.potted_syrah(), join(non_regression_data.sources_dir, ''),
+                            psi_soil=-0.5, gdd_since_budbreak=1000.)
+
+
+def test_warm_start_state():
+    assert solver.warm_start_state([]) is None
+
+    history = [{1: -0.5, 2: -0.1}, {1: -0.7, 2: -0.05, 3: -1.}]
+    assert solver.warm_start_state(history) == history[-1]
+    assert solver.warm_start_state(history) is not history[-1]
+
+    init = solver.warm_start_state(history, extrapolate=True, lower=-0.8, upper=0.)
+    assert init == {1: -0.8, 2: 0., 3: -1.}
+
+
+def test_deadline_passed():
+    assert not solver.deadline_passed(None)
+    assert solver.deadline_passed(time.time() - 1.)
+    assert not solver.deadline_passed(time.time() + 60.)
+
+
+def test_solve_interactions_newton(monkeypatch):
+    gas_exchange_rates = exchange.gas_exchange_rates
+    n_calls = []
+
+    def _counted_gas_exchange_rates(*args, **kwargs):
+        n_calls[-1] += 1
+        return gas_exchange_rates(*args, **kwargs)
+
+    monkeypatch.setattr(exchange, 'gas_exchange_rates', _counted_gas_exchange_rates)
+
+    states = []
+    for solver_name in ('fixed_point', 'newton'):
+        n_calls.append(0)
+        sim = potted_syrah_simulation()
+        sim.params.numerical_resolution.solver = solver_name
+        output = sim.step(sim.meteo.iloc[:1])
+        assert output['converged']
+        states.append((sim.g.property('Tlc'), sim.g.property('psi_head')))
+
+    (t_fixed_point, psi_fixed_point), (t_newton, psi_newton) = states
+    leaves = sorted(t_fixed_point)
+    assert_allclose([t_newton[vid] for vid in leaves], [t_fixed_point[vid] for vid in leaves], atol=0.02)
+    nodes = sorted(psi_fixed_point)
+    assert_allclose([psi_newton[vid] for vid in nodes], [psi_fixed_point[vid] for vid in nodes], atol=0.01)
+    assert n_calls[1] < n_calls[0]
+
+
+def test_solve_interactions_newton_not_solo(monkeypatch):
+    calls = []
+
+    def _recorded_solve_interactions(*args, **kwargs):
+        calls.append((args, kwargs))
+        return 1, 1
+
+    monkeypatch.setattr(solver, 'solve_interactions', _recorded_solve_interactions)
+
+    sim = potted_syrah_simulation()
+    g, params = sim.g, sim.params
+    params.energy.solo = False
+    meteo_row = sim.meteo.iloc[:1]
+    t_soil = energy.forced_soil_temperature(meteo_row)
+    args = (g, meteo_row, -0.5, t_soil, params.energy.t_sky, sim.vid_collar, sim.vid_base, sim.length_conv,
+            sim.time_conv, sim.rhyzo_total_volume, params, sim.form_factors, sim.simplified_form_factors)
+    stats = SolverStats(0)
+
+    # the coupled energy budget is not that of the Newton residual: the fixed-point solver is called instead
+    assert solver.solve_interactions_newton(*args, stats=stats) == (1, 1)
+    assert len(calls) == 1
+    assert len(calls[0][0]) == len(args) and all(arg is expected for arg, expected in zip(calls[0][0], args))
+    assert calls[0][1]['stats'] is stats
+    assert stats.newton_krylov_calls == 0
+
+
+def test_solve_interactions_night():
+    sim = potted_syrah_simulation()
+    sim.params.simulation.night_mode = True
+    meteo = non_regression_data.meteo()
+    meteo_row = meteo[meteo.Rg == 0.].iloc[:1]
+    output = sim.step(meteo_row)
+    assert output['night']
+    assert output['converged']
+    assert output['stats'].caribu_calls == 0
+
+    g, params = sim.g, sim.params
+    leaf_lbl_prefix = params.mtg_api.leaf_lbl_prefix
+    leaves = energy.get_leaves(g, leaf_lbl_prefix)
+    for vid in leaves:
+        node = g.node(vid)
+        assert node.Ei == 0.
+        assert node.gs == params.exchange.par_gs['g0']
+        leaf_par_photo = exchange.leaf_photo_params(params.exchange.par_photo, params.exchange.par_photo_N, node.Na,
+                                                    node.psi_head, node.Tlc)
+        assert_almost_equal(node.An, -exchange.arrhenius_2('Rdmax', node.Tlc, leaf_par_photo), 6)
+        # the transpiration flux draws the leaf water potential below that of the soil
+        assert node.psi_head < output['psi_soil']
+
+    # the leaf temperatures cancel the energy balance of the final fluxes
+    leaves_length = energy.get_leaves_length(g, leaf_lbl_prefix=leaf_lbl_prefix,
+                                             unit_scene_length=params.simulation.unit_scene_length)
+    gbh = energy.heat_boundary_layer_conductance(leaves_length, energy.leaf_wind_as_air_wind(g, meteo_row,
+                                                                                             leaf_lbl_prefix))
+    balance = energy.leaf_energy_balance(g, meteo_row, energy.forced_soil_temperature(meteo_row),
+                                         params.energy.t_cloud, g.property('Tlc'), sim.form_factors, gbh,
+                                         g.property('E'), g.property('Ei'), ff_type=sim.simplified_form_factors,
+                                         leaf_lbl_prefix=leaf_lbl_prefix)
+    assert max(abs(balance[vid]) for vid in leaves) < 1.
+
+
+def test_solve_interactions_expired_deadline():
+    sim = potted_syrah_simulation()
+    meteo_row = sim.meteo.iloc[:1]
+    sim.step(meteo_row)
+    g, params = sim.g, sim.params
+    t_soil = energy.forced_soil_temperature(meteo_row)
+
+    for solve_interactions in (solver.solve_interactions, solver.solve_interactions_newton):
+        stats = SolverStats(0)
+        solve_interactions(g, meteo_row, -0.5, t_soil, params.energy.t_sky, sim.vid_collar, sim.vid_base,
+                           sim.length_conv, sim.time_conv, sim.rhyzo_total_volume, params, sim.form_factors,
+                           sim.simplified_form_factors, stats=stats, deadline=time.time() - 1.,
+                           photo_capacities=sim.photo_capacities, hydraulics=sim.hydraulics)
+        assert stats.budget_hit
+        assert not stats.converged
+        assert stats.n_iter_t == 1
+
+        # the state of the last iteration is attached to the mtg
+        for vid in energy.get_leaves(g, params.mtg_api.leaf_lbl_prefix):
+            node = g.node(vid)
+            assert np.isfinite([node.Tlc, node.psi_head, node.An, node.E, node.gs, node.Flux]).all()
+        assert np.isfinite([g.node(vid).psi_head for vid in g.property('Kmax')]).all()
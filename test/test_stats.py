@@ -0,0 +1,24 @@
+from hydroshoot.stats import SolverStats, log, summary_keys
+
+
+def test_log(capsys):
+    log(1, 2, 'hidden')
+    log(2, 2, 'psi_error', 0.1)
+    assert capsys.readouterr()[0] == 'psi_error 0.1\n'
+
+    stats = SolverStats(verbosity=0)
+    stats.log(1, 'hidden')
+    assert capsys.readouterr()[0] == ''
+
+
+def test_solver_stats_summary():
+    stats = SolverStats()
+    stats.n_iter_t = 3
+    stats.t_error = [1., 0.1, 0.01]
+    stats.caribu_calls += 1
+
+    summary = stats.summary()
+    assert sorted(summary) == sorted(summary_keys)
+    assert summary['n_iter_t'] == 3
+    assert summary['caribu_calls'] == 1
+    assert not summary['converged']